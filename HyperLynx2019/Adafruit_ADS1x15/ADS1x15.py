@@ -102,9 +102,9 @@ class ADS1x15(object):
         """
         raise NotImplementedError('Subclass must implement _conversion_value function!')
 
-    def _read(self, mux, gain, data_rate, mode):
-        """Perform an ADC read with the provided mux, gain, data_rate, and mode
-        values.  Returns the signed integer result of the read.
+    def _write_config(self, mux, gain, data_rate, mode):
+        """Write the config register to start a conversion with the provided mux,
+        gain, data_rate, and mode values.  Returns the data rate used.
         """
         config = ADS1x15_CONFIG_OS_SINGLE  # Go out of power-down mode for conversion.
         # Specify mux value.
@@ -126,6 +126,13 @@ class ADS1x15(object):
         # Send the config value to start the ADC conversion.
         # Explicitly break the 16-bit value down to a big endian pair of bytes.
         self._device.writeList(ADS1x15_POINTER_CONFIG, [(config >> 8) & 0xFF, config & 0xFF])
+        return data_rate
+
+    def _read(self, mux, gain, data_rate, mode):
+        """Perform an ADC read with the provided mux, gain, data_rate, and mode
+        values.  Returns the signed integer result of the read.
+        """
+        data_rate = self._write_config(mux, gain, data_rate, mode)
         # Wait for the ADC sample to finish based on the sample rate plus a
         # small offset to be sure (0.1 millisecond).
         time.sleep(1.0/data_rate+0.0001)
@@ -215,6 +222,15 @@ class ADS1x15(object):
         # the highest bit (bit 3) set.
         return self._read(channel + 0x04, gain, data_rate, ADS1x15_CONFIG_MODE_CONTINUOUS)
 
+    def select_adc(self, channel, gain=1, data_rate=None):
+        """Switch continuous ADC conversions to the specified channel (0-3)
+        without waiting for a result.  The first conversion on the new channel
+        is ready 1/data_rate seconds later; read it with get_last_result().
+        Returns the data rate used.
+        """
+        assert 0 <= channel <= 3, 'Channel must be a value within 0-3!'
+        return self._write_config(channel + 0x04, gain, data_rate, ADS1x15_CONFIG_MODE_CONTINUOUS)
+
     def start_adc_difference(self, differential, gain=1, data_rate=None):
         """Start continuous ADC conversions between two ADC channels. Differential
         must be one of:
@@ -191,8 +191,7 @@ class BME280(object):
         while (self._device.readU8(BME280_REGISTER_STATUS) & 0x08):    # Wait for conversion to complete (TODO : add timeout)
             time.sleep(0.002)
         self.BME280Data = self._device.readList(BME280_REGISTER_DATA, 8)
-        raw = ((self.BME280Data[3] << 16) | (self.BME280Data[4] << 8) | self.BME280Data[5]) >> 4
-        return raw
+        return self.read_raw_temp_cached()
 
     def read_raw_pressure(self):
         """Returns the raw (uncompensated) pressure level from the sensor."""
@@ -208,10 +207,25 @@ class BME280(object):
         raw = (self.BME280Data[6] << 8) | self.BME280Data[7]
         return raw
 
+    def read_all(self):
+        """Does a single 8 byte burst read of the data registers and compensates it once."""
+        """The sensor runs in normal mode, so no conversion wait is needed."""
+        """Returns (temperature in C, pressure in Pascals, humidity in %)."""
+        self.BME280Data = self._device.readList(BME280_REGISTER_DATA, 8)
+        temp = self._compensate_temp(self.read_raw_temp_cached())
+        return temp, self.read_pressure(), self.read_humidity()
+
+    def read_raw_temp_cached(self):
+        """Returns the raw temperature from the last burst read in BME280Data[]."""
+        return ((self.BME280Data[3] << 16) | (self.BME280Data[4] << 8) | self.BME280Data[5]) >> 4
+
     def read_temperature(self):
         """Gets the compensated temperature in degrees celsius."""
+        return self._compensate_temp(self.read_raw_temp())
+
+    def _compensate_temp(self, raw):
         # float in Python is double precision
-        UT = float(self.read_raw_temp())
+        UT = float(raw)
         var1 = (UT / 16384.0 - float(self.dig_T1) / 1024.0) * float(self.dig_T2)
         var2 = ((UT / 131072.0 - float(self.dig_T1) / 8192.0) * (
         UT / 131072.0 - float(self.dig_T1) / 8192.0)) * float(self.dig_T3)
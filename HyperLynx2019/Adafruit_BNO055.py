@@ -23,6 +23,7 @@ import binascii
 import logging
 import struct
 import time
+from collections import namedtuple
 
 import serial
 
@@ -206,6 +207,15 @@ OPERATION_MODE_M4G                   = 0X0A
 OPERATION_MODE_NDOF_FMC_OFF          = 0X0B
 OPERATION_MODE_NDOF                  = 0X0C
 
+# Snapshot of the contiguous data block from ACCEL_DATA_X_LSB (0x08) to
+# CALIB_STAT (0x35): 22 little endian int16 vector values, temperature (int8)
+# and calibration status (uint8).
+BNO055_SNAPSHOT_LENGTH = BNO055_CALIB_STAT_ADDR + 1 - BNO055_ACCEL_DATA_X_LSB_ADDR
+BNO055_SNAPSHOT_STRUCT = struct.Struct('<22hbB')
+
+BNO055Snapshot = namedtuple('BNO055Snapshot', ['accel', 'mag', 'gyro', 'euler',
+    'quaternion', 'linear_accel', 'gravity', 'temp', 'calibration'])
+
 
 logger = logging.getLogger(__name__)
 
@@ -633,6 +643,33 @@ class BNO055(object):
                 result[i] -= 65536
         return result
 
+    def read_snapshot(self, start=BNO055_ACCEL_DATA_X_LSB_ADDR):
+        """Read every data register from start up to the calibration status in
+        a single block transaction and return a BNO055Snapshot, so all values
+        come from the same sample.  start must be the first register of one of
+        the vectors; values before it are returned as zeros.  Starting at
+        BNO055_EULER_H_LSB_ADDR keeps the read at 28 bytes, within the 32 byte
+        SMBus block limit.  Units match the individual read_* functions.
+        """
+        offset = start - BNO055_ACCEL_DATA_X_LSB_ADDR
+        data = bytearray(BNO055_SNAPSHOT_LENGTH)
+        data[offset:] = self._read_bytes(start, BNO055_SNAPSHOT_LENGTH - offset)
+        v = BNO055_SNAPSHOT_STRUCT.unpack_from(data)
+        cal_status = v[23]
+        # Scale values, see 3.6.5.5 in the datasheet for the quaternion.
+        scale = (1.0 / (1<<14))
+        return BNO055Snapshot(
+            accel=(v[0]/100.0, v[1]/100.0, v[2]/100.0),
+            mag=(v[3]/16.0, v[4]/16.0, v[5]/16.0),
+            gyro=(v[6]/900.0, v[7]/900.0, v[8]/900.0),
+            euler=(v[9]/16.0, v[10]/16.0, v[11]/16.0),
+            quaternion=(v[13]*scale, v[14]*scale, v[15]*scale, v[12]*scale),
+            linear_accel=(v[16]/100.0, v[17]/100.0, v[18]/100.0),
+            gravity=(v[19]/100.0, v[20]/100.0, v[21]/100.0),
+            temp=v[22],
+            calibration=((cal_status >> 6) & 0x03, (cal_status >> 4) & 0x03,
+                         (cal_status >> 2) & 0x03, cal_status & 0x03))
+
     def read_euler(self):
         """Return the current absolute orientation as a tuple of heading, roll,
         and pitch euler angles in degrees.
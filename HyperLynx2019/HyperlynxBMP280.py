@@ -51,6 +51,7 @@ BMP280_REGISTER_DIG_P8 = 0x9C
 BMP280_REGISTER_DIG_P9 = 0x9E
 
 BMP280_REGISTER_CONTROL = 0xF4
+BMP280_REGISTER_CONFIG = 0xF5
 #Pressure measurments
 BMP280_REGISTER_PRESSUREDATA_MSB = 0xF7
 BMP280_REGISTER_PRESSUREDATA_LSB = 0xF8
@@ -63,6 +64,24 @@ BMP280_REGISTER_TEMPDATA_XLSB = 0xFC
 # Commands
 BMP280_READCMD = 0x3F
 
+# Standby time between conversions in normal mode
+BMP280_STANDBY_0p5 = 0
+BMP280_STANDBY_62p5 = 1
+BMP280_STANDBY_125 = 2
+BMP280_STANDBY_250 = 3
+BMP280_STANDBY_500 = 4
+BMP280_STANDBY_1000 = 5
+BMP280_STANDBY_2000 = 6
+BMP280_STANDBY_4000 = 7
+
+# Normal mode (temperature, pressure) oversampling codes for each operating mode
+BMP280_NORMAL_OSRS = {
+    BMP280_ULTRALOWPOWER: (1, 1),
+    BMP280_STANDARD:      (1, 3),
+    BMP280_HIGHRES:       (1, 4),
+    BMP280_ULTRAHIGHRES:  (2, 5)
+}
+
 
 
 class BMP280(object):
@@ -80,6 +99,8 @@ class BMP280(object):
         # Load calibration values.
         self._load_calibration()
         self._tfine = 0
+        self._normal = False
+        self._standby = BMP280_STANDBY_62p5
     #reading two bytes of data from each address as signed or unsigned, based on the Bosch docs
     def _load_calibration(self):
         self.cal_REGISTER_DIG_T1 = self._device.readU16LE(BMP280_REGISTER_DIG_T1)   # UINT16
@@ -125,6 +146,7 @@ class BMP280(object):
     def read_raw_temp(self):
             """Reads the raw (uncompensated) temperature from the sensor."""
             self._device.write8(BMP280_REGISTER_CONTROL, BMP280_READCMD + (self._mode << 6))
+            self._normal = False            # forced conversion, the sensor sleeps afterwards
             if self._mode == BMP280_ULTRALOWPOWER:
                     time.sleep(0.005)
             elif self._mode == BMP280_HIGHRES:
@@ -143,6 +165,7 @@ class BMP280(object):
     def read_raw_pressure(self):
             """Reads the raw (uncompensated) pressure level from the sensor."""
             self._device.write8(BMP280_REGISTER_CONTROL, BMP280_READCMD + (self._mode << 6))
+            self._normal = False            # forced conversion, the sensor sleeps afterwards
             if self._mode == BMP280_ULTRALOWPOWER:
                     time.sleep(0.005)
             elif self._mode == BMP280_HIGHRES:
@@ -157,10 +180,32 @@ class BMP280(object):
             raw = ((msb << 8 | lsb) << 8 | xlsb) >> 4
             self._logger.debug('Raw pressure 0x{0:04X} ({1})'.format(raw & 0xFFFF, raw))
             return raw
+    #free running conversions, results are read with read_all()
+    def start_normal_mode(self, standby=BMP280_STANDBY_62p5):
+        """Puts the sensor in normal (free running) mode with the given standby time."""
+        osrs_t, osrs_p = BMP280_NORMAL_OSRS[self._mode]
+        self._device.write8(BMP280_REGISTER_CONFIG, standby << 5)
+        self._device.write8(BMP280_REGISTER_CONTROL, (osrs_t << 5) | (osrs_p << 2) | 0x03)
+        self._normal = True
+        self._standby = standby
+    #one block read of pressure and temperature, no conversion wait
+    def read_all(self):
+        """Returns (temperature in degrees celsius, pressure in PSI) from a single
+        6 byte read of the data registers.  Starts normal mode if needed, e.g.
+        after a forced read_raw_temp()/read_raw_pressure() left the sensor asleep."""
+        if not self._normal:
+            self.start_normal_mode(self._standby)
+        data = self._device.readList(BMP280_REGISTER_PRESSUREDATA_MSB, 6)
+        adc_P = ((data[0] << 16) | (data[1] << 8) | data[2]) >> 4
+        adc_T = ((data[3] << 16) | (data[4] << 8) | data[5]) >> 4
+        temp = self._compensate_temp(adc_T)
+        return temp, self._compensate_pressure(adc_P)
     #applying calibration data to the raw reading
     def read_temperature(self):
         """Gets the compensated temperature in degrees celsius."""
-        adc_T = self.read_raw_temp()
+        return self._compensate_temp(self.read_raw_temp())
+
+    def _compensate_temp(self, adc_T):
         TMP_PART1 = (((adc_T>>3) - (self.cal_REGISTER_DIG_T1<<1)) * self.cal_REGISTER_DIG_T2) >> 11
         TMP_PART2 = (((((adc_T>>4) - (self.cal_REGISTER_DIG_T1)) * ((adc_T>>4) - (self.cal_REGISTER_DIG_T1))) >> 12) * (self.cal_REGISTER_DIG_T3)) >> 14
         TMP_FINE = TMP_PART1 + TMP_PART2
@@ -175,7 +220,9 @@ class BMP280(object):
         if self._tfine == 0:
             self.read_temperature()
             
-        adc_P = self.read_raw_pressure()
+        return self._compensate_pressure(self.read_raw_pressure())
+
+    def _compensate_pressure(self, adc_P):
         var1 = self._tfine - 128000
         var2 = var1 * var1 * self.cal_REGISTER_DIG_P6
         var2 = var2 + ((var1*self.cal_REGISTER_DIG_P5)<<17);
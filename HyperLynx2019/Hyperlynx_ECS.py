@@ -25,12 +25,13 @@
 		X-----------
 """
 import smbus
-from time import sleep, clock
+import i2c_stats
+from time import sleep, perf_counter
 from mlx90614 import MLX90614
-from Adafruit_BNO055 import BNO055
+from Adafruit_BNO055 import BNO055, BNO055_EULER_H_LSB_ADDR
 import Adafruit_ADS1x15
-from HyperlynxBMP280 import BMP280
-from Adafruit_BME280 import BME280
+from HyperlynxBMP280 import BMP280, BMP280_STANDBY_62p5
+from Adafruit_BME280 import BME280, BME280_STANDBY_62p5
 import Lidar
 import RPi.GPIO
 import os
@@ -46,6 +47,7 @@ class HyperlynxECS():
 		self.BME_ADDR1 = 0x77											#I2C ADDRESS 1 FOR BME280 PRESSURE SENSOR
 		self.BME_ADDR2 = 0x76											#I2C ADDRESS 2 FOR BME280 PRESSURE SENSOR
 		self.LID_ADDR = 0x62											#I2C ADDRESS FOR LIDAR LITE V3
+		self.LID_BURST = True											#RUN LIDAR FREE RUNNING, FALSE FOR PIPELINED SINGLE MEASUREMENTS
 		self.ADC_ADDR = 0x48											#I2C ADDRESS FOR ADS1115 ADC
 		self.MICRO_ADDR = 0x5F											#I2C ADDRESS FOR ARDUINO
 		self.STRIPE_COUNT = 0											#INITIALIZE STRIPE COUNT TO ZERO
@@ -59,6 +61,14 @@ class HyperlynxECS():
 		self.vRatio = 4.13												#ATTOPILOT RATIO: VOLTAGE TRANSMITTED TO ACTUAL VOLTAGE READING
 		self.iRatio = 1													#ATTOPILOT RATIO: VOLTAGE TRANSMITTED TO ACTUAL CURRENT READING
 		self.PASC2PSI = (1/6894.757)
+		self.ADC_RATE = 860												#SAMPLES PER SECOND FOR CONTINUOUS CONVERSION MODE
+		self.ADC_SEQUENCE = [self.PRESSURE]*4 + [self.VOLT] + [self.PRESSURE]*4 + [self.AMP]	#CONTINUOUS MODE CHANNEL ROUND ROBIN, BRAKE PRESSURE GETS MOST SLOTS
+		self.ADC_STALE = 0.5											#SECONDS BEFORE A CACHED CONVERSION COUNTS AS AN ADC FAILURE
+		self.adcContinuous = False										#TRUE WHEN ADC GETTERS RETURN CACHED CONTINUOUS CONVERSIONS
+		self.adcSlot = 0												#CURRENT POSITION IN ADC_SEQUENCE
+		self.adcChannel = None											#ADC CHANNEL CURRENTLY CONVERTING
+		self.adcSwitchTime = 0											#TIME OF LAST ADC MUX SWITCH
+		self.adcCache = {}												#LATEST (RAW VALUE, TIME) PER ADC CHANNEL
 		self.IO = RPi.GPIO												#INITIALIZE RPi.GPIO LIBRARY TO CONTROL DROK SWITCHES
 		self.NOsolPIN = 17												#DROK SIGNAL PIN FOR NORMALLY OPEN SOLENOID
 		self.NCsol1PIN = 27												#DROK SIGNAL PIN FOR NORMALLY CLOSED SOLENOID RESERVIOR 1
@@ -68,6 +78,8 @@ class HyperlynxECS():
 		self.contactorPIN1 = 13											#DROK SIGNAL PIN FOR CONTACTOR 1
 		self.contactorPIN2 = 18											#DROK SIGNAL PIN FOR CONTACTOR 2
 		self.MLXrstPIN = 19												#ACTIVE LOW RESET FOR MLX90614
+		i2c_stats.install()												#COUNT EVERY SMBUS TRANSACTION PER DEVICE, FOR ALL DRIVERS
+		self.i2cStats = i2c_stats.stats
 		self.bus = smbus.SMBus(bus_num)									#OPEN I2C BUS
 		self.IO.setmode(self.IO.BCM)									#BCM MODE USES BROADCOM SOC CHANNEL NUMBER FOR EACH PIN
 		self.IO.setwarnings(False)										#TURN OFF WARNINGS TO ALLOW OVERIDE OF CURRENT GPIO CONFIGURATION
@@ -92,6 +104,19 @@ class HyperlynxECS():
 		self.TCA_status = False
 		self.MICRO_status = False
 		self.MLXRST = 0
+		self.tcaSwitches = 0											#TOTAL NUMBER OF TCA CHANNEL SWITCHES
+		for channel, addr, name in ((None, self.MUX_ADDR, 'TCA'),		#NAMES FOR THE I2C REPORT, KEYED BY (TCA CHANNEL, ADDRESS)
+									(self.tcaNOSE, self.LID_ADDR, 'LIDAR'),
+									(self.tcaNOSE, self.BMP_ADDR, 'BMP'),
+									(self.tcaNOSE, self.MICRO_ADDR, 'MICRO'),
+									(self.tcaPVL, self.BME_ADDR2, 'BME2'),
+									(self.tcaPVR, self.IR_ADDR, 'MLX'),
+									(self.tcaPVR, self.ADC_ADDR, 'ADC'),
+									(self.tcaPVR2, self.BME_ADDR1, 'BME1'),
+									(self.tcaPVR2, self.IMU_ADDR1, 'BNO1'),
+									(self.tcaPVR2, self.IMU_ADDR2, 'BNO2')):
+			self.i2cStats.name(channel, addr, name)
+		self.tcaStats = {}												#PER CHANNEL READS, SWITCHES AND TIME FROM readBatch()
 		
 		try:															#ESTABLISH CONNECTION TO MULTIPLEXER
 			self.bus.write_byte(self.MUX_ADDR, 0)
@@ -117,6 +142,8 @@ class HyperlynxECS():
 		try:
 			self.Lidar = Lidar.Lidar_Lite()								#CREATE OBJECT FOR LIDAR LITE V3
 			self.bus.write_quick(self.LID_ADDR)							#QUICK WRITE TO TEST CONNECTION TO I2C BUS
+			if(self.LID_BURST):
+				self.Lidar.startBurst()									#FREE RUNNING AT ~100 HZ FOR CRAWL STOP CONDITION
 			print("Lidar Ready")
 			self.LID_status = True
 		except IOError:
@@ -125,6 +152,7 @@ class HyperlynxECS():
 			for x in range(0, self.connectAttempt):
 				self.BMP = BMP280(address=self.BMP_ADDR)				#CREATE OBJECT FOR BMP280
 				if(self.BMP.read_raw_temp()):							#ATTEMPT READING FROM BMP
+					self.BMP.start_normal_mode(BMP280_STANDBY_62p5)		#FREE RUNNING CONVERSIONS FOR getTubeData()
 					print("BMP Ready")
 					self.BMP_status = True
 					break
@@ -152,7 +180,7 @@ class HyperlynxECS():
 			return 0
 		try:
 			for x in range(0, self.connectAttempt):
-				self.BMEL = BME280(address=self.BME_ADDR2)				#CREATE OBJECT FOR BME280 AT ADDRESS 2
+				self.BMEL = BME280(standby=BME280_STANDBY_62p5, address=self.BME_ADDR2)				#CREATE OBJECT FOR BME280 AT ADDRESS 2
 				if(self.BMEL.read_raw_temp()):
 					print("BME LPV Ready")
 					self.BME2_status = True
@@ -201,7 +229,7 @@ class HyperlynxECS():
 			return 0
 		try:
 			for x in range(0, self.connectAttempt):
-				self.BMER = BME280(address=self.BME_ADDR1)				#CREATE  OBJECT FOR BME280 AT ADDRESS 2
+				self.BMER = BME280(standby=BME280_STANDBY_62p5, address=self.BME_ADDR1)				#CREATE  OBJECT FOR BME280 AT ADDRESS 2
 				if(self.BMER.read_raw_temp()):
 					print("BME RPV Ready")
 					self.BME1_status = True
@@ -266,6 +294,35 @@ class HyperlynxECS():
 	def openBus(self, bus_num):											#PARAMETER IS DESIRED TCA CHANNEL TO OPEN
 		self.bus.write_byte(self.MUX_ADDR, (1<<bus_num))				#WRITE SPECIFIED CHANNEL BIT HIGH ON TCA SELECT REGISTER
 		self.currentBus = bus_num										#UPDATE CURRENT OPEN CHANNEL
+		self.tcaSwitches = self.tcaSwitches + 1
+	"""READ A BATCH OF SENSORS GROUPED BY TCA CHANNEL"""				#PARAMETER IS LIST OF (NAME, TCA CHANNEL, FUNCTION) TUPLES
+	def readBatch(self, reads):
+		order = sorted(reads, key=lambda read: (read[1] != self.currentBus, read[1]))	#CURRENTLY OPEN CHANNEL FIRST, THEN CHANNEL ORDER
+		data = {}
+		for name, channel, func in order:
+			stats = self.tcaStats.setdefault(channel, {'reads': 0, 'switches': 0, 'time': 0.0})
+			if(self.currentBus != channel):
+				try:
+					self.openBus(channel)								#ONE SWITCH PER CHANNEL PER BATCH, GETTERS SEE THE CHANNEL IS ALREADY OPEN
+					stats['switches'] = stats['switches'] + 1
+					self.TCA_status = True
+				except IOError:
+					self.TCA_status = False								#GETTER WILL RETRY THE SWITCH AND RETURN ZERO ON FAILURE
+			startTime = perf_counter()
+			data[name] = func()
+			stats['time'] = stats['time'] + (perf_counter() - startTime)
+			stats['reads'] = stats['reads'] + 1
+		return data														#RETURNS DICT OF {NAME: READING}
+	"""REPORT PER CHANNEL TRANSACTION COUNTS AND TIME"""
+	def getTCAReport(self):
+		report = {}
+		for channel in self.tcaStats:
+			report[channel] = dict(self.tcaStats[channel])
+		report['total_switches'] = self.tcaSwitches
+		return report
+	"""REPORT PER DEVICE I2C TRANSACTIONS, BYTES, ERRORS, TRANSACTIONS AFTER AN ERROR AND LATENCY"""
+	def getI2CReport(self):
+		return self.i2cStats.report()									#RETURNS DICT OF {DEVICE NAME: COUNTERS}, LATENCY IN US
 	"""FETCH LV BATTERY TEMPERATURE"""	
 	def getBatteryTemp(self):
 		if(self.currentBus != self.tcaPVR):
@@ -350,6 +407,43 @@ class HyperlynxECS():
 		else:
 			print("Illegal Selection")
 			return 0		
+	"""FETCH LINEAR ACCELERATION AND ORIENTATION FROM ONE SNAPSHOT READ"""	#PARAMETER IS DESIRED IMU (1 OR 2)
+	def getIMUData(self, imu_num):
+		if(self.currentBus != self.tcaPVR2):
+			try:
+				self.openBus(self.tcaPVR2)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return ((0, 0, 0), [0, 0, 0])
+		if(imu_num == 1):
+			imu = self.IMU1
+			xOffset = self.X1OFFSET
+			zOffset = self.Z1OFFSET
+		elif(imu_num == 2):
+			imu = self.IMU2
+			xOffset = self.X2OFFSET
+			zOffset = self.Z2OFFSET
+		else:
+			print("Illegal Selection")
+			return ((0, 0, 0), [0, 0, 0])
+		try:
+			snap = imu.read_snapshot(BNO055_EULER_H_LSB_ADDR)			#EULER THROUGH CALIB STATUS IN ONE 28 BYTE BLOCK READ
+			status = True
+		except IOError:
+			snap = None
+			status = False
+		if(imu_num == 1):
+			self.BNO1_status = status
+		else:
+			self.BNO2_status = status
+		if(snap is None):
+			return ((0, 0, 0), [0, 0, 0])
+		data = snap.linear_accel
+		accel = (data[0] * self.METER2G, data[1] * self.METER2G, data[2] * self.METER2G)	#(Z, X, Y) IN G'S, SAME ORDER AS getAcceleration()
+		euler = snap.euler
+		orient = [euler[1] - xOffset, euler[0], euler[2] - zOffset]	#[X, Y, Z] IN DEGREES, SAME AS getOrientation()
+		return (accel, orient)
 	"""FETCH LIDAR DISTANCE READING"""										
 	def getLidarDistance(self):
 		if(self.currentBus != self.tcaNOSE):
@@ -360,7 +454,7 @@ class HyperlynxECS():
 				self.TCA_status = False
 				return 0												#RETURNS ZERO IF CANNOT CONNECT TO TCA
 		try:
-			data = self.Lidar.getDistance()								#FETCH DISTANCE
+			data = self.Lidar.pollDistance()							#FETCH LATEST DISTANCE, NEVER SLEEPS
 			self.LID_status = True
 		except IOError:
 			data = 0													#SETS AS ZERO IF CANNOT CONNECT TO LIDAR
@@ -398,6 +492,51 @@ class HyperlynxECS():
 			data = 0													#SETS AS ZERO IF CANNOT CONNECT TO BMP
 			self.BMP_status = False
 		return data														#RETURNS TEMPERATURE IN DEGREES CELSIUS
+	"""FETCH TUBE TEMPERATURE AND PRESSURE IN ONE READ"""
+	def getTubeData(self):
+		if(self.currentBus != self.tcaNOSE):
+			try:
+				self.openBus(self.tcaNOSE)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return (0, 0)											#RETURNS ZEROS IF CANNOT CONNECT TO TCA
+		try:
+			data = self.BMP.read_all()									#ONE 6 BYTE BLOCK READ, NO CONVERSION WAIT
+			self.BMP_status = True
+		except IOError:
+			data = (0, 0)												#SETS AS ZEROS IF CANNOT CONNECT TO BMP
+			self.BMP_status = False
+		return data														#RETURNS (TEMPERATURE IN DEGREES CELSIUS, PRESSURE IN PSI)
+	"""FETCH BME TEMPERATURE, PRESSURE AND HUMIDITY IN ONE READ"""		#PARAMETER IS DESIRED BME (1 = RIGHT PV, 2 = LEFT PV)
+	def getBMEdata(self, vessel):
+		if(vessel == 1):
+			channel = self.tcaPVR2
+			sensor = self.BMER
+		elif(vessel == 2):
+			channel = self.tcaPVL
+			sensor = self.BMEL
+		else:
+			print("Illegal vessel")
+			return (0, 0, 0)
+		if(self.currentBus != channel):
+			try:
+				self.openBus(channel)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return (0, 0, 0)										#RETURNS ZEROS IF CANNOT CONNECT TO TCA
+		try:
+			temp, pressure, humidity = sensor.read_all()				#ONE 8 BYTE BLOCK READ, NO CONVERSION WAIT
+			status = True
+		except IOError:
+			temp, pressure, humidity = (0, 0, 0)						#SETS AS ZEROS IF CANNOT CONNECT TO BME
+			status = False
+		if(vessel == 1):
+			self.BME1_status = status
+		else:
+			self.BME2_status = status
+		return (temp, pressure * self.PASC2PSI, humidity)				#RETURNS (DEGREES CELSIUS, PSI, % RH)
 	"""FETCH BME PRESSURE"""											#PARAMETER IS DESIRED BME (1 = RIGHT PV, 2 = LEFT PV)
 	def getBMEpressure(self, vessel):
 		if(vessel == 1):
@@ -469,9 +608,75 @@ class HyperlynxECS():
 		else:
 			print("Illegal Selection")
 			return 0
+	"""START ADC CONTINUOUS CONVERSION ROUND ROBIN"""
+	def startADCContinuous(self):
+		if(self.currentBus != self.tcaPVR):
+			try:
+				self.openBus(self.tcaPVR)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return 0
+		try:
+			self.adcSlot = 0
+			self.adcChannel = self.ADC_SEQUENCE[0]
+			self.adcCache[self.adcChannel] = (self.ADC.start_adc(self.adcChannel, self.ADC_GAIN, self.ADC_RATE), perf_counter())
+			self.adcSwitchTime = perf_counter()
+			self.adcContinuous = True
+			self.ADC_status = True
+		except IOError:
+			self.ADC_status = False
+			return 0
+		return 1
+	"""STOP ADC CONTINUOUS CONVERSION, GETTERS GO BACK TO SINGLE SHOT READS"""
+	def stopADCContinuous(self):
+		self.adcContinuous = False
+		if(self.currentBus != self.tcaPVR):
+			try:
+				self.openBus(self.tcaPVR)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return
+		try:
+			self.ADC.stop_adc()
+		except IOError:
+			self.ADC_status = False
+	"""SERVICE ADC ROUND ROBIN"""										#CALL EVERY BUS CYCLE, NEVER SLEEPS
+	def serviceADC(self):
+		if(not self.adcContinuous):
+			return
+		if(perf_counter() - self.adcSwitchTime < 1.0/self.ADC_RATE + 0.0001):
+			return														#FIRST CONVERSION ON NEW CHANNEL NOT READY YET
+		if(self.currentBus != self.tcaPVR):
+			try:
+				self.openBus(self.tcaPVR)
+				self.TCA_status = True
+			except IOError:
+				self.TCA_status = False
+				return
+		try:
+			self.adcCache[self.adcChannel] = (self.ADC.get_last_result(), perf_counter())
+			self.adcSlot = (self.adcSlot + 1) % len(self.ADC_SEQUENCE)
+			nextChannel = self.ADC_SEQUENCE[self.adcSlot]
+			if(nextChannel != self.adcChannel):
+				self.ADC.select_adc(nextChannel, self.ADC_GAIN, self.ADC_RATE)	#SWITCH MUX, RESULT IS READ ON A LATER CALL
+				self.adcChannel = nextChannel
+				self.adcSwitchTime = perf_counter()
+			self.ADC_status = True
+		except IOError:
+			self.ADC_status = False
+	"""READ RAW ADC CHANNEL"""											#CACHED CONVERSION IN CONTINUOUS MODE, SINGLE SHOT READ OTHERWISE
+	def readADC(self, channel):
+		if(self.adcContinuous):
+			data, readTime = self.adcCache.get(channel, (0, None))
+			if(readTime is None or perf_counter() - readTime > self.ADC_STALE):
+				raise IOError("Stale ADC conversion on channel %d" % channel)
+			return data
+		return self.ADC.read_adc(channel, self.ADC_GAIN)				#TCA CHANNEL MUST ALREADY BE OPEN
 	"""FETCH LV BATTERY VOLTAGE LEVEL"""		
 	def getVoltageLevel(self):
-		if(self.currentBus != self.tcaPVR):
+		if(not self.adcContinuous and self.currentBus != self.tcaPVR):	#NO BUS ACCESS NEEDED FOR CACHED CONVERSIONS
 			try:
 				self.openBus(self.tcaPVR)
 				self.TCA_status = True
@@ -479,7 +684,7 @@ class HyperlynxECS():
 				self.TCA_status = False
 				return 0												#RETURNS ZERO IF CANNOT CONNECT TO TCA
 		try:
-			data = self.ADC.read_adc(self.VOLT, self.ADC_GAIN)			#READ VOLTAGE PIN SET ON ADC
+			data = self.readADC(self.VOLT)								#READ VOLTAGE PIN SET ON ADC
 			self.ADC_status = True
 		except IOError:
 			data = 0													#SETS AS ZERO IF CANNOT CONNECT TO ADC
@@ -487,7 +692,7 @@ class HyperlynxECS():
 		return 12#(data-4700) * self.ADC_CONVERT * self.vRatio					#CONVERTS ADC BITS TO ACTUAL VOLTAGE SENT BY ATTOPILOT AND SCALES TO VOLTAGE READ BY ATTOPILOT, RETURNS VOLTAGE
 	"""FETCH LV BATTERY CURRENT DRAW"""#DOES NOT WORK YET, SOURCING NEW SENSOR	
 	def getCurrentLevel(self):
-		if(self.currentBus != self.tcaPVR):
+		if(not self.adcContinuous and self.currentBus != self.tcaPVR):	#NO BUS ACCESS NEEDED FOR CACHED CONVERSIONS
 			try:
 				self.openBus(self.tcaPVR)
 				self.TCA_status = True
@@ -495,7 +700,7 @@ class HyperlynxECS():
 				self.TCA_status = False
 				return 0
 		try:
-			data = self.ADC.read_adc(self.AMP, self.ADC_GAIN)
+			data = self.readADC(self.AMP)
 			self.ADC_status = True
 		except IOError:
 			data = 0
@@ -503,7 +708,7 @@ class HyperlynxECS():
 		return (data-4700) * self.ADC_CONVERT * self.iRatio
 	"""FETCH BRAKE LINE PRESSURE"""	
 	def getBrakePressure(self):
-		if(self.currentBus != self.tcaPVR):
+		if(not self.adcContinuous and self.currentBus != self.tcaPVR):	#NO BUS ACCESS NEEDED FOR CACHED CONVERSIONS
 			try:
 				self.openBus(self.tcaPVR)
 				self.TCA_status = True
@@ -511,7 +716,7 @@ class HyperlynxECS():
 				self.TCA_status = False
 				return 0												#RETURNS ZERO IF CANNOT CONNECT TO TCA
 		try:
-			data = self.ADC.read_adc(self.PRESSURE, self.ADC_GAIN)		#READ PRESSURE PIN SET ON ADC
+			data = self.readADC(self.PRESSURE)							#READ PRESSURE PIN SET ON ADC
 			self.ADC_status = True
 		except IOError:
 			data = 0													#SETS AS ZERO IF CANNOT CONNECT TO ADC
@@ -600,12 +805,46 @@ class HyperlynxECS():
 			self.TCA_status = True
 		return (data / 10) * 100
 				
+class BusScheduler():
+	"""
+	Runs one I2C cycle at a time: collects the reads due this cycle (each read can
+	have its own rate) and issues them through HyperlynxECS.readBatch() so every
+	TCA channel is opened at most once per cycle.
+	"""
+	def __init__(self, ecs, rate):
+		self.ecs = ecs
+		self.rate = rate												#CYCLE RATE IN HZ
+		self.reads = []
+		self.cycle = 0
+		self.lastSwitches = 0											#TCA SWITCHES IN LAST CYCLE
+
+	def addRead(self, name, channel, func, rate=None):					#RATE IN HZ, NONE TO READ EVERY CYCLE
+		if rate is None:
+			divider = 1
+		else:
+			divider = max(int(round(self.rate / rate)), 1)
+		self.reads.append((name, channel, func, divider))
+
+	def runCycle(self):
+		due = [(name, channel, func) for name, channel, func, divider in self.reads if self.cycle % divider == 0]
+		self.cycle = self.cycle + 1
+		switches = self.ecs.tcaSwitches
+		data = self.ecs.readBatch(due)
+		self.lastSwitches = self.ecs.tcaSwitches - switches
+		return data
+
+	def report(self):
+		report = self.ecs.getTCAReport()
+		report['cycles'] = self.cycle
+		report['last_cycle_switches'] = self.lastSwitches
+		return report
+
 if __name__ == '__main__':
 	system = HyperlynxECS()
 	system.initializeIO()
 	if(system.initializeSensors()):
 		while True:
-			startTime = clock()
+			startTime = perf_counter()
 			distance = system.getLidarDistance()
 			tubepress = system.getTubePressure()
 			tubetemp = system.getTubeTemp()
@@ -623,7 +862,7 @@ if __name__ == '__main__':
 			press1 = system.getBMEpressure(1)
 			stripes = system.getStripeCount()
 			stat = system.statusCheck()
-			endTime = clock() - startTime
+			endTime = perf_counter() - startTime
 			print(stat)
 			print(system.MLXRST)
 			print(endTime)
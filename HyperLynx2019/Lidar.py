@@ -15,7 +15,20 @@ class Lidar_Lite():
     self.velWriteReg = 0x04
     self.velWriteVal = 0x08
     self.velReadReg = 0x09
+    self.statusReg = 0x01
+    self.acqConfigReg = 0x04
+    self.outerLoopReg = 0x11
+    self.measureDelayReg = 0x45
+    self.acqNoBias = 0x03       # ACQ_COMMAND value: measure without receiver bias correction
+    self.biasInterval = 100     # measurements between bias corrections, per datasheet
     self.bus = smbus.SMBus(1)
+
+    # Pipelined measurement state
+    self.pending = False        # a triggered measurement has not been read yet
+    self.burst = False          # free running mode active
+    self.count = 0              # measurements taken since last bias correction
+    self.distance = 0           # [cm] latest distance
+    self.stamp = 0              # time of latest distance
     
 
   def writeAndWait(self, register, value):
@@ -43,6 +56,63 @@ class Lidar_Lite():
     vel = self.readAndWait(self.velReadReg)
     return self.signedInt(vel)
 
+  def trigger(self):
+    """Starts a measurement and returns immediately."""
+    if self.count % self.biasInterval == 0:
+      self.bus.write_byte_data(self.address, self.distWriteReg, self.distWriteVal)
+    else:
+      self.bus.write_byte_data(self.address, self.distWriteReg, self.acqNoBias)
+    self.count += 1
+    self.pending = True
+
+  def busy(self):
+    """True while a measurement is in progress (status register busy bit)."""
+    return bool(self.bus.read_byte_data(self.address, self.statusReg) & 0x01)
+
+  def readDistance(self):
+    """Reads the distance registers without waiting."""
+    res = self.bus.read_i2c_block_data(self.address, self.distReadReg1, 2)
+    self.distance = res[0] << 8 | res[1]
+    self.stamp = time.time()
+    return self.distance
+
+  def pollDistance(self):
+    """
+    Non-blocking distance read for use once per control/bus cycle.  Collects the
+    previously triggered measurement if the busy bit has cleared, then triggers the
+    next one.  In burst mode the sensor free runs, so only the registers are read.
+    Returns the latest distance in cm.
+    """
+    if self.burst:
+      if not self.busy():
+        self.readDistance()
+      return self.distance
+    if self.pending:
+      if self.busy():
+        return self.distance
+      self.readDistance()
+      self.pending = False
+    self.trigger()
+    return self.distance
+
+  def startBurst(self, delay=0x14):
+    """
+    Starts free running measurements.  delay is MEASURE_DELAY between measurements,
+    0x14 is about 100 Hz and 0xc8 about 10 Hz.
+    """
+    self.bus.write_byte_data(self.address, self.outerLoopReg, 0xff)       # repeat indefinitely
+    self.bus.write_byte_data(self.address, self.measureDelayReg, delay)
+    self.bus.write_byte_data(self.address, self.acqConfigReg, 0x08 | 0x20)  # default config + use MEASURE_DELAY
+    self.bus.write_byte_data(self.address, self.distWriteReg, self.distWriteVal)
+    self.burst = True
+    self.pending = False
+
+  def stopBurst(self):
+    """Returns to single measurements."""
+    self.bus.write_byte_data(self.address, self.outerLoopReg, 0x00)
+    self.bus.write_byte_data(self.address, self.acqConfigReg, 0x08)
+    self.burst = False
+
   def signedInt(self, value):
     if value > 127:
       return (256-value) * (-1)
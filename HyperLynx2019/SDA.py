@@ -54,19 +54,32 @@ Each main loop will have a separate timestamp
 '''
 
 from time import clock
-import socket, struct
 import numpy
 import datetime
 import os, psutil
+from operator import itemgetter
 import pickle
 #from argparse import ArgumentParser
 #import smbus
 import Hyperlynx_ECS, flight_sim
 
 # from Client import send_server
-from network_transfer.libclient import BaseClient
+from network_transfer.async_transport import PodLink, LoopThread
+from command_channel import CommandChannel
+from spacex_telemetry import SpaceXEmitter
 import timeouts
 import can_bms
+from scheduler import CyclicExecutive
+from stage_timing import StageTimer
+from acquisition import Acquisition
+from rolling_filter import RollingFilter
+from abort_engine import AbortEngine
+from flight_log import FlightLogWriter, AsyncLogSink
+
+
+# Pod state variables logged after sensor_data and commands, in write_file() order
+LOG_STATUS = ('state', 'spacex_state', 'total_faults', 'throttle', 'D', 'V', 'A', 'A_std_dev',
+              'A_filter_val', 'Clock_interval', 'Brakes', 'HV', 'Vent_Sol', 'stripe_count')
 
 
 class Status():
@@ -139,8 +152,21 @@ class Status():
         self.spacex_team_id = 69
         self.spacex_server_ip = '192.168.0.1'
         self.spacex_server_port = 3000
-        self.spacex_rate = 40               # [Hz] rate of spacex data burst
-        self.spacex_lastsend = 0
+        self.spacex_rate = 40               # [Hz] rate of spacex data burst, 10 - 50 Hz
+        self.spacex = None                  # SpaceXEmitter, started in main
+
+        # GUI TELEMETRY CONFIG
+        self.gui_server_ip = 'localhost'
+        self.gui_server_port = 5050
+        self.telemetry = None               # PodLink to the GUI server, started in main
+        self.gui_loop = None                # LoopThread running the PodLink
+        self.command_channel = CommandChannel(heartbeat_timeout=2.0)
+        self.gui_para_keys = ('para_BBP', 'para_max_speed', 'para_max_accel', 'para_max_time',
+                              'para_max_crawl_speed', 'para_max_tube_length')
+
+        # CAN BMS CONFIG
+        self.can_channel = 'can0'
+        self.bms = None                     # can_bms.CanBms, started in init(); None if no CAN board
 
         # I2C init
         self.IMU_init_range = 0.05
@@ -148,12 +174,30 @@ class Status():
         self.sensor_poll.initializeSensors()
         self.sensor_poll.initializeIO()
 
+        # Background acquisition rates per sensor group ('imu' is also the I2C cycle rate)
+        self.acq_rates = {'imu': 100,       # [Hz]
+                          'lidar': 100,
+                          'nose': 20,
+                          'adc': 20,
+                          'pv': 10}
+        self.acq_stale_periods = 5          # a sample is stale after this many missed group periods,
+        self.acq_stale_min = 0.25           # [s] but never sooner than this
+        self.acq_stale_ticks = 20           # control ticks a group must stay stale before it counts
+        self.acq_stale_after = {}           # {rate group: (sensor_data keys, limit [s])}, see build_acquisition()
+        self.acq_stale_count = {}           # {rate group: consecutive ticks stale}
+        self.acq_stamps = {}                # {sensor_data key: stamp of the sample last copied}
+        self.acq_fresh = None               # keys copied this tick, None if all are new (flight sim)
+        self.acquisition = None
+        self.bus_scheduler = None
+
         # DEBUG init for script:
         self.Quit = False
 
         # Set filter on priority data:
         self.filter_items = ['IMU1_X', 'IMU1_Y', 'IMU1_Z', 'IMU2_X', 'IMU2_Y',
                              'IMU2_Z', 'LIDAR', 'Brake_Pressure']
+        self.rolling_filter = None      # RollingFilter over filter_items, built in init()
+        self.abort_engine = None        # abort_ranges compiled to arrays, built in init()
 
         # init True values for Distance, Velocity, and Acceleration, with moving average queue, true value, and dev
         self.true_data = {'D': {'q': [], 'val': 0, 'std_dev': 0},
@@ -169,21 +213,63 @@ class Status():
         self.state = self.SafeToApproach
 
         # INITIATE LOG RATE INFO
-        self.log_lastwrite = clock()            # Saves last time of file write to control log rate
-        self.log_rate = 10                      # Hz
+        self.log_lastwrite = clock()            # Saves last time of file write
+        self.log_rate = 200                     # Hz, binary log record rate
+        self.flight_log = None                  # FlightLogWriter, opened by create_log()
+        self.log_sink = None                    # AsyncLogSink writing flight_log off the main loop
+        self.log_queue_length = 2000            # [records] buffered before records are dropped
+        self.log_sensors = []                   # sensor_data keys in the log schema
+        self.log_fault_rows = {}                # {id(abort table): (log rows, table rows)}
+
+        # MAIN LOOP SCHEDULE
+        self.loop_rate = 200                    # [Hz] control loop (minor frame) rate
+        self.rpi_rate = 1                       # [Hz] rate of RPi health stats
+        self.telemetry_rate = 10                # [Hz] rate of GUI telemetry
+        self.stage_budgets = {'poll_sensors': 0.002,     # [s] time budget per stage
+                              'filter_data': 0.0005,
+                              'sensor_fusion': 0.0002,
+                              'run_state': 0.0002,
+                              'do_commands': 0.0002,
+                              'eval_abort': 0.0005,
+                              'rec_data': 0.0005,
+                              'spacex_data': 0.0002,
+                              'write_file': 0.002,
+                              'poll_rpi': 0.001,
+                              'send_telemetry': 0.001}
+        self.scheduler = None
+        self.profile_stages = True              # per stage run time histograms (stage_timing.py)
+        self.stage_timer = StageTimer() if self.profile_stages else None
 
     def create_log(self):
         ### Create log file ###
         date = datetime.datetime.today()
         new_number = str(date.year) + str(date.month) + str(date.day) \
                      + str(date.hour) + str(date.minute) + str(date.second)
-        self.file_name = 'log_' + new_number
-        file = open(os.path.join('logs/', self.file_name), 'a')
-        columns = ['Label', 'Value', 'Fault', 'Time']
-        with file:
-            file.write('\t'.join(map(lambda column_title: "\"" + column_title + "\"", columns)))
-            file.write("\n")
-        file.close()
+        after = None
+        if self.stage_timer is not None and self.flight_log is not None:
+            # Stage timing of the finished log, written next to it on the log_sink thread
+            timing = self.stage_timer.snapshot()
+            timing_path = os.path.join('logs/', self.file_name + '.timing.json')
+            after = lambda: timing.dump(timing_path, reset=False)
+        self.file_name = 'log_' + new_number + '.hlx'
+
+        # Schema is fixed from the keys known when the log is created
+        self.log_sensors = list(self.sensor_data)
+        self.log_get_sensors = itemgetter(*self.log_sensors)
+        self.log_cmd_keys = (list(self.cmd_ext), list(self.cmd_int))
+        commands = ['ext_' + str(key) for key in self.cmd_ext] + ['int_' + str(key) for key in self.cmd_int]
+        columns = self.log_sensors + commands + list(LOG_STATUS)
+        # Called from run_state() on log rotation, so the file is closed and opened
+        # on the log_sink thread, never here
+        self.flight_log = FlightLogWriter(os.path.join('logs/', self.file_name), columns,
+                                          n_fault=len(self.log_sensors), no_fault=commands,
+                                          open_now=False)
+        if self.log_sink is None:
+            self.log_sink = AsyncLogSink(self.flight_log, self.log_queue_length)
+            self.log_sink.start()
+        else:
+            self.log_sink.rotate(self.flight_log, after)
+        self.log_fault_rows = {}
         print("Log file created: " + str(self.file_name))
     
     def data_dump(self):
@@ -196,6 +282,23 @@ class Status():
         data_dict['IMU2_z'] = self.sensor_filter['IMU2_Z']['val']
         data_dict['thrtl'] = self.throttle
         data_dict['lidar'] = self.sensor_filter['LIDAR']['val']
+        if self.scheduler is not None:
+            data_dict['overruns'] = {task.name: task.overruns for task in self.scheduler.tasks}
+            data_dict['overruns']['frame'] = self.scheduler.frame_overruns
+        if self.bus_scheduler is not None:
+            data_dict['tca'] = self.bus_scheduler.report()
+            data_dict['i2c'] = self.sensor_poll.getI2CReport()
+        if self.stage_timer is not None:
+            data_dict['timing'] = self.stage_timer.summary()
+        if self.log_sink is not None:
+            data_dict['log'] = self.log_sink.stats()
+        if self.telemetry is not None:
+            data_dict['telemetry'] = self.telemetry.stats()
+            data_dict['commands'] = self.command_channel.stats()
+        if self.spacex is not None:
+            data_dict['spacex'] = self.spacex.stats()
+        if self.bms is not None:
+            data_dict['bms'] = self.bms.stats()
         return data_dict
 
 
@@ -260,8 +363,35 @@ def init():
                          "Res2_Sol": 0,
                          "MC_Pump": 0}
 
+    # GUI link status, set by rec_data(); acquisition staleness, set by poll_sensors()
+    for key in ('GUI_Conn', 'GUI_Conn_time', 'GUI_Latency', 'Acq_Stale'):
+        PodStatus.sensor_data.setdefault(key, 0)
+
+    # Compile abort ranges for eval_abort()
+    PodStatus.abort_engine = AbortEngine(PodStatus.abort_ranges)
+
+    # Moving average filter over the priority sensors
+    PodStatus.rolling_filter = RollingFilter([key for key in PodStatus.filter_items if key in PodStatus.sensor_data],
+                                             PodStatus.filter_length)
+
+    ## START SENSOR ACQUISITION
+    PodStatus.acquisition = build_acquisition()
+    PodStatus.acquisition.start()
+    if not PodStatus.acquisition.wait_ready():
+        print("Not all sensor groups have reported.")
+
+    ## START CAN BMS RECEIVE
+    can_bms.bring_up(PodStatus.can_channel)
+    try:
+        PodStatus.bms = can_bms.CanBms(PodStatus.can_channel)
+    except (OSError, can_bms.can.CanError) as e:
+        print('Cannot find PiCAN board: ' + repr(e))
+    else:
+        PodStatus.bms.start()
+
     ## CHECK IMU INIT
     print("Checking IMUs")
+    poll_rpi()
     poll_sensors()
     filter_data()
     if abs(PodStatus.sensor_filter['IMU1_Z']['val']) < PodStatus.IMU_init_range and \
@@ -282,9 +412,9 @@ def init():
 
 def poll_sensors():
     """
-    Runs all polling functions for the I2C & CAN buses.
+    Collects the latest I2C & CAN data.  I2C sensors are read by background threads
+    (see build_acquisition()), so this only copies their latest samples.
     Converts raw data to pod state variables
-    Q: Should this be in a different thread?
     """
 
     PodStatus.poll_oldtime = PodStatus.poll_newtime
@@ -297,51 +427,44 @@ def poll_sensors():
 
     ### I2C DATA ###
 
+    # Latest samples from the background acquisition groups, see build_acquisition()
+    store = PodStatus.acquisition.store
+
     # If you want to run the flight sim:
     if PodStatus.flight_sim is True:
 
-        # PodStatus.sensor_data['Brake_Pressure'] = PodStatus.sensor_poll.getBrakePressure()
-        PodStatus.sensor_data['LVBatt_Temp'] = PodStatus.sensor_poll.getBatteryTemp()
+        for key in ('LVBatt_Temp', 'PV_Left_Temp', 'PV_Left_Pressure', 'PV_Right_Temp',
+                    'PV_Right_Pressure', 'Ambient_Pressure', 'IMU1_X', 'IMU1_Y', 'IMU2_X', 'IMU2_Y'):
+            PodStatus.sensor_data[key] = store.get(key)
         PodStatus.sensor_data['LVBatt_Current'] = 4
         PodStatus.sensor_data['LVBatt_Voltage'] = 12
-        PodStatus.sensor_data['PV_Left_Temp'] = PodStatus.sensor_poll.getBMEtemperature(2)
-        PodStatus.sensor_data['PV_Left_Pressure'] = PodStatus.sensor_poll.getBMEpressure(2)
-        PodStatus.sensor_data['PV_Right_Temp'] = PodStatus.sensor_poll.getBMEtemperature(1)
-        PodStatus.sensor_data['PV_Right_Pressure'] = PodStatus.sensor_poll.getBMEpressure(1)
-        PodStatus.sensor_data['Ambient_Pressure'] = PodStatus.sensor_poll.getTubePressure()
-        tempAccel1 = PodStatus.sensor_poll.getAcceleration(1)
-        PodStatus.sensor_data['IMU1_X'] = tempAccel1[1]
-        PodStatus.sensor_data['IMU1_Y'] = tempAccel1[2]
-        # PodStatus.sensor_data['IMU1_Z'] = tempAccel1[0]
-        tempAccel2 = PodStatus.sensor_poll.getAcceleration(2)
-        PodStatus.sensor_data['IMU2_X'] = tempAccel2[1]
-        PodStatus.sensor_data['IMU2_Y'] = tempAccel2[2]
-        # PodStatus.sensor_data['IMU2_Z'] = tempAccel2[0]
         PodStatus.sensor_data['LIDAR'] = PodStatus.para_max_tube_length - PodStatus.true_data['D']['val']
         if PodStatus.sensor_data['LIDAR'] > 150: PodStatus.sensor_data['LIDAR'] = 150
 
         flight_sim.sim(PodStatus)
+        PodStatus.acq_fresh = None
 
     else:
+        # Only samples published since the last tick; the groups run slower than the loop
+        PodStatus.acq_fresh = store.newer(PodStatus.acq_stamps)
+        PodStatus.sensor_data.update(PodStatus.acq_fresh)
+
+        # A group that hangs or dies keeps its last value in the store.  Count the rate
+        # groups that have been past their limit for acq_stale_ticks ticks in a row, so a
+        # single bus or GIL hiccup does not count; checked by eval_abort() through
+        # abortranges.dat (Acq_Stale)
+        stale = 0
+        for group, (keys, limit) in PodStatus.acq_stale_after.items():
+            ages = [store.age(key) for key in keys]
+            if any(age is None or age > limit for age in ages):
+                PodStatus.acq_stale_count[group] = PodStatus.acq_stale_count.get(group, 0) + 1
+            else:
+                PodStatus.acq_stale_count[group] = 0
+            if PodStatus.acq_stale_count[group] >= PodStatus.acq_stale_ticks:
+                stale += 1
+        PodStatus.sensor_data['Acq_Stale'] = stale
         # Uncomment Brake Pressure for pulling in actual data when we have this set up
         # PodStatus.sensor_data['Brake_Pressure'] = PodStatus.sensor_poll.getBrakePressure()
-        PodStatus.sensor_data['LVBatt_Temp'] = PodStatus.sensor_poll.getBatteryTemp()
-        PodStatus.sensor_data['LVBatt_Current'] = PodStatus.sensor_poll.getCurrentLevel()
-        PodStatus.sensor_data['LVBatt_Voltage'] = PodStatus.sensor_poll.getVoltageLevel()
-        PodStatus.sensor_data['PV_Left_Temp'] = PodStatus.sensor_poll.getBMEtemperature(2)
-        PodStatus.sensor_data['PV_Left_Pressure'] = PodStatus.sensor_poll.getBMEpressure(2)
-        PodStatus.sensor_data['PV_Right_Temp'] = PodStatus.sensor_poll.getBMEtemperature(1)
-        PodStatus.sensor_data['PV_Right_Pressure'] = PodStatus.sensor_poll.getBMEpressure(1)
-        PodStatus.sensor_data['Ambient_Pressure'] = PodStatus.sensor_poll.getTubePressure()
-        tempAccel1 = PodStatus.sensor_poll.getAcceleration(1)
-        PodStatus.sensor_data['IMU1_X'] = tempAccel1[1]
-        PodStatus.sensor_data['IMU1_Y'] = tempAccel1[2]
-        PodStatus.sensor_data['IMU1_Z'] = tempAccel1[0]
-        tempAccel2 = PodStatus.sensor_poll.getAcceleration(2)
-        PodStatus.sensor_data['IMU2_X'] = tempAccel2[1]
-        PodStatus.sensor_data['IMU2_Y'] = tempAccel2[2]
-        PodStatus.sensor_data['IMU2_Z'] = tempAccel2[0]
-        PodStatus.sensor_data['LIDAR'] = PodStatus.sensor_poll.getLidarDistance()
 
     if abs(PodStatus.sensor_data['IMU1_Z']) > 20:
         PodStatus.sensor_data['IMU1_Z'] = 0
@@ -349,18 +472,7 @@ def poll_sensors():
         PodStatus.sensor_data['IMU2_Z'] = 0
 
     ### RPI DATA ###
-    rpi_data = psutil.disk_usage('/')
-    PodStatus.sensor_data['RPi_Disk_Space_Free'] = rpi_data.free / (1024 ** 2)
-    PodStatus.sensor_data['RPi_Disk_Space_Used'] = rpi_data.used / (1024 ** 2)
-    PodStatus.sensor_data['RPi_Proc_Load'] = round(psutil.cpu_percent(),1)
-    rpi_data2 = psutil.virtual_memory()
-    PodStatus.sensor_data['RPi_Mem_Load'] = rpi_data2.percent
-    PodStatus.sensor_data['RPi_Mem_Free'] = rpi_data2.free / 2 ** 20
-    PodStatus.sensor_data['RPi_Mem_Used'] = rpi_data2.used / 2 ** 20
-    # temp = os.popen("vcgencmd measure_temp").readline()
-    # temp = temp.replace("temp=",'')
-    # temp = temp.replace("'C",'')
-    # PodStatus.sensor_data['RPi_Temp'] = temp
+    # Polled separately at PodStatus.rpi_rate, see poll_rpi()
 
     ### SPACEX DATA ###
 
@@ -384,37 +496,99 @@ def poll_sensors():
         PodStatus.MET = clock()-PodStatus.MET_starttime
 
 
+def build_acquisition():
+    """
+    Creates the background sensor acquisition.  All I2C reads share the TCA multiplexer,
+    so they run from one bus-scheduled group: each cycle the reads that are due are
+    grouped by TCA channel, so every channel is opened at most once per cycle.
+    """
+    ecs = PodStatus.sensor_poll
+    acq = Acquisition()
+    rates = PodStatus.acq_rates
+    bus = Hyperlynx_ECS.BusScheduler(ecs, rates['imu'])
+    PodStatus.bus_scheduler = bus
+
+    bus.addRead('IMU1', ecs.tcaPVR2, lambda: ecs.getIMUData(1))
+    bus.addRead('IMU2', ecs.tcaPVR2, lambda: ecs.getIMUData(2))
+    bus.addRead('LIDAR', ecs.tcaNOSE, ecs.getLidarDistance, rates['lidar'])
+    bus.addRead('Tube', ecs.tcaNOSE, ecs.getTubeData, rates['nose'])
+    # ADC runs in continuous mode: serviceADC() collects one conversion per cycle and
+    # rotates the mux, the ADC getters only return cached conversions
+    ecs.startADCContinuous()
+    bus.addRead('ADC', ecs.tcaPVR, ecs.serviceADC)
+    bus.addRead('LVBatt_Current', ecs.tcaPVR, ecs.getCurrentLevel, rates['adc'])
+    bus.addRead('LVBatt_Voltage', ecs.tcaPVR, ecs.getVoltageLevel, rates['adc'])
+    bus.addRead('LVBatt_Temp', ecs.tcaPVR, ecs.getBatteryTemp, rates['pv'])
+    bus.addRead('PV_Left', ecs.tcaPVL, lambda: ecs.getBMEdata(2), rates['pv'])
+    bus.addRead('PV_Right', ecs.tcaPVR2, lambda: ecs.getBMEdata(1), rates['pv'])
+
+    def poll_i2c():
+        data = bus.runCycle()
+        data.pop('ADC', None)
+        for imu in ('IMU1', 'IMU2'):
+            if imu in data:
+                tempAccel = data.pop(imu)[0]
+                data[imu + '_X'] = tempAccel[1]
+                data[imu + '_Y'] = tempAccel[2]
+                data[imu + '_Z'] = tempAccel[0]
+        if 'Tube' in data:
+            data['Ambient_Pressure'] = data.pop('Tube')[1]
+        for pv in ('PV_Left', 'PV_Right'):
+            if pv in data:
+                tempPV = data.pop(pv)
+                data[pv + '_Temp'] = tempPV[0]
+                data[pv + '_Pressure'] = tempPV[1]
+        return data
+
+    acq.add_group('i2c', poll_i2c, rates['imu'])
+
+    # Staleness limit of every rate group, from the rate it is read at
+    groups = {'imu': ('IMU1_X', 'IMU1_Y', 'IMU1_Z', 'IMU2_X', 'IMU2_Y', 'IMU2_Z'),
+              'lidar': ('LIDAR',),
+              'nose': ('Ambient_Pressure',),
+              'adc': ('LVBatt_Current', 'LVBatt_Voltage'),
+              'pv': ('LVBatt_Temp', 'PV_Left_Temp', 'PV_Left_Pressure', 'PV_Right_Temp', 'PV_Right_Pressure')}
+    PodStatus.acq_stale_after = {group: (keys, max(PodStatus.acq_stale_periods / rates[group],
+                                                   PodStatus.acq_stale_min))
+                                 for group, keys in groups.items()}
+    return acq
+
+
+def poll_rpi():
+    """
+    Polls Raspberry Pi health stats.  These are slow and non-critical, so they run on
+    their own sub-schedule instead of every control tick.
+    """
+    rpi_data = psutil.disk_usage('/')
+    PodStatus.sensor_data['RPi_Disk_Space_Free'] = rpi_data.free / (1024 ** 2)
+    PodStatus.sensor_data['RPi_Disk_Space_Used'] = rpi_data.used / (1024 ** 2)
+    PodStatus.sensor_data['RPi_Proc_Load'] = round(psutil.cpu_percent(),1)
+    rpi_data2 = psutil.virtual_memory()
+    PodStatus.sensor_data['RPi_Mem_Load'] = rpi_data2.percent
+    PodStatus.sensor_data['RPi_Mem_Free'] = rpi_data2.free / 2 ** 20
+    PodStatus.sensor_data['RPi_Mem_Used'] = rpi_data2.used / 2 ** 20
+    # temp = os.popen("vcgencmd measure_temp").readline()
+    # temp = temp.replace("temp=",'')
+    # temp = temp.replace("'C",'')
+    # PodStatus.sensor_data['RPi_Temp'] = temp
+
+
 def filter_data():
     """ Filters sensor data based on moving average.
     """
-    ### Search all sensor_data points
-    for key in PodStatus.sensor_data:
+    filt = PodStatus.rolling_filter
+    # Keys not fed by the acquisition store (or flight sim) are new every tick
+    fresh = PodStatus.acq_fresh
+    store = PodStatus.acquisition.store
+    if fresh is not None:
+        fresh = [key in fresh or key not in store for key in filt.keys]
+    vals = filt.update([PodStatus.sensor_data[key] for key in filt.keys], fresh)
 
-        ### Refine search to just priority items specified in PodStatus.init()
-        if key in PodStatus.filter_items:
-
-            # If queue is not full, fill queue
-            if len(PodStatus.sensor_filter[str(key)]['q']) < PodStatus.filter_length:
-                PodStatus.sensor_filter[str(key)]['q'] = numpy.append(PodStatus.sensor_filter[str(key)]['q'],
-                                                                      PodStatus.sensor_data[str(key)])
-            else:
-                PodStatus.sensor_filter[str(key)]['std_dev'] = 3*numpy.std(PodStatus.sensor_filter[str(key)]['q'])
-                PodStatus.sensor_filter[str(key)]['mean'] = numpy.mean(PodStatus.sensor_filter[str(key)]['q'])
-
-                # if new value is inside range of std_dev (hence valid), then add to q
-                if abs(PodStatus.sensor_data[str(key)]-PodStatus.sensor_filter[str(key)]['q'][(PodStatus.filter_length-1)]) <= \
-                        PodStatus.sensor_filter[str(key)]['std_dev']:
-
-                    # shift q values over
-                    for i in range(0, (len(PodStatus.sensor_filter[str(key)]['q'])-1)):
-                        PodStatus.sensor_filter[str(key)]['q'][i] = PodStatus.sensor_filter[str(key)]['q'][i+1]
-                    # add new value to end of queue
-                    PodStatus.sensor_filter[str(key)]['q'][(PodStatus.filter_length-1)] = PodStatus.sensor_data[str(key)]
-                    # set the filtered value to the mean of the new queue
-                else:
-                    print('Did not add ' + str(key) + ' to q: ' + str(PodStatus.sensor_data[str(key)]) + str(PodStatus.MET))
-                    print('Current std dev: ' + str(PodStatus.sensor_filter[str(key)]['std_dev']))
-            PodStatus.sensor_filter[str(key)]['val'] = numpy.mean(PodStatus.sensor_filter[str(key)]['q'])
+    for i, key in enumerate(filt.keys):
+        if filt.rejected[i]:
+            print('Did not add ' + str(key) + ' to q: ' + str(PodStatus.sensor_data[key]) + str(PodStatus.MET))
+            print('Current std dev: ' + str(filt.std_dev[i]))
+        PodStatus.sensor_filter[key]['val'] = vals[i]
 
 
 def sensor_fusion():
@@ -583,38 +757,17 @@ def eval_abort():
 
     """
 
-    for key in PodStatus.abort_ranges[PodStatus.state]:     # Search abort_ranges dict for current state
-        # if data is not being filtered, record abort criteria based on raw
-        if not key in PodStatus.sensor_filter[str(key)]:
-            # if out of range, log 'Fault' key as 1
-            if PodStatus.sensor_data[str(key)] < PodStatus.abort_ranges[PodStatus.state][str(key)]['Low'] \
-                    or PodStatus.sensor_data[str(key)] > PodStatus.abort_ranges[PodStatus.state][str(key)]['High']:
-                ### DEBUG PRINT
-                print("Pod Fault!\tSensor: " + str(key))
-                print("Value:\t" + str(PodStatus.sensor_data[str(key)]))
-                print("Range:\t" + str(PodStatus.abort_ranges[PodStatus.state][str(key)]['Low']) +
-                      " to " + str(PodStatus.abort_ranges[PodStatus.state][str(key)]['High']))
-                PodStatus.abort_ranges[PodStatus.state][str(key)]['Fault'] = 1
-        # if data is being filtered, record abort criteria based on filtered data
-        else:
-            # if out of range, log 'Fault' key as 1
-            if PodStatus.sensor_filter[str(key)]['val'] < PodStatus.abort_ranges[PodStatus.state][str(key)]['Low'] \
-                    or PodStatus.sensor_filter[str(key)]['val'] > PodStatus.abort_ranges[PodStatus.state][str(key)]['High']:
-                ### DEBUG PRINT
-                print("Pod Fault!\tSensor: " + str(key))
-                print("Value:\t" + str(PodStatus.sensor_filter[str(key)]['val']))
-                print("Range:\t" + str(PodStatus.abort_ranges[PodStatus.state][str(key)]['Low']) +
-                      " to " + str(PodStatus.abort_ranges[PodStatus.state][str(key)]['High']))
-                PodStatus.abort_ranges[PodStatus.state][str(key)]['Fault'] = 1
-
-    PodStatus.total_triggers = 0
-    PodStatus.total_faults = 0      # Reset total_fault count to 0 each loop
-    # Sum total number of faults for this state
-    for key in PodStatus.abort_ranges[PodStatus.state]:
-        if PodStatus.abort_ranges[PodStatus.state][str(key)]['Fault'] == 1:
-            PodStatus.total_faults += 1
-            if PodStatus.abort_ranges[PodStatus.state][str(key)]['Trigger'] == 1:
-                PodStatus.total_triggers += 1
+    result = PodStatus.abort_engine.evaluate(PodStatus.state, PodStatus.sensor_data)
+    if result is None:
+        return
+    table, out, vals, PodStatus.total_faults, PodStatus.total_triggers = result
+
+    # if out of range, 'Fault' has been latched as 1 in abort_ranges
+    for i in out:
+        ### DEBUG PRINT
+        print("Pod Fault!\tSensor: " + str(table.keys[i]))
+        print("Value:\t" + str(vals[i]))
+        print("Range:\t" + str(table.low[i]) + " to " + str(table.high[i]))
 
     if PodStatus.total_faults > 0:
         PodStatus.Fault = True
@@ -634,7 +787,12 @@ def eval_abort():
 def rec_data():
 
     ### CAN BUS RECEIVE ###
-    bms_data = can_bms.run()
+    # Latest decoded values from the CanBms thread; never waits on the bus
+    if PodStatus.bms is not None:
+        bms_data = PodStatus.bms.values()
+        for name, key in PodStatus.bms.db.targets.items():
+            if name in bms_data:
+                PodStatus.sensor_data[key] = bms_data[name]
 
     ###__ACTUAL GUI__###
     if gui == '2':
@@ -643,8 +801,47 @@ def rec_data():
         # If state = 1, then load all cmd_ext{} and para_ into the PodStatus dicts.
         # If state != 1, then *only* load the cmd_ext['Abort'] value to the PodStatus.cmd_int['Abort'] var.
         # Have a running clock for GUI; if loss of connection > 2 seconds, will abort
+        abort, commands = PodStatus.command_channel.drain()
+
+        for command in commands:
+            cmd_ext = command.get('cmd_ext')
+            if not isinstance(cmd_ext, dict):
+                cmd_ext = {}
+            if PodStatus.state == PodStatus.SafeToApproach:
+                new_cmd = dict(PodStatus.cmd_ext)
+                new_cmd.update((key, val) for key, val in cmd_ext.items() if key in new_cmd)
+                PodStatus.cmd_ext = new_cmd
+                para = command.get('para')
+                for key, val in (para.items() if isinstance(para, dict) else ()):
+                    if key in PodStatus.gui_para_keys:
+                        try:
+                            setattr(PodStatus, key, float(val))
+                        except (TypeError, ValueError):
+                            print("Bad GUI parameter " + str(key) + ": " + repr(val))
+            elif cmd_ext.get('Abort') == 1:
+                # Out of S2A a command can only raise Abort, never clear it
+                PodStatus.cmd_ext['Abort'] = 1
+                PodStatus.cmd_int['Abort'] = 1
+                PodStatus.Abort = True
+
+        # Abort lane last, so no command drained in the same tick can undo it
+        if abort:
+            PodStatus.cmd_ext['Abort'] = 1
+            PodStatus.cmd_int['Abort'] = 1
+            PodStatus.Abort = True
 
-        pass
+        # Connection clock.  In S2A the GUI may not have connected yet; in every other
+        # state a GUI that was never heard from, or went quiet for longer than
+        # heartbeat_timeout, aborts the run.
+        age = PodStatus.command_channel.heartbeat_age()
+        connected = PodStatus.command_channel.connected()
+        if not connected and PodStatus.state != PodStatus.SafeToApproach and PodStatus.Abort is False:
+            print("GUI connection lost (" + (str(round(age, 2)) + " s" if age is not None else "never connected") + ")")
+            print("FLAGGING ABORT == TRUE")
+            PodStatus.Abort = True
+        PodStatus.sensor_data['GUI_Conn'] = int(connected)
+        PodStatus.sensor_data['GUI_Conn_time'] = age if age is not None else -1
+        PodStatus.sensor_data['GUI_Latency'] = PodStatus.command_channel.latency
 
     ###DEBUG CONSOLE GUI###
     if gui == '1':
@@ -836,26 +1033,23 @@ def do_commands():
 
 def spacex_data():
     """
-    This function passes the required SpaceX data packet at the defined rate.
+    This function updates the values in the required SpaceX data packet.  The SpaceXEmitter
+    thread sends the latest values at the defined rate.
     """
     ### CONVERT DATA TO SPACEX SPECIFIED UNIT
     accel = PodStatus.true_data['A']['val'] * 3217.4        # g (unitless) to cm/s2
     speed = PodStatus.true_data['V']['val'] * 30.48         # ft/s to cm/s
     distance = PodStatus.true_data['D']['val'] * 30.48   # ft to cm
 
-    if (clock()-PodStatus.spacex_lastsend) < (1/PodStatus.spacex_rate):
-        # print("No packet sent.")
-        pass
-    else:
-        PodStatus.spacex_lastsend = clock()
-        # print("SpaceX packet sent at " + str(PodStatus.spacex_lastsend))
+    PodStatus.spacex.update(PodStatus.spacex_state, accel, distance, speed, int(PodStatus.stripe_count) // 3048)
+
 
-        ### SpaceX-provided code
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        server = (PodStatus.spacex_server_ip, PodStatus.spacex_server_port)
-        packet = struct.pack(">BB7iI", PodStatus.spacex_team_id, PodStatus.spacex_state, int(accel),
-                             int(distance), int(speed), 0, 0, 0, 0, int(PodStatus.stripe_count) // 3048)
-        sock.sendto(packet, server)
+def send_telemetry():
+    """
+    Hands the data_dump() telemetry dict to the GUI event loop, which encodes it as
+    binary/telemetry-v1 and sends it, so this never waits on the network.
+    """
+    PodStatus.gui_loop.call(PodStatus.telemetry.send_telemetry, PodStatus.data_dump())
 
 
 def send_data():        # Sends data to TCP (GUI) and CAN (BMS/MC)
@@ -963,9 +1157,7 @@ def run_state():
 
     # BRAKE, HIGH SPEED
     elif PodStatus.state == 5:
-        PodStatus.sensor_filter['IMU1_Z']['q'] = []
-        PodStatus.sensor_filter['IMU2_Z']['q'] = []
-        PodStatus.sensor_filter['Brake_Pressure']['q'] = []
+        PodStatus.rolling_filter.reset(['IMU1_Z', 'IMU2_Z', 'Brake_Pressure'])
         PodStatus.MET = clock()-PodStatus.MET_starttime
         PodStatus.spacex_state = 5
 
@@ -1022,9 +1214,7 @@ def run_state():
     # ONLY way to transition() is if LIDAR < 90ft.  Probably needs a 2nd/3rd stop point (time/dist)
     elif PodStatus.state == 6:
         PodStatus.spacex_state = 6
-        PodStatus.sensor_filter['IMU1_Z']['q'] = []
-        PodStatus.sensor_filter['IMU2_Z']['q'] = []
-        PodStatus.sensor_filter['Brake_Pressure']['q'] = []
+        PodStatus.rolling_filter.reset(['IMU1_Z', 'IMU2_Z', 'Brake_Pressure'])
 
         # ACCEL UP TO MAX G within 2%
         if PodStatus.true_data['A']['val'] < (0.98 * PodStatus.para_max_accel)\
@@ -1158,6 +1348,31 @@ def transition():
         PodStatus.Quit = True
 
 
+def build_schedule():
+    """
+    Builds the main loop cyclic executive.  The control path runs every frame at
+    PodStatus.loop_rate and is registered first; slow tasks run on sub-schedules and
+    are deferrable, so they only start when the frame has time left for them.
+    """
+    sched = CyclicExecutive(PodStatus.loop_rate, PodStatus.stage_timer)
+    budget = PodStatus.stage_budgets
+
+    # Control path, every frame
+    for func in (poll_sensors, filter_data, sensor_fusion, run_state, do_commands, eval_abort, rec_data):
+        sched.add_task(func.__name__, func, budget=budget.get(func.__name__))
+
+    # Packet values, every frame; SpaceXEmitter sends them at spacex_rate
+    sched.add_task('spacex_data', spacex_data, budget=budget.get('spacex_data'))
+    sched.add_rate_task('write_file', write_file, PodStatus.log_rate, budget=budget.get('write_file'), deferrable=True)
+
+    # Slow sub-schedules, offset so they do not share a frame
+    sched.add_rate_task('poll_rpi', poll_rpi, PodStatus.rpi_rate, offset=1,
+                        budget=budget.get('poll_rpi'), deferrable=True)
+    sched.add_rate_task('send_telemetry', send_telemetry, PodStatus.telemetry_rate, offset=2,
+                        budget=budget.get('send_telemetry'), deferrable=True)
+    return sched
+
+
 def abort():
     """
     Determines how the pod will abort from each specific state.  Generally, the pod will be
@@ -1193,53 +1408,53 @@ def abort():
 
 def write_file():
     """
-    Stores sensor_data and commands dicts to onboard SD card at the specified rate (10Hz)
+    Queues one record of sensor_data, commands and pod state variables for the binary flight log
+    (see flight_log.py).  Runs at log_rate from the main loop schedule; the file write itself
+    happens on the log_sink thread.
     """
-
-    if (clock() - PodStatus.log_lastwrite) < (1/PodStatus.log_rate):
-        pass
-
-    else:
-        file = open(os.path.join('logs/', PodStatus.file_name), 'a')
-        with file:
-
-            ### Log sensor_data
-            for key in PodStatus.sensor_data:
-                if str(key) in PodStatus.abort_ranges[PodStatus.state]:
-                    fault_code = PodStatus.abort_ranges[PodStatus.state][str(key)]['Fault']
-                else:
-                    fault_code = 0
-
-                line = str(key) + '\t' + str(PodStatus.sensor_data[str(key)]) + '\t' \
-                       + str(int(fault_code)) + '\t' + str(round(clock(),2)) + '\n'
-                file.write(line)
-
-            ### Log commands
-            for key in PodStatus.cmd_ext:
-                line = 'ext_' + str(key) + '\t' + str(PodStatus.cmd_ext[str(key)]) + '\t\t' + str(round(clock(),2)) + '\n'
-                file.write(line)
-            for key in PodStatus.cmd_int:
-                line = 'int_' + str(key) + '\t' + str(PodStatus.cmd_int[str(key)]) + '\t\t' + str(round(clock(),2)) + '\n'
-                file.write(line)
-
-            ### Log pod state variables
-            line = 'state' + '\t' + str(PodStatus.state) + '\t' + str(0) + '\t' + str(round(clock(),2)) + '\n' \
-                    + 'spacex_state' + '\t' + str(PodStatus.spacex_state) + '\t' + str(0) + '\t' + str(round(clock(),2)) + '\n' \
-                    + 'total_faults' + '\t' + str(PodStatus.total_faults) + '\t' + str(0) + '\t' + str(round(clock(),2)) + '\n' \
-                    + 'throttle' + '\t' + str(PodStatus.throttle) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'D' + '\t' + str(PodStatus.true_data['D']['val']) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'V' + '\t' + str(PodStatus.true_data['V']['val']) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'A' + '\t' + str(PodStatus.true_data['A']['val']) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'A_std_dev' + '\t' + str(PodStatus.true_data['A']['std_dev']) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'A_filter_val' + '\t' + str(PodStatus.sensor_filter['IMU1_Z']['val']) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'Clock_interval' + '\t' + str(PodStatus.poll_interval) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'Brakes' + '\t' + str(int(PodStatus.Brakes)) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'HV' + '\t' + str(int(PodStatus.HV)) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n' \
-                    + 'Vent_Sol' + '\t' + str(int(PodStatus.Vent_Sol)) + '\t' + str(0) + '\t' + str(round(clock(), 2)) + '\n'\
-                    + 'stripe_count' + '\t' + str(PodStatus.true_data['stripe_count']) + '\t' + str(0) + '\t' + str(round(clock(),2)) + '\n'
-            file.write(line)
-
-        PodStatus.log_lastwrite = clock()
+    log = PodStatus.flight_log
+    col = 0
+
+    ### Log sensor_data
+    log.set_values(col, PodStatus.log_get_sensors(PodStatus.sensor_data))
+    col += len(PodStatus.log_sensors)
+
+    # Fault codes of the current state's abort ranges
+    log.fault[:] = 0
+    table = PodStatus.abort_engine.tables.get(PodStatus.state)
+    if table is not None:
+        rows = PodStatus.log_fault_rows.get(id(table))
+        if rows is None:
+            index = {key: i for i, key in enumerate(PodStatus.log_sensors)}
+            pairs = [(index[key], i) for i, key in enumerate(table.keys) if key in index]
+            rows = (numpy.array([p[0] for p in pairs], dtype=numpy.intp),
+                    numpy.array([p[1] for p in pairs], dtype=numpy.intp))
+            PodStatus.log_fault_rows[id(table)] = rows
+        log.fault[rows[0]] = table.fault[rows[1]]
+
+    ### Log commands
+    for cmds, keys in zip((PodStatus.cmd_ext, PodStatus.cmd_int), PodStatus.log_cmd_keys):
+        log.set_values(col, [cmds.get(key, 0) for key in keys])
+        col += len(keys)
+
+    ### Log pod state variables
+    log.set_values(col, [PodStatus.state,
+                         PodStatus.spacex_state,
+                         PodStatus.total_faults,
+                         PodStatus.throttle,
+                         PodStatus.true_data['D']['val'],
+                         PodStatus.true_data['V']['val'],
+                         PodStatus.true_data['A']['val'],
+                         PodStatus.true_data['A']['std_dev'],
+                         PodStatus.sensor_filter['IMU1_Z']['val'],
+                         PodStatus.poll_interval,
+                         int(PodStatus.Brakes),
+                         int(PodStatus.HV),
+                         int(PodStatus.Vent_Sol),
+                         PodStatus.true_data['stripe_count']])
+
+    PodStatus.log_lastwrite = clock()
+    PodStatus.log_sink.submit(PodStatus.log_lastwrite)
 
 
 if __name__ == "__main__":
@@ -1259,17 +1474,33 @@ if __name__ == "__main__":
         PodStatus.Quit = True
         print("Failed to init.")
 
+    PodStatus.telemetry = PodLink(PodStatus.gui_server_ip, PodStatus.gui_server_port,
+                                  on_command=PodStatus.command_channel.receive)
+    PodStatus.command_channel.send = PodStatus.telemetry.send_message
+    PodStatus.gui_loop = LoopThread('gui_link')
+    PodStatus.gui_loop.start()
+    PodStatus.gui_loop.submit(PodStatus.telemetry.run())
+
+    PodStatus.spacex = SpaceXEmitter(PodStatus.spacex_server_ip, PodStatus.spacex_server_port,
+                                     PodStatus.spacex_team_id, PodStatus.spacex_rate)
+    PodStatus.spacex.start()
+
+    PodStatus.scheduler = build_schedule()
+
     while PodStatus.Quit is False:
-        write_file()
-        poll_sensors()
-        filter_data()
-        sensor_fusion()
-        run_state()
-        do_commands()
-        eval_abort()
-        rec_data()
-        spacex_data()
-        client.send_message(*addr, 'send_data', PodStatus.data_dump())
+        PodStatus.scheduler.run_frame()
+
+    if PodStatus.acquisition is not None:
+        PodStatus.acquisition.stop()
+    if PodStatus.log_sink is not None:
+        PodStatus.log_sink.close()
+    if PodStatus.stage_timer is not None:
+        PodStatus.stage_timer.dump(os.path.join('logs/', PodStatus.file_name + '.timing.json'))
+    PodStatus.spacex.stop()
+    if PodStatus.bms is not None:
+        PodStatus.bms.stop()
+    PodStatus.gui_loop.call(PodStatus.telemetry.stop)
+    PodStatus.gui_loop.stop()
 
     # DEBUG...REMOVE BEFORE FLIGHT
     print("Quitting")
@@ -4,7 +4,6 @@
 
 import socket
 import pickle
-from queue import Queue
 import random
 import sys
 import os
@@ -19,7 +18,8 @@ from PyQt5 import QtCore, Qt
 from PyQt5.QtWidgets import QMainWindow, QTextEdit, QTableWidget, QPushButton, QCheckBox, QSlider, QApplication, \
     QTableWidgetItem
 from gui_data_simulator import load_abort_ranges
-from network_transfer.libserver import BaseServer, ThreadedServer
+from network_transfer.qt_bridge import QtTelemetryBridge
+from command_channel import CommandSender
 # from SDA import Status
 
 # set up connection
@@ -68,13 +68,21 @@ class HyperGui(QMainWindow):
     def __init__(self, host='localhost', port=5050, **kwargs):
         super().__init__()
 
-        self.data_q = Queue()
         self.host = host
         self.port = port
-        self.server = ThreadedServer(q=self.data_q, host=self.host, port=self.port)
-        self.server.setDaemon(True)
+        # Telemetry arrives through a Qt signal as soon as it is received
+        self.server = QtTelemetryBridge(self.host, self.port, self)
+        self.server.received.connect(self.update_data)
+        self.commander = CommandSender(self.server.send_command)
+        self.server.handle('ack', self.commander.ack)
         self.server.start()
 
+        # Heartbeat to the pod; SDA treats the GUI as lost if it stops
+        self.heartbeat_timer = QtCore.QTimer(self)
+        self.heartbeat_timer.setInterval(200)
+        self.heartbeat_timer.timeout.connect(self.commander.heartbeat)
+        self.heartbeat_timer.start()
+
         # static for testing, need to change with data
         self.state = ''
 
@@ -246,7 +254,8 @@ class HyperGui(QMainWindow):
         self.abort_bttn.resize(90, 90)
         self.abort_bttn.move(250, 180)
 
-        # When you click abort button you stop the thread
+        # When you click abort button the abort is sent on the pod's priority lane, then the thread stops
+        self.abort_bttn.clicked.connect(self.commander.abort)
         self.abort_bttn.clicked.connect(self.stop)
 
         # ******* This is the log text box *******
@@ -394,14 +403,16 @@ class HyperGui(QMainWindow):
     #     self.data_dict['lidar'] = pStatus.sensor_filter['LIDAR']['val']
 
 
+    # Slot for QtTelemetryBridge.received, runs on the GUI thread for every frame
+    def update_data(self, value):
+        if isinstance(value, dict):
+            self.data_dict.update(value)
+
     # This function is running on the thread separate from initializing the gui
     def update_txt(self):
         # Random number generator
         test_val = random.uniform(0, 3)
 
-        # check for new data
-        if not self.data_q.empty():
-            self.data_dict.update(self.data_q.get())
         #     pstatus = pickle.loads(self.data_q.get())
         #     self._read_status(pstatus)
 
@@ -0,0 +1,98 @@
+'''
+   HyperLynx: abort_engine.py
+
+   Purpose:
+   Vectorized evaluation of the abortranges.dat limits for eval_abort().
+
+   Details:
+   The per-state abort_ranges dicts built in SDA.init() are compiled once into
+   NumPy arrays (low, high, trigger mask, latched fault, sensor index).  Every
+   sensor named in any state is gathered from sensor_data into one dense array
+   with a single itemgetter call, and each state's limits are then checked
+   with one comparison, so the cost per tick stays flat as rows are added.
+
+   Faults latch, as they did in the dict version: once a row has faulted it
+   stays faulted.  Newly and currently out of range rows are written back as
+   'Fault' = 1 in the abort_ranges dicts so the log and run_state() still see
+   them there.
+'''
+
+from operator import itemgetter
+import numpy
+
+
+class AbortTable():
+    '''
+    Compiled abort limits for one state.
+
+    Inputs:
+        ranges (dict):  abort_ranges[state], {key: {'Low', 'High', 'Trigger', 'Fault'}}
+        index (dict):   {key: column in the dense sensor array}
+    '''
+    def __init__(self, ranges, index):
+        self.keys = list(ranges)
+        self.rows = [ranges[key] for key in self.keys]
+        self.index = numpy.array([index[key] for key in self.keys], dtype=numpy.intp)
+        self.low = numpy.array([row['Low'] for row in self.rows], dtype=float)
+        self.high = numpy.array([row['High'] for row in self.rows], dtype=float)
+        self.trigger = numpy.array([row['Trigger'] == 1 for row in self.rows], dtype=bool)
+        self.fault = numpy.array([row['Fault'] == 1 for row in self.rows], dtype=bool)
+
+    def check(self, values):
+        '''
+        Compares the dense sensor array against this state's limits.  Returns
+        the rows that are out of range on this tick and latches them as faults.
+        '''
+        vals = values[self.index]
+        out = (vals < self.low) | (vals > self.high)
+        self.fault |= out
+        return numpy.flatnonzero(out), vals
+
+
+class AbortEngine():
+    '''
+    Inputs:
+        abort_ranges (dict):    {state: {key: {'Low', 'High', 'Trigger', 'Fault'}}}
+    '''
+    def __init__(self, abort_ranges):
+        self.sensor_keys = []
+        index = {}
+        for state in abort_ranges:
+            for key in abort_ranges[state]:
+                if key not in index:
+                    index[key] = len(self.sensor_keys)
+                    self.sensor_keys.append(key)
+        self.values = numpy.zeros(len(self.sensor_keys))
+        self._gather = itemgetter(*self.sensor_keys) if self.sensor_keys else None
+
+        # States sharing one ranges dict (PreLaunch and Launching) share one table
+        self.tables = {}
+        compiled = {}
+        for state in abort_ranges:
+            ranges = abort_ranges[state]
+            if id(ranges) not in compiled:
+                compiled[id(ranges)] = AbortTable(ranges, index)
+            self.tables[state] = compiled[id(ranges)]
+
+    def gather(self, sensor_data):
+        '''
+        Copies every abort sensor out of sensor_data into the dense value array.
+        '''
+        if self._gather is not None:
+            self.values[:] = numpy.atleast_1d(self._gather(sensor_data))
+        return self.values
+
+    def evaluate(self, state, sensor_data):
+        '''
+        Returns (table, out_rows, vals, total_faults, total_triggers) for the
+        given state, or None if the state has no abort ranges.
+        '''
+        table = self.tables.get(state)
+        if table is None:
+            return None
+        out, vals = table.check(self.gather(sensor_data))
+        for i in out:
+            table.rows[i]['Fault'] = 1
+        total_faults = int(numpy.count_nonzero(table.fault))
+        total_triggers = int(numpy.count_nonzero(table.fault & table.trigger))
+        return table, out, vals, total_faults, total_triggers
@@ -0,0 +1,177 @@
+'''
+   HyperLynx: acquisition.py
+
+   Purpose:
+   Background sensor acquisition, decoupled from the SDA control loop.
+
+   Details:
+   Each sensor group runs its poll function on its own thread at its own rate
+   and publishes timestamped samples into a LatestValueStore.  poll_sensors()
+   then only copies the latest values out of the store, so the state machine
+   is no longer paced by the slowest peripheral.  Since the loop may run
+   faster than a group, newer() returns only the samples published since the
+   last copy, and age() tells a hung group from a slow one.
+
+   All groups on the I2C bus share one bus lock, since every read goes through
+   the TCA9548A multiplexer and HyperlynxECS.currentBus must stay consistent
+   with the channel that is actually open.
+'''
+
+import threading
+from time import perf_counter, sleep
+
+
+class LatestValueStore():
+    '''
+    Holds the most recent (value, timestamp) for each sensor key.
+
+    Each key is written by exactly one group, and a single dict item assignment
+    is atomic in CPython, so readers never need to take a lock.
+    '''
+    def __init__(self):
+        self._data = {}
+
+    def publish(self, values, stamp=None):
+        if stamp is None:
+            stamp = perf_counter()
+        for key in values:
+            self._data[key] = (values[key], stamp)
+
+    def get(self, key, default=0):
+        try:
+            return self._data[key][0]
+        except KeyError:
+            return default
+
+    def stamp(self, key):
+        try:
+            return self._data[key][1]
+        except KeyError:
+            return None
+
+    def age(self, key):
+        '''Seconds since key was last published, None if never published.'''
+        stamp = self.stamp(key)
+        if stamp is None:
+            return None
+        return perf_counter() - stamp
+
+    def values(self):
+        return {key: sample[0] for key, sample in list(self._data.items())}
+
+    def newer(self, stamps):
+        '''
+        Returns {key: value} for every key published since the stamp recorded
+        for it in stamps ({key: stamp}), and records the new stamps there.
+        '''
+        fresh = {}
+        for key, (value, stamp) in list(self._data.items()):
+            if stamps.get(key) != stamp:
+                stamps[key] = stamp
+                fresh[key] = value
+        return fresh
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class SensorGroup(threading.Thread):
+    '''
+    Polls one group of sensors at a fixed rate on a daemon thread.
+
+    Inputs:
+        name (str):     group name, used for stats
+        poll (func):    returns a dict of {sensor_data key: value}
+        rate (float):   poll rate [Hz]
+        store (LatestValueStore): where samples are published
+        lock (Lock):    shared bus lock held while poll() runs, or None
+    '''
+    def __init__(self, name, poll, rate, store, lock=None):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.poll = poll
+        self.period = 1.0 / rate
+        self.store = store
+        self.lock = lock
+        self._stop_event = threading.Event()
+
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self.last_time = 0          # [s] duration of last poll, including bus lock wait
+        self.max_time = 0
+
+    def run(self):
+        deadline = perf_counter()
+        while not self._stop_event.is_set():
+            t0 = perf_counter()
+            try:
+                if self.lock is not None:
+                    with self.lock:
+                        values = self.poll()
+                else:
+                    values = self.poll()
+            except Exception as e:
+                self.errors += 1
+                print("Acquisition error in group " + str(self.name) + ": " + repr(e))
+            else:
+                self.store.publish(values)
+                self.samples += 1
+            now = perf_counter()
+            self.last_time = now - t0
+            if self.last_time > self.max_time:
+                self.max_time = self.last_time
+
+            deadline += self.period
+            if now > deadline:
+                self.overruns += 1
+                deadline = now
+            else:
+                sleep(deadline - now)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {'samples': self.samples,
+                'errors': self.errors,
+                'overruns': self.overruns,
+                'last': round(self.last_time, 6),
+                'max': round(self.max_time, 6)}
+
+
+class Acquisition():
+    '''
+    Collection of SensorGroups publishing into a shared LatestValueStore.
+    '''
+    def __init__(self, store=None):
+        self.store = store if store is not None else LatestValueStore()
+        self.bus_lock = threading.Lock()
+        self.groups = []
+
+    def add_group(self, name, poll, rate, uses_bus=True):
+        group = SensorGroup(name, poll, rate, self.store, self.bus_lock if uses_bus else None)
+        self.groups.append(group)
+        return group
+
+    def start(self):
+        for group in self.groups:
+            group.start()
+
+    def stop(self):
+        for group in self.groups:
+            group.stop()
+        for group in self.groups:
+            group.join(timeout=1)
+
+    def wait_ready(self, timeout=2):
+        '''Blocks until every group has published at least once.  Returns True if ready.'''
+        end = perf_counter() + timeout
+        while perf_counter() < end:
+            if all(group.samples > 0 for group in self.groups):
+                return True
+            sleep(0.005)
+        return False
+
+    def stats(self):
+        return {group.name: group.stats() for group in self.groups}
@@ -1,75 +1,171 @@
-#!/usr/bin/python3
-#
-# simple_rx_test.py
-#
-# This is simple CAN receive python program. All messages received are printed out on screen.
-# For use with PiCAN boards on the Raspberry Pi
-# http://skpang.co.uk/catalog/pican2-canbus-board-for-raspberry-pi-2-p-1475.html
-#
-# Make sure Python-CAN is installed first http://skpang.co.uk/blog/archives/1220
-#
-# 01-02-16 SK Pang
-#
-# https://github.com/skpang/PiCAN-Python-examples/blob/master/simple_rx_test.py
-#
+'''
+   HyperLynx: can_bms.py
 
-import can
-import time
-import os
+   Purpose:
+   Receives and decodes the Orion BMS CAN broadcast messages for SDA.
+
+   Details:
+   CanBms opens the bus once and receives on a daemon thread (or with poll(),
+   which only reads frames that are already waiting), so rec_data() never
+   blocks on the CAN bus.  Frames are decoded through a can_signals.CanSignalDB
+   (can_signals.dat by default), keyed by arbitration id, into a
+   LatestValueStore holding the latest value of every signal.  Per id it
+   keeps a frame count, the receive rate and staleness (age of the last
+   frame, and how often the id went quiet for longer than stale_after).
+   FailsafeStatus is a bitmask, also decoded to text with failsafemap.
 
-def run(object):
-    print('\n\rCAN Rx test')
-    print('Bring up CAN0....')
-    os.system("sudo /sbin/ip link set can0 up type can bitrate 500000")
-    time.sleep(0.1)
+   Bringing the interface up (bring_up()) needs root and is kept separate
+   from opening the bus.  For tests, pass a python-can virtual bus:
+       CanBms(bus=can.Bus('test', interface='virtual'))
 
-    try:
-        bus = can.interface.Bus(channel='can0', bustype='socketcan_native')
-    except OSError:
-        print('Cannot find PiCAN board.')
-        exit()
+   Originally based on SK Pang's PiCAN simple_rx_test.py.
+'''
 
-    print('Ready')
+import os
+import threading
+from time import perf_counter, sleep
+import can
+from acquisition import LatestValueStore
+from can_signals import CanSignalDB
 
-    datamap = {0x6B0:{'name':'PopulatedCells', 'val_float':0, 'mult':1},
-               0x6B1:{'name':'PackSumVoltage', 'val_float':0, 'mult':10},
-               0x6B2:{'name':'AvgCellVoltage', 'val_float':0, 'mult':10000},
-               0x6B3:{'name':'FailsafeStatus', 'val_float':0, 'mult':1, 'val_str':'None'},
+SIGNAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'can_signals.dat')
+
+failsafemap = {0x00: 'No failsafe active',
+               0x01: 'Voltage failsafe active',
+               0x02: 'Current failsafe active',
+               0x04: 'Relay failsafe active',
+               0x08: 'Cell balancing active (non-failsafe mode)',
+               0x10: 'Charge interlock failsafe active',
+               0x20: 'Thermistor B-value table invalid',
+               0x40: 'Input power supply failsafe active'
                }
-    failsafemap = {0x00:'No failsafe active',
-                   0x01:'Voltage failsafe active',
-                   0x02:'Current failsafe active',
-                   0x04:'Relay failsafe active',
-                   0x08:'Cell balancing active (non-failsafe mode)',
-                   0x10:'Charge interlock failsafe active',
-                   0x20:'Thermistor B-value table invalid',
-                   0x40:'Input power supply failsafe active'
-                   }
-
-    try:
-        while True:
-            message = bus.recv()  # Wait until a message is received.
 
-            c = '{0:f} {1:x} {2:x} '.format(message.timestamp, message.arbitration_id, message.dlc)
-            arb_ID = message.arbitration_id
-            s = ''
-            for i in range(message.dlc):
-                s += '{0:x} '.format(message.data[i])
 
-            print(' {}'.format(c + s))
-            value = float(s,16)
-            for key in datamap:
-                if arb_ID == key:
-                    datamap[key]['val_float'] = float(s) * datamap[key]['mult']
-                    print(datamap[0x6B3])
-                    if arb_ID == 0x6B3:
-                        datamap[0x6B3]['val_str'] = failsafemap[s]
+def bring_up(channel='can0', bitrate=500000):
+    '''Sets the socketcan interface up.  Needs sudo; only call once at boot.'''
+    os.system("sudo /sbin/ip link set " + channel + " up type can bitrate " + str(bitrate))
+    sleep(0.1)
+
+
+def failsafe_text(status):
+    '''Returns the active failsafes in a FailsafeStatus bitmask as text.'''
+    status = int(status)
+    if status == 0:
+        return failsafemap[0x00]
+    return ', '.join(text for bit, text in failsafemap.items() if bit and status & bit)
+
+
+class CanBms(threading.Thread):
+    '''
+    Inputs:
+        channel (str):          CAN interface, used if bus is None
+        interface (str):        python-can interface type, used if bus is None
+        bus (can.BusABC):       already opened bus, e.g. a virtual bus for testing
+        db (CanSignalDB):       signal database, loaded from SIGNAL_FILE if None
+        stale_after (float):    [s] age after which an id counts as stale
+    '''
+    def __init__(self, channel='can0', interface='socketcan', bus=None, db=None, stale_after=1.0):
+        threading.Thread.__init__(self, name='can_bms')
+        self.daemon = True
+        if bus is None:
+            bus = can.Bus(channel=channel, interface=interface)
+        self.bus = bus
+        self.db = db if db is not None else CanSignalDB.from_file(SIGNAL_FILE)
+        self.stale_after = stale_after
+        self.store = LatestValueStore()
+        self._stop_event = threading.Event()
+
+        self.frames = 0
+        self.unknown = 0                # frames with an id not in the signal database
+        self.short = 0                  # frames too short for their signals
+        self.errors = 0
+        self.counts = {arb_id: 0 for arb_id in self.db.frames}
+        self.gaps = {arb_id: 0 for arb_id in self.db.frames}    # times an id went stale
+        self._values = {}               # decode buffer, reused for every frame
+        self._last = {}                 # {arb_id: perf_counter() of the last frame}
+        self._last_stamp = {}           # {arb_id: bus timestamp of the last frame}
+        self._interval = {}             # {arb_id: [s] smoothed time between frames}
+
+    def handle(self, message):
+        '''Decodes one received frame into the store.'''
+        now = perf_counter()
+        self.frames += 1
+        arb_id = message.arbitration_id
+        frame = self.db.frames.get(arb_id)
+        if frame is None:
+            self.unknown += 1
+            return
+        values = self._values
+        values.clear()
+        if not frame.decode(message.data, values):
+            self.short += 1
+            return
+        self.store.publish(values, now)
+        if 'FailsafeStatus' in values:
+            self.store.publish({'FailsafeText': failsafe_text(values['FailsafeStatus'])}, now)
+
+        # Rate from the bus timestamps, so frames handled in a batch by poll() still count correctly
+        stamp = message.timestamp or now
+        last = self._last_stamp.get(arb_id)
+        if last is not None:
+            interval = stamp - last
+            if interval > self.stale_after:
+                self.gaps[arb_id] += 1
+            previous = self._interval.get(arb_id)
+            self._interval[arb_id] = interval if previous is None else previous + 0.1 * (interval - previous)
+        self._last_stamp[arb_id] = stamp
+        self._last[arb_id] = now
+        self.counts[arb_id] += 1
+
+    def poll(self):
+        '''
+        Handles every frame already waiting on the bus without blocking.
+        Returns the number of frames handled.  Use instead of start().
+        '''
+        n = 0
+        while True:
+            message = self.bus.recv(timeout=0)
+            if message is None:
+                return n
+            self.handle(message)
+            n += 1
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self.bus.recv(timeout=0.1)
+            except can.CanError as e:
+                self.errors += 1
+                print("CAN receive error: " + repr(e))
+                sleep(0.1)
+                continue
+            if message is not None:
+                self.handle(message)
 
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.bus.shutdown()
 
+    def values(self):
+        '''Returns {signal name: latest value}.'''
+        return self.store.values()
 
-    except KeyboardInterrupt:
-        # Catch keyboard interrupt
-        os.system("sudo /sbin/ip link set can0 down")
-        print('\n\rKeyboard interrtupt')
+    def age(self, name):
+        return self.store.age(name)
 
-    return(datamap)
\ No newline at end of file
+    def stats(self):
+        now = perf_counter()
+        ids = {}
+        for arb_id in self.db.frames:
+            last = self._last.get(arb_id)
+            interval = self._interval.get(arb_id)
+            age = now - last if last is not None else -1
+            ids[hex(arb_id)] = {'count': self.counts[arb_id],
+                                'rate': round(1.0 / interval, 2) if interval else 0,
+                                'age': round(age, 3),
+                                'stale': int(last is None or age > self.stale_after),
+                                'gaps': self.gaps[arb_id]}
+        return {'frames': self.frames, 'unknown': self.unknown, 'short': self.short, 'errors': self.errors,
+                'ids': ids}
@@ -0,0 +1,138 @@
+'''
+   HyperLynx: can_signals.py
+
+   Purpose:
+   Declarative CAN signal database, compiled to struct unpackers per
+   arbitration id.
+
+   Details:
+   Signals are listed in a tab separated file (can_signals.dat), one row per
+   signal:
+       ID          arbitration id, e.g. 0x6B1
+       Signal      signal name
+       Start       first data byte
+       Length      bytes: 1, 2, 4 or 8
+       Byte order  big or little
+       Signed      1 for two's complement, 0 for unsigned
+       Scale       value = raw * Scale + Offset
+       Offset
+       Key         sensor_data key the value is copied to (blank for none)
+
+   At load time the signals of each id are compiled into one struct.Struct
+   (pad bytes between signals), so decoding a frame is one dict lookup and
+   one unpack_from() on the received buffer.  Ids whose signals overlap or mix
+   byte orders get one Struct per signal instead.
+'''
+
+import struct
+from collections import namedtuple
+
+Signal = namedtuple('Signal', 'arb_id name start length byteorder signed scale offset key')
+
+_CODES = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+_ORDER = {'big': '>', 'little': '<'}
+
+
+def load_signals(path):
+    '''
+    Reads a signal database file.  Returns a list of Signal.
+    '''
+    signals = []
+    with open(path) as file:
+        file.readline()         # header
+        for line in file:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            fields += [''] * (9 - len(fields))
+            signals.append(Signal(arb_id=int(fields[0], 0),
+                                  name=fields[1].strip(),
+                                  start=int(fields[2]),
+                                  length=int(fields[3]),
+                                  byteorder=fields[4].strip().lower(),
+                                  signed=bool(int(fields[5])),
+                                  scale=float(fields[6]),
+                                  offset=float(fields[7]),
+                                  key=fields[8].strip() or None))
+    return signals
+
+
+def _code(signal):
+    if signal.length not in _CODES:
+        raise ValueError('CAN signal {} has unsupported length {}'.format(signal.name, signal.length))
+    if signal.byteorder not in _ORDER:
+        raise ValueError('CAN signal {} has unknown byte order {}'.format(signal.name, signal.byteorder))
+    code = _CODES[signal.length]
+    return code if signal.signed else code.upper()
+
+
+class FrameDecoder():
+    '''
+    Decoder for all signals carried by one arbitration id.
+    '''
+    def __init__(self, arb_id, signals):
+        self.arb_id = arb_id
+        self.signals = sorted(signals, key=lambda signal: signal.start)
+        self.names = tuple(signal.name for signal in self.signals)
+        self.scales = tuple(signal.scale for signal in self.signals)
+        self.offsets = tuple(signal.offset for signal in self.signals)
+        self.size = max(signal.start + signal.length for signal in self.signals)
+
+        orders = set(signal.byteorder for signal in self.signals)
+        overlap = any(a.start + a.length > b.start for a, b in zip(self.signals, self.signals[1:]))
+        if len(orders) == 1 and not overlap:
+            fmt = _ORDER[orders.pop()]
+            pos = 0
+            for signal in self.signals:
+                fmt += 'x' * (signal.start - pos) + _code(signal)
+                pos = signal.start + signal.length
+            self.struct = struct.Struct(fmt)
+            self.parts = None
+        else:
+            self.struct = None
+            self.parts = [(struct.Struct(_ORDER[signal.byteorder] + _code(signal)), signal.start)
+                          for signal in self.signals]
+
+    def unpack(self, data):
+        '''Returns the raw signal values, in self.names order.'''
+        if self.struct is not None:
+            return self.struct.unpack_from(data)
+        return tuple(part.unpack_from(data, start)[0] for part, start in self.parts)
+
+    def decode(self, data, out):
+        '''
+        Writes {name: scaled value} for every signal into out.  Returns False
+        if data is too short for the signals.
+        '''
+        if len(data) < self.size:
+            return False
+        for name, raw, scale, offset in zip(self.names, self.unpack(data), self.scales, self.offsets):
+            out[name] = raw * scale + offset
+        return True
+
+
+class CanSignalDB():
+    '''
+    Inputs:
+        signals (list):     Signal rows, e.g. from load_signals()
+    '''
+    def __init__(self, signals):
+        self.signals = list(signals)
+        by_id = {}
+        for signal in self.signals:
+            by_id.setdefault(signal.arb_id, []).append(signal)
+        self.frames = {arb_id: FrameDecoder(arb_id, sigs) for arb_id, sigs in by_id.items()}
+        self.targets = {signal.name: signal.key for signal in self.signals if signal.key}
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_signals(path))
+
+    def decode(self, arb_id, data, out):
+        '''
+        Decodes one frame into out.  Returns False for unknown ids and short frames.
+        '''
+        frame = self.frames.get(arb_id)
+        if frame is None:
+            return False
+        return frame.decode(data, out)
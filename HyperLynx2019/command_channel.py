@@ -0,0 +1,165 @@
+'''
+   HyperLynx: command_channel.py
+
+   Purpose:
+   GUI -> pod command path for SDA.rec_data(), with heartbeat and latency
+   tracking.
+
+   Details:
+   The ground station (CommandSender) sends three text/json actions over the
+   telemetry connection:
+       'command'   {'seq', 'sent', 'cmd_ext': {...}, 'para': {...}}
+       'abort'     {'seq', 'sent'}
+       'heartbeat' {'seq', 'sent', 'rtt'}
+   'sent' is the ground station's time.monotonic().  The pod acks every
+   command and heartbeat by echoing seq and sent, so the ground station
+   measures the round trip on its own clock and reports it back in the next
+   heartbeat; the pod takes half of it as the GUI -> pod latency.  No clock
+   sync between the two machines is needed.
+
+   CommandChannel.receive() runs on the network thread and only appends to a
+   deque.  rec_data() calls drain() once per tick, which never blocks.  Abort
+   has its own lane: it is latched in a flag as soon as it is received and
+   drain() reports it before, and regardless of, any queued commands.
+'''
+
+import collections
+import time
+
+
+class CommandChannel():
+    '''
+    Pod side.
+
+    Inputs:
+        send (func):                send(action, value) back to the ground station, for acks
+        heartbeat_timeout (float):  [s] heartbeat age after which the GUI counts as disconnected
+        maxlen (int):               commands kept if rec_data() falls behind (oldest dropped)
+    '''
+    def __init__(self, send=None, heartbeat_timeout=2.0, maxlen=64):
+        self.send = send
+        self.heartbeat_timeout = heartbeat_timeout
+        self._queue = collections.deque(maxlen=maxlen)
+        self._abort = None                  # (seq, received) of a pending abort
+
+        self.last_heartbeat = None          # [s] local monotonic time of last heartbeat
+        self.last_seq = -1                  # last command seq applied
+        self.latency = 0                    # [s] GUI -> pod, half the last round trip
+        self.received = 0
+        self.stale = 0                      # out of order / duplicate commands ignored
+        self.aborts = 0
+
+    def receive(self, request):
+        '''
+        Called from the network thread for every frame from the ground station.
+        '''
+        if not isinstance(request, dict):
+            return
+        action = request.get('action')
+        value = request.get('value')
+        if not isinstance(value, dict):
+            value = {}
+        now = time.monotonic()
+
+        if action == 'abort':
+            self._abort = (value.get('seq'), now)
+            self.aborts += 1
+        elif action == 'command':
+            self._queue.append(value)
+        elif action == 'heartbeat':
+            rtt = value.get('rtt')
+            if rtt is not None:
+                self.latency = rtt / 2
+        else:
+            return
+        self.received += 1
+        self.last_heartbeat = now           # any frame from the GUI proves the link is up
+        if self.send is not None and 'seq' in value:
+            self.send('ack', {'seq': value['seq'], 'sent': value.get('sent')})
+
+    def drain(self):
+        '''
+        Returns (abort, commands): abort is True if an abort was received since
+        the last call; commands is the list of new commands, oldest first,
+        with stale sequence numbers removed.
+        '''
+        abort = self._abort is not None
+        self._abort = None
+
+        commands = []
+        while self._queue:
+            command = self._queue.popleft()
+            seq = command.get('seq', self.last_seq + 1)
+            if seq <= self.last_seq:
+                self.stale += 1
+                continue
+            self.last_seq = seq
+            commands.append(command)
+        return abort, commands
+
+    def heartbeat_age(self):
+        '''[s] since the last frame from the GUI, None if nothing received yet.'''
+        if self.last_heartbeat is None:
+            return None
+        return time.monotonic() - self.last_heartbeat
+
+    def connected(self):
+        age = self.heartbeat_age()
+        return age is not None and age <= self.heartbeat_timeout
+
+    def stats(self):
+        age = self.heartbeat_age()
+        return {'connected': self.connected(),
+                'heartbeat_age': round(age, 3) if age is not None else -1,
+                'latency': round(self.latency, 6),
+                'received': self.received,
+                'last_seq': self.last_seq,
+                'stale': self.stale,
+                'aborts': self.aborts}
+
+
+class CommandSender():
+    '''
+    Ground station side.  Builds sequence numbered commands and heartbeats and
+    measures round trip time from the pod's acks.
+
+    Inputs:
+        send (func):    send(action, value) to the pod, e.g. QtTelemetryBridge.send_command
+    '''
+    def __init__(self, send):
+        self.send = send
+        self.seq = 0
+        self.rtt = None                     # [s] last measured round trip
+        self.max_rtt = 0
+        self.acks = 0
+
+    def _next(self):
+        self.seq += 1
+        return {'seq': self.seq, 'sent': time.monotonic()}
+
+    def command(self, cmd_ext, para=None):
+        '''Sends the complete cmd_ext dict (and flight parameters) as one command.'''
+        value = self._next()
+        value['cmd_ext'] = dict(cmd_ext)
+        value['para'] = dict(para) if para else {}
+        self.send('command', value)
+        return value['seq']
+
+    def abort(self):
+        value = self._next()
+        self.send('abort', value)
+        return value['seq']
+
+    def heartbeat(self):
+        value = self._next()
+        value['rtt'] = self.rtt
+        self.send('heartbeat', value)
+
+    def ack(self, value, *args):
+        '''Handler for 'ack' frames from the pod.'''
+        sent = value.get('sent') if isinstance(value, dict) else None
+        if sent is None:
+            return
+        self.rtt = time.monotonic() - sent
+        self.max_rtt = max(self.max_rtt, self.rtt)
+        self.acks += 1
@@ -0,0 +1,337 @@
+'''
+   HyperLynx: flight_log.py
+
+   Purpose:
+   Binary columnar flight log for SDA, plus a converter back to the
+   tab-separated Label/Value/Fault/Time text log.
+
+   Details:
+   File layout:
+       8 bytes     magic, b'HLXLOG\x01\n'
+       4 bytes     header length, little endian uint32
+       N bytes     JSON header: column names, number of fault columns and the
+                   columns that have no fault field (commands)
+       records     one fixed size record per log tick:
+                       float64     time [s]
+                       float64     value of every column
+                       uint8       fault code of the first n_fault columns
+
+   Records are written through one persistent buffered handle, which is
+   flushed and fsync'd every fsync_interval seconds instead of reopening the
+   file on every write.  The schema is fixed when the log is created; values
+   that cannot be converted to float are logged as NaN.
+
+   AsyncLogSink moves the file writes off the control thread: the main loop
+   only packs the record into bytes and puts it on a bounded queue.  If the
+   writer thread falls behind (SD card stall) records are dropped and counted
+   rather than blocking the loop.  The sink also opens the file, and
+   rotate() hands it the next log: the old file is synced and closed and the
+   new one opened on the sink thread, in queue order.
+
+   Usage:
+       python flight_log.py logs/log_2019521818.hlx [out.tsv]
+'''
+
+import json
+import os
+import struct
+import sys
+import threading
+import queue
+from time import perf_counter
+import numpy
+
+MAGIC = b'HLXLOG\x01\n'
+_HEADER_LEN = struct.Struct('<I')
+
+
+def record_dtype(n_columns, n_fault):
+    return numpy.dtype([('time', '<f8'),
+                        ('value', '<f8', (n_columns,)),
+                        ('fault', 'u1', (n_fault,))])
+
+
+class FlightLogWriter():
+    '''
+    Inputs:
+        path (str):             log file to create
+        columns (list):         column names, in record order
+        n_fault (int):          the first n_fault columns carry a fault code
+        no_fault (list):        columns converted with a blank Fault field
+        fsync_interval (float): [s] how often buffered records are synced to disk
+        buffering (int):        write buffer size [bytes]
+        open_now (bool):        create the file now; False leaves it to open() (AsyncLogSink does this)
+    '''
+    def __init__(self, path, columns, n_fault=0, no_fault=(), fsync_interval=1.0, buffering=65536,
+                 open_now=True):
+        self.path = path
+        self.columns = list(columns)
+        self.n_fault = n_fault
+        self.fsync_interval = fsync_interval
+        self.dtype = record_dtype(len(self.columns), n_fault)
+
+        # One reusable record; value and fault are views into it
+        self._record = numpy.zeros(1, dtype=self.dtype)
+        self.value = self._record['value'][0]
+        self.fault = self._record['fault'][0]
+
+        self.records = 0
+        self.bad_values = 0             # values logged as NaN
+        self.syncs = 0
+        self.max_sync_time = 0          # [s] worst flush + fsync
+
+        self._header = json.dumps({'columns': self.columns,
+                                   'n_fault': n_fault,
+                                   'no_fault': list(no_fault)}).encode('utf-8')
+        self._buffering = buffering
+        self._file = None
+        self._last_sync = perf_counter()
+        if open_now:
+            self.open()
+
+    def open(self):
+        '''
+        Creates the log file and writes the header.
+        '''
+        self._file = open(self.path, 'wb', buffering=self._buffering)
+        self._file.write(MAGIC)
+        self._file.write(_HEADER_LEN.pack(len(self._header)))
+        self._file.write(self._header)
+        self._last_sync = perf_counter()
+
+    def set_values(self, start, values):
+        '''
+        Copies a sequence of values into columns [start, start + len(values)).
+        '''
+        stop = start + len(values)
+        try:
+            self.value[start:stop] = values
+        except (TypeError, ValueError):
+            for i, val in enumerate(values):
+                try:
+                    self.value[start + i] = val
+                except (TypeError, ValueError):
+                    self.value[start + i] = numpy.nan
+                    self.bad_values += 1
+
+    def pack(self, stamp):
+        '''
+        Returns the current record (self.value / self.fault) with timestamp stamp as bytes.
+        '''
+        self._record['time'] = stamp
+        return self._record.tobytes()
+
+    def write(self, stamp):
+        '''
+        Appends the current record (self.value / self.fault) with timestamp stamp.
+        '''
+        self._record['time'] = stamp
+        self.write_packed(self._record.data)
+
+    def write_packed(self, data):
+        '''
+        Appends one record returned by pack().
+        '''
+        self._file.write(data)
+        self.records += 1
+        if perf_counter() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        t0 = perf_counter()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = perf_counter()
+        self.syncs += 1
+        if self._last_sync - t0 > self.max_sync_time:
+            self.max_sync_time = self._last_sync - t0
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+class AsyncLogSink(threading.Thread):
+    '''
+    Writes records for a FlightLogWriter on a daemon thread.
+
+    Inputs:
+        writer (FlightLogWriter):   log to write, owned by the sink once started;
+                                    opened by the sink if it is not open yet
+        maxsize (int):              queue length [records] before records are dropped
+        history (int):              number of recent write latencies kept for percentiles
+    '''
+    def __init__(self, writer, maxsize=2000, history=1000):
+        threading.Thread.__init__(self, name='log_sink')
+        self.daemon = True
+        self.writer = writer                    # log that submit() packs records for
+        self._current = writer                  # log the sink thread is writing
+        self.maxsize = maxsize
+        # Unbounded so rotate() and close() never wait; submit() enforces maxsize
+        self.queue = queue.Queue()
+
+        # Each counter is written by one thread only: submitted, dropped and accepted
+        # by the caller of submit(), the rest by the sink thread
+        self.submitted = 0
+        self.dropped = 0
+        self.accepted = 0                       # records queued
+        self.taken = 0                          # records taken off the queue
+        self.lost = 0                           # records dropped because the log could not be opened
+        self.written = 0
+        self.max_depth = 0
+        self.rotations = 0
+        self._sync_max = 0                      # [s] worst sync of the logs already closed
+        self._latency = numpy.zeros(history)    # [s] recent write times, ring buffer
+        self._latency_pos = 0
+
+    def submit(self, stamp):
+        '''
+        Queues the writer's current record.  Never blocks; returns False if the
+        record was dropped because the queue is full.
+        '''
+        self.submitted += 1
+        if self.accepted - self.taken >= self.maxsize:
+            self.dropped += 1
+            return False
+        self.queue.put_nowait(self.writer.pack(stamp))
+        self.accepted += 1
+        depth = self.accepted - self.taken      # records only, not rotation markers
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def rotate(self, writer, after=None):
+        '''
+        Switches to a new log without blocking.  Records submitted so far go
+        to the old log; the sink thread then closes it, opens the new one and
+        calls after() (if given), still on the sink thread.
+        '''
+        self.writer = writer
+        self.queue.put_nowait((writer, after))
+
+    def _open(self, writer):
+        if writer._file is None:
+            try:
+                writer.open()
+            except (IOError, OSError) as e:
+                print("Cannot open log " + str(writer.path) + ": " + repr(e))
+                return None
+        return writer
+
+    def run(self):
+        current = self._open(self._current)
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if isinstance(data, tuple):
+                writer, after = data
+                if current is not None:
+                    current.close()
+                    self._sync_max = max(self._sync_max, current.max_sync_time)
+                if after is not None:
+                    try:
+                        after()
+                    except Exception as e:
+                        print("Log rotation callback failed: " + repr(e))
+                current = self._current = self._open(writer)
+                self.rotations += 1
+                continue
+            self.taken += 1
+            if current is None:
+                self.lost += 1
+                continue
+            t0 = perf_counter()
+            try:
+                current.write_packed(data)
+            except (IOError, OSError) as e:
+                print("Log write error: " + repr(e))
+            self._latency[self._latency_pos % len(self._latency)] = perf_counter() - t0
+            self._latency_pos += 1
+            self.written += 1
+        if current is not None:
+            current.close()
+
+    def close(self, timeout=2):
+        '''
+        Writes out everything still queued, then closes the log.  Waits up to
+        timeout [s] for the sink thread, so only call this at shutdown.
+        '''
+        if self.is_alive():
+            self.queue.put_nowait(None)
+            self.join(timeout)
+        else:
+            self._current.close()
+
+    def stats(self):
+        n = min(self._latency_pos, len(self._latency))
+        if n:
+            p50, p95, p99 = numpy.percentile(self._latency[:n], [50, 95, 99])
+            worst = self._latency[:n].max()
+        else:
+            p50 = p95 = p99 = worst = 0
+        current = self._current
+        sync_max = max(self._sync_max, current.max_sync_time if current is not None else 0)
+        return {'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped + self.lost,
+                'depth': self.accepted - self.taken,
+                'max_depth': self.max_depth,
+                'rotations': self.rotations,
+                'write_p50': round(float(p50), 6),
+                'write_p95': round(float(p95), 6),
+                'write_p99': round(float(p99), 6),
+                'write_max': round(float(worst), 6),
+                'sync_max': round(sync_max, 6)}
+
+
+def read_log(path):
+    '''
+    Returns (header dict, records) where records is a structured array with
+    fields 'time', 'value' and 'fault'.
+    '''
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(str(path) + ' is not a HyperLynx binary log')
+        length = _HEADER_LEN.unpack(file.read(_HEADER_LEN.size))[0]
+        header = json.loads(file.read(length).decode('utf-8'))
+        offset = file.tell()
+    dtype = record_dtype(len(header['columns']), header['n_fault'])
+    size = os.path.getsize(path) - offset
+    count = size // dtype.itemsize          # drop a partial last record
+    records = numpy.fromfile(path, dtype=dtype, count=count, offset=offset)
+    return header, records
+
+
+def to_tsv(path, out_path):
+    '''
+    Converts a binary log to the Label/Value/Fault/Time text format.
+    '''
+    header, records = read_log(path)
+    columns = header['columns']
+    n_fault = header['n_fault']
+    no_fault = set(header['no_fault'])
+    with open(out_path, 'w') as file:
+        file.write('\t'.join('"' + title + '"' for title in ['Label', 'Value', 'Fault', 'Time']) + '\n')
+        for record in records:
+            stamp = str(round(float(record['time']), 2))
+            values = record['value']
+            for i, name in enumerate(columns):
+                if i < n_fault:
+                    fault = str(int(record['fault'][i]))
+                elif name in no_fault:
+                    fault = ''
+                else:
+                    fault = '0'
+                file.write(name + '\t' + repr(float(values[i])) + '\t' + fault + '\t' + stamp + '\n')
+    return len(records)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('Usage: python flight_log.py <binary log> [output tsv]')
+        sys.exit(1)
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0] + '.tsv'
+    print('Wrote ' + str(to_tsv(src, dst)) + ' records to ' + dst)
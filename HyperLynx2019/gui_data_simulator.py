@@ -5,6 +5,8 @@
 import numpy as np
 import pandas as pd
 import argparse
+from time import perf_counter, sleep
+from log_loader import load_log
 
 col_to_state = {'1 - S2A': "SafeToApproach",
                 '2 - FC2l': "",
@@ -123,11 +125,34 @@ class DataSimulator():
            BrakingLow:df.loc[df['7 - Brake2'] == 1, values].to_dict('index')}
 
     def load_data_log(self, file):
-       df = pd.read_csv(file, sep='\t')
-       HV = df.Label == 'HV'
-       df.loc[~HV, 'Value'] = pd.to_numeric(df.loc[~HV, 'Value'])
-       times = df.Time.unique()
-       self.data_list = [df.loc[df.Time==time,:].set_index('Label') for time in times]
+       '''
+       Loads a text or binary log as a time x signal matrix (see log_loader.py),
+       cached next to the log after the first load.
+       '''
+       self.log = load_log(file)
+       self.data_list = range(len(self.log))
+
+    def row_to_dict(self, i):
+       '''
+       This function takes row i of the loaded log and loads the data
+       into respective dictionaries
+       '''
+       row = self.log.row(i)
+       D = ['D', 'distance']
+       V = ['V', 'speed']
+       A = ['A', 'accel']
+
+       return {
+           'sensor_data': {key: row[key] for key in sensors if key in row},
+           'commands': {key: row[key] for key in command_lst if key in row},
+           'state': row.get('state', np.nan),
+           'spacex_state': row.get('spacex_state', np.nan),
+           'total_faults': row.get('total_faults', np.nan),
+           'throttle': row.get('throttle', np.nan),
+           'D': {key: row[key] for key in D if key in row},
+           'V': {key: row[key] for key in V if key in row},
+           'A': {key: row[key] for key in A if key in row}
+       }
 
     def df_to_dict(self, df):
        '''
@@ -161,35 +186,112 @@ class DataSimulator():
         return self
 
     def __next__(self):
-        return self.df_to_dict(next(self.it))
+        return self.row_to_dict(next(self.it))
 
 
+class ReplayEngine():
+    '''
+    Replays a loaded log (log_loader.LogMatrix) following its recorded Time
+    column.  speed=1 is real time, speed=N is N times faster and speed=0
+    sends as fast as the sink accepts frames.
+
+    Text logs only hold the signals logged at each Time, so values are
+    carried forward: every frame is the complete latest value of every
+    signal seen so far, as the pod would send it.
+
+    Inputs:
+        log (LogMatrix):    log to replay
+        send (func):        called with one {signal: value} dict per frame
+        speed (float):      replay speed factor, 0 for as fast as possible
+    '''
+    def __init__(self, log, send, speed=1.0):
+        self.log = log
+        self.send = send
+        self.speed = speed
+        self.frames = 0
+        self.elapsed = 0
+        self.lag = np.zeros(len(log))      # [s] send time behind the scheduled time, per frame
+        self.stopped = False
+
+    def stop(self):
+        '''Ends run() after the current frame, e.g. from send() when the sink is gone.'''
+        self.stopped = True
+
+    def run(self):
+        log = self.log
+        current = {}
+        t0 = float(log.time[0]) if len(log) else 0
+        start = perf_counter()
+        for i in range(len(log)):
+            if self.stopped:
+                break
+            row = log.values[i]
+            valid = ~np.isnan(row)
+            current.update(zip([log.columns[j] for j in np.flatnonzero(valid)], row[valid].tolist()))
+
+            if self.speed:
+                due = start + (float(log.time[i]) - t0) / self.speed
+                now = perf_counter()
+                if due > now:
+                    sleep(due - now)
+            else:
+                due = perf_counter()
+            self.send(dict(current))
+            self.lag[i] = perf_counter() - due
+            self.frames += 1
+        self.elapsed = perf_counter() - start
+        return self.report()
+
+    def report(self):
+        n = self.frames
+        lag = self.lag[:n] if n else np.zeros(1)
+        span = float(self.log.time[n - 1] - self.log.time[0]) if n > 1 else 0
+        return {'frames': n,
+                'frames_not_sent': len(self.log) - n,
+                'elapsed': round(self.elapsed, 3),
+                'frame_rate': round(n / self.elapsed, 2) if self.elapsed else 0,
+                'recorded_rate': round(n / span, 2) if span else 0,
+                'speed': round(span / self.elapsed, 2) if self.elapsed else 0,
+                'lag_mean': round(float(lag.mean()), 6),
+                'lag_p99': round(float(np.percentile(lag, 99)), 6),
+                'lag_max': round(float(lag.max()), 6)}
 
 
 if __name__ == "__main__":
     # this needs to be run from Hyperlynx2019 to work
-    from network_transfer.libclient import BaseClient
-    import time
+    from network_transfer.libclient import StreamingClient
 
     parser = argparse.ArgumentParser(description='Pod Data Simulator')
     parser.add_argument('--log', help='path to log file')
     parser.add_argument('--server', help='<host>:<port>')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed, 1 = recorded timing, 0 = as fast as possible')
     args = parser.parse_args()
 
 
     sim = DataSimulator()
     sim.load_data_log(args.log)
 
-    it = iter(sim)
-
     if args.server:
         host, port = args.server.split(':')
         port = int(port)
-        client = BaseClient()
-        for i in it:
-            client.send_message(host, port, 'send_data', i)
-            time.sleep(1)
+        # One persistent connection; as fast as possible waits for the socket instead of
+        # dropping frames, but gives up if the server is not accepting the connection
+        client = StreamingClient(host, port, maxsize=64)
+        client.start()
+        block = args.speed == 0
+
+        def send(values):
+            if not client.send_telemetry(values, block=block, timeout=1.0) and block and not client.connected:
+                print("Not connected to " + args.server + ", stopping replay")
+                replay.stop()
+
+        replay = ReplayEngine(sim.log, send, args.speed)
+        report = replay.run()
+        while client.q.qsize() and client.connected:
+            sleep(0.01)
+        report.update(('client_' + key, val) for key, val in client.stats().items())
+        client.close()
     else:
-        for i in it:
-            print(i)
-            time.sleep(1)
+        report = ReplayEngine(sim.log, print, args.speed).run()
+    print(report)
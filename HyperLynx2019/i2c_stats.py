@@ -0,0 +1,191 @@
+'''
+   HyperLynx: i2c_stats.py
+
+   Purpose:
+   Per-device I2C transaction counters, collected at the SMBus call layer.
+
+   Details:
+   install() wraps the transfer methods of smbus.SMBus (this directory's
+   copy, used by HyperlynxECS, Lidar and MLX90614) and of
+   Adafruit_PureIO.smbus.SMBus (used by the Adafruit BNO055/BME280/BMP280/
+   ADS1x15 drivers through Adafruit_GPIO.I2C), so every transaction on the
+   bus is counted no matter which driver issued it.  Per device it keeps:
+       transactions, bytes     payload bytes, excluding address and command byte
+       errors                  transactions that raised IOError
+       after_error             transactions to a device whose previous one failed;
+                               at this layer a driver's retry cannot be told apart
+                               from the next scheduled poll, so this counts both
+       latency                 stage_timing.TimingHistogram of call time [ns]
+
+   Devices behind the TCA9548A share addresses (BMP280 and BME280 #1 are
+   both 0x77), so devices are keyed by (TCA channel, address); the channel is
+   tracked from the writes to the multiplexer.  Names registered with
+   name() are used in the report, otherwise 'ch<channel>:0x<address>'.
+
+   Counters are only written from the thread doing the I2C access (one
+   acquisition group holds the bus lock), so no lock is taken.  report() is
+   meant for telemetry on the control thread: the counters are read as they
+   are, but latency percentiles are refreshed for at most one device per
+   call, and only once they are older than summary_interval.
+'''
+
+import functools
+from time import perf_counter, perf_counter_ns
+from stage_timing import TimingHistogram
+
+
+class DeviceStats():
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.after_error = 0
+        self.failed = False                 # last transaction raised
+        self.latency = TimingHistogram()
+        self.percentiles = (0.0, 0.0)       # [ns] p50, p99 as of percentiles_time
+        self.percentiles_time = None        # perf_counter() of the last refresh, None if never
+
+    def refresh(self, now):
+        self.percentiles = tuple(self.latency.percentiles((50, 99)))
+        self.percentiles_time = now
+
+    def report(self):
+        p50, p99 = self.percentiles
+        return {'transactions': self.transactions,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'after_error': self.after_error,
+                'error_rate': round(self.errors / self.transactions, 4) if self.transactions else 0,
+                'p50': round(p50 / 1000.0, 1),          # [us]
+                'p99': round(p99 / 1000.0, 1),
+                'max': round(self.latency.max / 1000.0, 1),
+                'busy': round(self.latency.total / 1e6, 3)}     # [ms] total time on the bus
+
+
+class I2CStats():
+    '''
+    Inputs:
+        mux_addr (int):             I2C address of the TCA9548A multiplexer
+        summary_interval (float):   [s] how long report() reuses a device's latency percentiles
+    '''
+    def __init__(self, mux_addr=0x70, summary_interval=1.0):
+        self.mux_addr = mux_addr
+        self.summary_interval = summary_interval
+        self.channel = None                 # TCA channel currently open, None if none
+        self.names = {}                     # {(channel, addr): name}
+        self.devices = {}                   # {(channel, addr): DeviceStats}
+
+    def name(self, channel, addr, name):
+        '''Names a device; channel None for devices not behind the multiplexer.'''
+        self.names[(channel, addr)] = name
+
+    def select(self, value):
+        '''Tracks the multiplexer channel from the value written to its control register.'''
+        if value and not value & (value - 1):
+            self.channel = value.bit_length() - 1
+        else:
+            self.channel = None
+
+    def record(self, addr, ns, nbytes, error):
+        channel = None if addr == self.mux_addr else self.channel
+        key = (channel, addr)
+        device = self.devices.get(key)
+        if device is None:
+            device = self.devices[key] = DeviceStats()
+        device.transactions += 1
+        if device.failed:
+            device.after_error += 1
+        device.failed = error
+        if error:
+            device.errors += 1
+        else:
+            device.bytes += nbytes
+        device.latency.record(ns)
+
+    def device_name(self, key):
+        channel, addr = key
+        name = self.names.get(key) or self.names.get((None, addr))
+        if name is None:
+            name = '0x' + format(addr, '02x')
+            if channel is not None:
+                name = 'ch' + str(channel) + ':' + name
+        return name
+
+    def report(self):
+        '''{device name: counters} for every device seen on the bus.'''
+        devices = list(self.devices.items())
+        if devices:
+            # Refresh the latency percentiles of the stalest device only
+            device = min((device for key, device in devices),
+                         key=lambda device: device.percentiles_time or -1e9)
+            now = perf_counter()
+            if device.percentiles_time is None or now - device.percentiles_time >= self.summary_interval:
+                device.refresh(now)
+        return {self.device_name(key): device.report() for key, device in devices}
+
+    def reset(self):
+        self.devices = {}
+
+
+# Payload bytes of each SMBus method, from (args after addr, result).  write_block_data is
+# not wrapped: it is implemented with write_i2c_block_data, which already counts it.
+_METHODS = {'read_byte': lambda args, result: 1,
+            'read_bytes': lambda args, result: len(result),
+            'read_byte_data': lambda args, result: 1,
+            'read_word_data': lambda args, result: 2,
+            'read_block_data': lambda args, result: len(result),
+            'read_i2c_block_data': lambda args, result: len(result),
+            'write_quick': lambda args, result: 0,
+            'write_byte': lambda args, result: 1,
+            'write_bytes': lambda args, result: len(args[0]),
+            'write_byte_data': lambda args, result: 1,
+            'write_word_data': lambda args, result: 2,
+            'write_i2c_block_data': lambda args, result: len(args[1]),
+            'process_call': lambda args, result: 4}
+
+stats = I2CStats()
+
+
+def _wrap(func, size, stats):
+    @functools.wraps(func)
+    def call(self, addr, *args, **kwargs):
+        t0 = perf_counter_ns()
+        try:
+            result = func(self, addr, *args, **kwargs)
+        except IOError:
+            stats.record(addr, perf_counter_ns() - t0, 0, True)
+            raise
+        stats.record(addr, perf_counter_ns() - t0, size(args, result), False)
+        if addr == stats.mux_addr and func.__name__ == 'write_byte':
+            stats.select(args[0])
+        return result
+    return call
+
+
+def instrument(cls, stats=stats):
+    '''Wraps the transfer methods of an SMBus class.  Safe to call more than once.'''
+    if getattr(cls, '_i2c_stats', None) is not None:
+        return
+    for name, size in _METHODS.items():
+        func = getattr(cls, name, None)
+        if func is not None:
+            setattr(cls, name, _wrap(func, size, stats))
+    cls._i2c_stats = stats
+
+
+def install(stats=stats):
+    '''
+    Instruments every SMBus implementation the sensor drivers use.  Returns
+    the list of instrumented classes.
+    '''
+    classes = []
+    import smbus
+    classes.append(smbus.SMBus)
+    try:
+        import Adafruit_PureIO.smbus
+        classes.append(Adafruit_PureIO.smbus.SMBus)
+    except ImportError:
+        pass
+    for cls in classes:
+        instrument(cls, stats)
+    return classes
@@ -0,0 +1,169 @@
+'''
+   HyperLynx: log_analytics.py
+
+   Purpose:
+   Summarizes every run in a logs directory into one table.
+
+   Details:
+   Logs are loaded in parallel on a process pool with log_loader.load_log()
+   (text or binary, cached after the first load).  Per run it reports:
+       rows, duration       log ticks and [s] covered
+       max_V, max_A, max_D  peak speed [ft/s], acceleration [g] and distance [ft]
+       time_state_<n>       [s] spent in each pod state
+       interval_p50/95/99/max   [s] loop interval percentiles, from
+                            Clock_interval if logged, otherwise from the
+                            spacing of the log's Time column (interval_src)
+       faults               log ticks with a fault flagged, summed over sensors
+       faults_<sensor>      the same per sensor, for every sensor that faulted in any run
+
+   The table is written tab separated, one row per run.
+
+   Usage:
+       python log_analytics.py [logs dir or log files] [-o summary.tsv] [-j workers]
+'''
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from log_loader import load_log
+
+# Signal names used by binary logs first, then by the older text logs
+SPEED = ('V', 'speed')
+ACCEL = ('A', 'accel')
+DISTANCE = ('D', 'distance')
+INTERVAL = ('Clock_interval', 'poll_interval')
+SKIP_EXT = ('.m', '.tsv', '.json', '.npy')
+
+
+def find_logs(paths):
+    '''Expands directories into the log files in them.'''
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and not name.startswith('.') and not name.endswith(SKIP_EXT):
+                    logs.append(full)
+        else:
+            logs.append(path)
+    return logs
+
+
+def _first(log, names):
+    for name in names:
+        if name in log:
+            return log.column(name)
+    return None
+
+
+def _max(column):
+    if column is None or not numpy.isfinite(column).any():
+        return numpy.nan
+    return round(float(numpy.nanmax(column)), 4)
+
+
+def _fill_forward(column):
+    '''Carries the last logged value over the NaN gaps of a sparse text log.'''
+    valid = numpy.isfinite(column)
+    index = numpy.where(valid, numpy.arange(len(column)), 0)
+    numpy.maximum.accumulate(index, out=index)
+    filled = column[index]
+    filled[:numpy.argmax(valid)] = numpy.nan
+    return filled
+
+
+def summarize(path):
+    '''
+    Returns the summary dict for one log.
+    '''
+    log = load_log(path)
+    summary = {'run': os.path.basename(path), 'rows': len(log)}
+    if len(log) == 0:
+        return summary
+    time = numpy.asarray(log.time, dtype=float)
+    summary['duration'] = round(float(time[-1] - time[0]), 3)
+    summary['max_V'] = _max(_first(log, SPEED))
+    summary['max_A'] = _max(_first(log, ACCEL))
+    summary['max_D'] = _max(_first(log, DISTANCE))
+
+    # Time per state: each Time step is credited to the state it started in
+    state = _first(log, ('state',))
+    if state is not None and len(time) > 1:
+        state = _fill_forward(numpy.asarray(state, dtype=float))[:-1]
+        dt = numpy.diff(time)
+        known = numpy.isfinite(state)
+        for value in numpy.unique(state[known]):
+            summary['time_state_' + str(int(value))] = round(float(dt[state == value].sum()), 3)
+
+    interval = _first(log, INTERVAL)
+    if interval is not None and numpy.isfinite(interval).any():
+        interval = interval[numpy.isfinite(interval)]
+        summary['interval_src'] = 'logged'
+    else:
+        interval = numpy.diff(time)
+        summary['interval_src'] = 'Time'
+    if len(interval):
+        p50, p95, p99 = numpy.percentile(interval, [50, 95, 99])
+        summary.update(interval_p50=round(float(p50), 6), interval_p95=round(float(p95), 6),
+                       interval_p99=round(float(p99), 6), interval_max=round(float(interval.max()), 6))
+
+    counts = numpy.count_nonzero(log.fault, axis=0)
+    summary['faults'] = int(counts.sum())
+    for i in numpy.flatnonzero(counts):
+        summary['faults_' + log.columns[i]] = int(counts[i])
+    return summary
+
+
+def summary_columns(summaries):
+    '''Fixed columns first, then states and per-sensor faults in sorted order.'''
+    fixed = ['run', 'rows', 'duration', 'max_V', 'max_A', 'max_D', 'interval_src',
+             'interval_p50', 'interval_p95', 'interval_p99', 'interval_max', 'faults']
+    extra = set()
+    for summary in summaries:
+        extra.update(key for key in summary if key not in fixed)
+    states = sorted((key for key in extra if key.startswith('time_state_')), key=lambda key: int(key[11:]))
+    faults = sorted(key for key in extra if key.startswith('faults_'))
+    return fixed + states + faults
+
+
+def write_table(summaries, out_path):
+    columns = summary_columns(summaries)
+    with open(out_path, 'w') as file:
+        file.write('\t'.join(columns) + '\n')
+        for summary in summaries:
+            file.write('\t'.join(str(summary.get(column, '')) for column in columns) + '\n')
+    return columns
+
+
+def run(paths, out_path, workers=None):
+    logs = find_logs(paths)
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(_safe_summarize, logs))
+    summaries = [summary for summary in results if summary is not None]
+    write_table(summaries, out_path)
+    return summaries
+
+
+def _safe_summarize(path):
+    try:
+        return summarize(path)
+    except (IOError, OSError, ValueError) as e:
+        print('Skipping ' + path + ': ' + repr(e))
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize SDA logs')
+    parser.add_argument('paths', nargs='*', default=['logs'], help='log files or directories (default: logs)')
+    parser.add_argument('-o', '--out', default='log_summary.tsv', help='summary table to write')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    summaries = run(args.paths, args.out, args.workers)
+    for summary in summaries:
+        print('{run:<24} rows {rows:>6}  max V {max_V:>8}  max A {max_A:>8}  faults {faults:>6}'.format(
+            **dict({'max_V': '', 'max_A': '', 'faults': ''}, **summary)))
+    print('Wrote ' + str(len(summaries)) + ' runs to ' + args.out)
+    sys.exit(0 if summaries else 1)
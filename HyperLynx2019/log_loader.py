@@ -0,0 +1,181 @@
+'''
+   HyperLynx: log_loader.py
+
+   Purpose:
+   Loads SDA logs as a wide time x signal matrix, for replay and analysis.
+
+   Details:
+   Text logs are long format (one Label/Value/Fault/Time line per signal per
+   log tick).  pivot_tsv() reads them in a single pass and scatters every
+   value into a NaN filled float64 matrix, one row per unique Time and one
+   column per Label.  Binary .hlx logs (flight_log.py) are already columnar
+   and are read directly.  Non-numeric values (HV is logged as True/False)
+   become 1/0; anything else that is not a number becomes NaN.
+
+   The pivoted matrix is cached next to the log in a .cache directory as
+   plain .npy files keyed by a hash of the log's contents, so a log is only
+   parsed once and later loads memory-map the cache.  Editing or replacing
+   the log changes the hash and the cache is rebuilt.
+
+   LogMatrix.row(i) returns {Label: value} for one log tick.
+'''
+
+import hashlib
+import json
+import os
+import numpy
+from flight_log import MAGIC, read_log
+
+CACHE_DIR = '.cache'
+_BOOLS = {'True': 1.0, 'False': 0.0}
+
+
+def file_hash(path, chunk=1048576):
+    '''Returns the sha1 hex digest of a file's contents.'''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_binary_log(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return _BOOLS.get(text, numpy.nan)
+
+
+def pivot_tsv(path):
+    '''
+    Reads a Label/Value/Fault/Time text log in one pass.  Returns
+    (columns, time, values, fault): values and fault are time x column.
+    Label/Value/Time files without a header (flight_sim_data.dat) work too.
+    '''
+    col_index = {}
+    time_index = {}
+    rows, cols, vals, faults = [], [], [], []
+    with open(path) as file:
+        for line in file:
+            if line.startswith('"Label"'):
+                continue        # header
+            fields = [field for field in line.rstrip('\n').split('\t') if field]
+            if len(fields) < 3:
+                continue
+            label = fields[0]
+            col = col_index.setdefault(label, len(col_index))
+            row = time_index.setdefault(fields[-1], len(time_index))
+            rows.append(row)
+            cols.append(col)
+            vals.append(_to_float(fields[1]))
+            faults.append(int(fields[2]) if len(fields) > 3 and fields[2].isdigit() else 0)
+
+    values = numpy.full((len(time_index), len(col_index)), numpy.nan)
+    fault = numpy.zeros(values.shape, dtype='u1')
+    values[rows, cols] = vals
+    fault[rows, cols] = faults
+    time = numpy.array([float(stamp) for stamp in time_index])
+    return list(col_index), time, values, fault
+
+
+def read_binary(path):
+    '''
+    Reads a flight_log.py binary log.  Returns (columns, time, values, fault).
+    '''
+    header, records = read_log(path)
+    values = numpy.ascontiguousarray(records['value'])
+    fault = numpy.zeros(values.shape, dtype='u1')
+    fault[:, :header['n_fault']] = records['fault']
+    return header['columns'], records['time'].copy(), values, fault
+
+
+class LogMatrix():
+    '''
+    Inputs:
+        columns (list):         signal names, in column order
+        time (array):           [s] time of each row
+        values (array):         float64, time x column
+        fault (array):          uint8 fault codes, time x column
+        source (str):           log the matrix was loaded from
+    '''
+    def __init__(self, columns, time, values, fault, source=None):
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.time = time
+        self.values = values
+        self.fault = fault
+        self.source = source
+
+    def __len__(self):
+        return len(self.time)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def column(self, name):
+        '''Returns one signal over the whole log.'''
+        return self.values[:, self.index[name]]
+
+    def row(self, i):
+        '''Returns {name: value} for row i.'''
+        return dict(zip(self.columns, self.values[i].tolist()))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def save(self, prefix):
+        numpy.save(prefix + '.values.npy', self.values)
+        numpy.save(prefix + '.fault.npy', self.fault)
+        numpy.save(prefix + '.time.npy', self.time)
+        with open(prefix + '.json', 'w') as file:
+            json.dump({'columns': self.columns, 'source': self.source}, file)
+
+    @classmethod
+    def open(cls, prefix, mmap_mode='r'):
+        with open(prefix + '.json') as file:
+            meta = json.load(file)
+        return cls(meta['columns'],
+                   numpy.load(prefix + '.time.npy', mmap_mode=mmap_mode),
+                   numpy.load(prefix + '.values.npy', mmap_mode=mmap_mode),
+                   numpy.load(prefix + '.fault.npy', mmap_mode=mmap_mode),
+                   meta.get('source'))
+
+
+def cache_prefix(path, digest=None):
+    '''Returns the cache file prefix for a log, e.g. logs/.cache/log_2019521818.<hash>.'''
+    if digest is None:
+        digest = file_hash(path)
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    return os.path.join(folder, os.path.basename(path) + '.' + digest[:16])
+
+
+def load_log(path, cache=True):
+    '''
+    Returns a LogMatrix for a text or binary log, from the cache if it is up to date.
+    '''
+    prefix = cache_prefix(path) if cache else None
+    if prefix is not None and os.path.exists(prefix + '.json'):
+        try:
+            return LogMatrix.open(prefix)
+        except (IOError, OSError, ValueError) as e:
+            print("Log cache unreadable, rebuilding: " + repr(e))
+
+    if is_binary_log(path):
+        columns, time, values, fault = read_binary(path)
+    else:
+        columns, time, values, fault = pivot_tsv(path)
+    matrix = LogMatrix(columns, time, values, fault, source=path)
+
+    if prefix is not None:
+        try:
+            os.makedirs(os.path.dirname(prefix), exist_ok=True)
+            matrix.save(prefix)
+        except (IOError, OSError) as e:
+            print("Could not write log cache: " + repr(e))
+    return matrix
@@ -0,0 +1,366 @@
+'''
+   HyperLynx: async_transport.py
+
+   Purpose:
+   asyncio transport for pod <-> ground station traffic, using the same wire
+   format as libclient/libserver (2 byte header length, JSON header, content).
+
+   Details:
+   FrameProtocol is an asyncio.BufferedProtocol: the event loop receives
+   straight into a framing.FrameBuffer and frames are parsed in place.  One
+   connection carries both directions at once: telemetry (text/json or
+   binary/telemetry-v1) from the pod and text/json commands from the ground.
+
+   Backpressure follows the transport's write buffer limits.  While the peer
+   is not keeping up, send_telemetry() drops frames (only the newest matters)
+   and counts them; send_message() still queues, and coroutines can
+   'await protocol.drain()' before sending more.
+
+   TelemetryHub is the ground station side (many pods/tools, fan-out to
+   subscribers, like BaseServer); PodLink is the pod side (one connection,
+   reconnects with backoff, like StreamingClient).  Requests without the
+   "stream" header flag (BaseClient) are answered and closed as before.
+   LoopThread runs either on its own event loop thread for code that is not
+   asyncio based (SDA, the Qt GUI).
+'''
+
+import asyncio
+import json
+import threading
+import time
+
+try:
+    from network_transfer.framing import FrameBuffer, json_decode, create_message, encode_request
+    from network_transfer.telemetry_codec import TelemetryEncoder, TelemetryDecoder, CONTENT_TYPE, \
+        SCHEMA_ACTION, flatten
+except ImportError:
+    from framing import FrameBuffer, json_decode, create_message, encode_request
+    from telemetry_codec import TelemetryEncoder, TelemetryDecoder, CONTENT_TYPE, SCHEMA_ACTION, flatten
+
+
+def _request(action, value):
+    return dict(type="text/json", encoding="utf-8", content=dict(action=action, value=value))
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    '''
+    Inputs:
+        on_message (func):  called with (protocol, request dict) for every frame
+        on_close (func):    called with (protocol) when the connection is lost
+        high_water (int):   write buffer size [bytes] at which sending pauses
+    '''
+    def __init__(self, on_message=None, on_close=None, high_water=262144):
+        self.on_message = on_message
+        self.on_close = on_close
+        self.high_water = high_water
+        self.transport = None
+        self.peer = None
+        self.buffer = FrameBuffer()
+        self.encoder = None
+        self.decoder = None
+        self.closed = None              # future, set when the connection is lost
+        self._writable = None
+
+        self.opened = time.perf_counter()
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.dropped = 0
+        self.bad_frames = 0             # received frames that failed to decode or handle
+        self.paused = 0
+
+    # asyncio callbacks
+    def connection_made(self, transport):
+        loop = asyncio.get_event_loop()
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        self.closed = loop.create_future()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        transport.set_write_buffer_limits(high=self.high_water)
+
+    def get_buffer(self, sizehint):
+        return self.buffer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.bytes_in += nbytes
+        self.buffer.buffer_updated(nbytes)
+        while True:
+            try:
+                frame = self.buffer.next_frame()
+            except ValueError as e:
+                print("bad frame from", self.peer, ":", repr(e))
+                self.transport.close()
+                return
+            if frame is None:
+                return
+            try:
+                self._handle(*frame)
+            except Exception as e:
+                # Framing is still in sync, so only this frame is lost, not the link
+                self.bad_frames += 1
+                print("dropped frame from", self.peer, ":", repr(e))
+
+    def pause_writing(self):
+        self.paused += 1
+        self._writable.clear()
+
+    def resume_writing(self):
+        self._writable.set()
+
+    def connection_lost(self, exc):
+        self._writable.set()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+        if self.on_close is not None:
+            self.on_close(self)
+
+    # receiving
+    def _handle(self, jsonheader, content):
+        content_type = jsonheader["content-type"]
+        if content_type == "text/json":
+            request = json_decode(content, jsonheader["content-encoding"])
+            if isinstance(request, dict) and request.get('action') == SCHEMA_ACTION:
+                self.decoder = TelemetryDecoder(request.get('value'))
+                return
+        elif content_type == CONTENT_TYPE:
+            if self.decoder is None:
+                raise ValueError('{} frame received before a schema.'.format(CONTENT_TYPE))
+            seq, stamp, value = self.decoder.decode(content)
+            request = {'action': 'send_data', 'seq': seq, 'stamp': stamp, 'value': value}
+        else:
+            request = bytes(content)
+        self.frames_in += 1
+        if self.on_message is not None:
+            self.on_message(self, request)
+        if not jsonheader.get("stream", False):
+            # One-shot BaseClient request: answer it and close, as libserver does
+            content = json.dumps({'result': 'Data Received'}).encode('utf-8')
+            self.transport.write(create_message(content, "text/json", "utf-8"))
+            self.transport.close()
+
+    # sending
+    @property
+    def writable(self):
+        return self._writable is not None and self._writable.is_set()
+
+    async def drain(self):
+        await self._writable.wait()
+
+    def send_message(self, action, value):
+        '''
+        Sends a text/json request (commands).  Always queued, even when paused.
+        '''
+        if self.transport is None or self.transport.is_closing():
+            return False
+        self.transport.write(encode_request(_request(action, value), stream=True))
+        self.frames_out += 1
+        return True
+
+    def send_telemetry(self, values, stamp=None):
+        '''
+        Sends values as binary/telemetry-v1.  Dropped if the peer is not keeping up.
+        '''
+        if self.transport is None or self.transport.is_closing() or not self.writable:
+            self.dropped += 1
+            return False
+        flat = flatten(values)
+        if self.encoder is None or not self.encoder.matches(flat):
+            self.encoder = TelemetryEncoder(flat)
+            self.transport.write(encode_request(self.encoder.schema_request(), stream=True))
+        self.transport.write(self.encoder.encode(flat, stamp))
+        self.frames_out += 1
+        return True
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.opened, 1e-9)
+        size = self.transport.get_write_buffer_size() if self.transport is not None else 0
+        return {'frames_in': self.frames_in,
+                'frames_out': self.frames_out,
+                'bytes_in': self.bytes_in,
+                'frames_per_s': round(self.frames_in / elapsed, 2),
+                'backlog': len(self.buffer),
+                'send_backlog': size,
+                'dropped': self.dropped,
+                'bad_frames': self.bad_frames,
+                'paused': self.paused,
+                'lost': self.decoder.lost if self.decoder is not None else 0}
+
+
+class TelemetryHub():
+    '''
+    Ground station server.  Every received request is fanned out to the
+    subscribers; commands can be sent back to every connected pod.
+
+    Inputs:
+        host (str):     hostname or IP address to listen on
+        port (int):     port
+    '''
+    def __init__(self, host, port, print_data=False):
+        self.host = host
+        self.port = port
+        self.print_data = print_data
+        self.subscribers = []
+        self.handlers = {}          # {action: handler}, taken out of the subscriber fan-out
+        self.connections = set()
+        self.server = None
+        self.frames = 0
+
+    def subscribe(self, sink):
+        '''
+        sink is either a Queue (value is put on it) or a callable taking (value, protocol).
+        '''
+        self.subscribers.append(sink)
+
+    def unsubscribe(self, sink):
+        self.subscribers.remove(sink)
+
+    def handle(self, action, handler):
+        '''
+        Routes requests with the given action to handler(value, protocol)
+        instead of the subscribers (e.g. command acks).
+        '''
+        self.handlers[action] = handler
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        self.server = await loop.create_server(self._protocol, self.host, self.port)
+        print("listening on", (self.host, self.port))
+        return self.server
+
+    async def stop(self):
+        for protocol in list(self.connections):
+            protocol.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def send_command(self, action, value):
+        '''Sends a text/json command to every connected client.  Returns the number sent.'''
+        return sum(1 for protocol in list(self.connections) if protocol.send_message(action, value))
+
+    def stats(self):
+        return {'frames': self.frames,
+                'connections': {str(protocol.peer): protocol.stats() for protocol in list(self.connections)}}
+
+    def _protocol(self):
+        protocol = FrameProtocol(self._dispatch, self.connections.discard)
+        self.connections.add(protocol)
+        return protocol
+
+    def _dispatch(self, protocol, request):
+        self.frames += 1
+        value = request.get('value') if isinstance(request, dict) else request
+        if isinstance(request, dict) and request.get('action') in self.handlers:
+            self.handlers[request['action']](value, protocol)
+            return
+        if self.print_data:
+            print(value)
+        for sink in self.subscribers:
+            if callable(sink):
+                sink(value, protocol)
+            else:
+                sink.put(value)
+
+
+class PodLink():
+    '''
+    Pod side connection to the ground station.  Reconnects with exponential
+    backoff; on_command is called with (request dict) for every frame received.
+
+    Inputs:
+        host (str):             ground station hostname or IP address
+        port (int):             port
+        on_command (func):      receives commands from the ground station
+        backoff_min (float):    [s] first reconnect delay
+        backoff_max (float):    [s] longest reconnect delay
+    '''
+    def __init__(self, host, port, on_command=None, backoff_min=0.1, backoff_max=5.0):
+        self.host = host
+        self.port = port
+        self.on_command = on_command
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.protocol = None
+        self.connects = 0
+        self.dropped = 0
+        self._running = False
+
+    @property
+    def connected(self):
+        return self.protocol is not None
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        backoff = self.backoff_min
+        self._running = True
+        while self._running:
+            try:
+                transport, protocol = await loop.create_connection(
+                    lambda: FrameProtocol(self._received), self.host, self.port)
+            except OSError:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+            backoff = self.backoff_min
+            self.connects += 1
+            self.protocol = protocol
+            await protocol.closed
+            self.protocol = None
+
+    def stop(self):
+        self._running = False
+        if self.protocol is not None:
+            self.protocol.close()
+
+    def send_telemetry(self, values, stamp=None):
+        if self.protocol is None or not self.protocol.send_telemetry(values, stamp):
+            self.dropped += 1
+            return False
+        return True
+
+    def send_message(self, action, value):
+        if self.protocol is None:
+            self.dropped += 1
+            return False
+        return self.protocol.send_message(action, value)
+
+    def stats(self):
+        stats = {'connected': self.connected, 'connects': self.connects, 'dropped': self.dropped}
+        if self.protocol is not None:
+            stats.update(self.protocol.stats())
+        return stats
+
+    def _received(self, protocol, request):
+        if self.on_command is not None:
+            self.on_command(request)
+
+
+class LoopThread(threading.Thread):
+    '''
+    Runs an asyncio event loop on a daemon thread, for callers that are not
+    asyncio based.  call() schedules a plain function on the loop thread-safely,
+    submit() schedules a coroutine and returns a concurrent.futures.Future.
+    '''
+    def __init__(self, name='asyncio_loop'):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def call(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout=1):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
@@ -0,0 +1,112 @@
+'''
+   HyperLynx: bench_framing.py
+
+   Purpose:
+   Microbenchmark of the receive path: the old bytes buffer (+= and re-slice
+   on every parse step) against framing.FrameBuffer (recv_into, parse in place).
+   Frames carry binary content so the numbers are framing cost, not JSON.
+
+   The old loop is run with the 4096 byte recv() it used; FrameBuffer is run
+   with the same chunk and with a 64 KB chunk, which the old loop could not
+   use without re-copying the whole buffer for every frame parsed.
+
+   Usage:
+       python bench_framing.py [frames]
+'''
+
+import json
+import struct
+import sys
+import time
+
+from framing import FrameBuffer
+
+
+def make_stream(count, content_len):
+    content = bytes(content_len)
+    jsonheader = json.dumps({"byteorder": sys.byteorder,
+                             "content-type": "binary/telemetry-v1",
+                             "content-encoding": "binary",
+                             "content-length": len(content),
+                             "stream": True}).encode('utf-8')
+    frame = struct.pack(">H", len(jsonheader)) + jsonheader + content
+    return frame * count
+
+
+class FakeSocket():
+    '''Hands out a prebuilt byte stream in chunks, like a socket would.'''
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def recv(self, size):
+        chunk = bytes(self.data[self.pos:self.pos + size])
+        self.pos += len(chunk)
+        return chunk
+
+    def recv_into(self, buf, size):
+        n = min(size, len(buf), len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def legacy(sock, chunk=4096):
+    '''The parse loop libserver.Message used before FrameBuffer.'''
+    recv_buffer = b""
+    jsonheader_len = None
+    jsonheader = None
+    frames = 0
+    while True:
+        data = sock.recv(chunk)
+        if not data:
+            return frames
+        recv_buffer += data
+        while True:
+            if jsonheader_len is None:
+                if len(recv_buffer) < 2:
+                    break
+                jsonheader_len = struct.unpack(">H", recv_buffer[:2])[0]
+                recv_buffer = recv_buffer[2:]
+            if jsonheader is None:
+                if len(recv_buffer) < jsonheader_len:
+                    break
+                jsonheader = json.loads(recv_buffer[:jsonheader_len].decode('utf-8'))
+                recv_buffer = recv_buffer[jsonheader_len:]
+            content_len = jsonheader["content-length"]
+            if len(recv_buffer) < content_len:
+                break
+            content = recv_buffer[:content_len]
+            recv_buffer = recv_buffer[content_len:]
+            jsonheader_len = None
+            jsonheader = None
+            frames += 1
+
+
+def framebuffer(sock, chunk=4096):
+    buf = FrameBuffer(chunk=chunk)
+    frames = 0
+    while buf.recv_into(sock):
+        while True:
+            frame = buf.next_frame()
+            if frame is None:
+                break
+            jsonheader, content = frame
+            frames += 1
+    return frames
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for content_len, n in ((200, count), (16384, count // 20), (262144, max(count // 400, 10))):
+        data = make_stream(n, content_len)
+        print('{} frames of ~{} bytes ({:.1f} MB)'.format(n, content_len, len(data) / 1e6))
+        for name, parse, chunk in (('bytes +=/slice', legacy, 4096),
+                                   ('bytes +=/slice', legacy, 65536),
+                                   ('FrameBuffer', framebuffer, 4096),
+                                   ('FrameBuffer', framebuffer, 65536)):
+            t0 = time.perf_counter()
+            frames = parse(FakeSocket(data), chunk)
+            elapsed = time.perf_counter() - t0
+            print('    {:16s} {:6d} B recv {:10.0f} frames/s  {:8.1f} MB/s'.format(
+                name, chunk, frames / elapsed, len(data) / elapsed / 1e6))
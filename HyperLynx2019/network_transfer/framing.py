@@ -0,0 +1,168 @@
+'''
+   HyperLynx: framing.py
+
+   Purpose:
+   Receive buffer for the network_transfer message framing
+   (2 byte big endian header length, JSON header, content).
+
+   Details:
+   Data is received straight into a preallocated bytearray with recv_into()
+   and frames are parsed in place by tracking read/write offsets, instead of
+   growing a bytes object with += and re-slicing it after every parse step.
+   Frame content is returned as a memoryview into the buffer; it is only
+   valid until the next recv_into(), so decoders must copy anything they keep.
+   The buffer is compacted (unread bytes moved to the front) only when it
+   runs out of room, and replaced by a larger one if a single frame needs it.
+'''
+
+import json
+import struct
+import sys
+
+_PROTOHEADER = struct.Struct(">H")
+REQUIRED_HEADERS = ("byteorder", "content-length", "content-type", "content-encoding")
+
+
+def create_message(content_bytes, content_type, content_encoding, stream=False):
+    '''
+    Frames content: 2 byte header length, JSON header, content.  stream=True
+    marks the frame as part of a long-lived connection that expects no reply.
+    '''
+    jsonheader = {
+        "byteorder": sys.byteorder,
+        "content-type": content_type,
+        "content-encoding": content_encoding,
+        "content-length": len(content_bytes),
+    }
+    if stream:
+        jsonheader["stream"] = True
+    jsonheader_bytes = json.dumps(jsonheader, ensure_ascii=False).encode("utf-8")
+    return _PROTOHEADER.pack(len(jsonheader_bytes)) + jsonheader_bytes + bytes(content_bytes)
+
+
+def encode_request(request, stream=False):
+    '''
+    Frames a request dict as built by BaseClient._create_request().
+    '''
+    if request["type"] == "text/json":
+        content_bytes = json.dumps(request["content"], ensure_ascii=False).encode(request["encoding"])
+    else:
+        content_bytes = request["content"]
+    return create_message(content_bytes, request["type"], request["encoding"], stream)
+
+
+def json_decode(data, encoding):
+    '''Decodes JSON from a bytes-like object (bytes, bytearray or memoryview).'''
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data.decode(encoding))
+
+
+class FrameBuffer():
+    '''
+    Inputs:
+        size (int):     initial buffer size [bytes]
+        chunk (int):    most bytes requested per recv_into()
+    '''
+    def __init__(self, size=131072, chunk=65536):
+        self.chunk = chunk
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0             # first unread byte
+        self._end = 0               # end of received data
+
+        self._jsonheader_len = None
+        self.jsonheader = None
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _make_room(self, need):
+        if len(self._buf) - self._end >= need:
+            return
+        pending = self._end - self._start
+        if len(self._buf) - pending >= need:
+            # Compact in place; old content views are invalid after the next recv anyway
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # New buffer, so memoryviews still held by callers are not resized under them
+            size = len(self._buf)
+            while size - pending < need:
+                size *= 2
+            buf = bytearray(size)
+            buf[:pending] = self._view[self._start:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+        self._start = 0
+        self._end = pending
+
+    def _reserve(self, sizehint=0):
+        need = max(self.chunk, sizehint)
+        if self.jsonheader is not None:
+            # Make sure the whole pending frame will fit
+            need = max(need, self.jsonheader["content-length"] - len(self))
+        self._make_room(need)
+        return need
+
+    def recv_into(self, sock):
+        '''
+        Receives up to chunk bytes from sock.  Returns the number of bytes
+        received; 0 means the peer closed the connection.
+        '''
+        need = self._reserve()
+        n = sock.recv_into(self._view[self._end:], need)
+        self._end += n
+        return n
+
+    def get_buffer(self, sizehint=-1):
+        '''
+        Writable view for asyncio.BufferedProtocol.get_buffer().
+        '''
+        self._reserve(sizehint if sizehint > 0 else 0)
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        '''
+        Counterpart of get_buffer(), for asyncio.BufferedProtocol.buffer_updated().
+        '''
+        self._end += nbytes
+
+    def feed(self, data):
+        '''Appends bytes received some other way.'''
+        self._make_room(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def next_frame(self):
+        '''
+        Returns (jsonheader, content memoryview) for the next complete frame,
+        or None if the buffer does not hold a complete frame yet.
+        '''
+        if self._jsonheader_len is None:
+            if len(self) < _PROTOHEADER.size:
+                return None
+            self._jsonheader_len = _PROTOHEADER.unpack_from(self._buf, self._start)[0]
+            self._start += _PROTOHEADER.size
+
+        if self.jsonheader is None:
+            hdrlen = self._jsonheader_len
+            if len(self) < hdrlen:
+                return None
+            jsonheader = json_decode(self._view[self._start:self._start + hdrlen], "utf-8")
+            self._start += hdrlen
+            for reqhdr in REQUIRED_HEADERS:
+                if reqhdr not in jsonheader:
+                    raise ValueError('Missing required header "{}".'.format(reqhdr))
+            self.jsonheader = jsonheader
+
+        content_len = self.jsonheader["content-length"]
+        if len(self) < content_len:
+            return None
+        content = self._view[self._start:self._start + content_len]
+        self._start += content_len
+        jsonheader = self.jsonheader
+        self._jsonheader_len = None
+        self.jsonheader = None
+        if self._start == self._end:
+            self._start = self._end = 0
+        return jsonheader, content
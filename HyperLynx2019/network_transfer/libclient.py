@@ -3,8 +3,17 @@ import socket
 import selectors
 import traceback
 import json
-import io
 import struct
+import threading
+import queue
+import time
+
+try:
+    from network_transfer.telemetry_codec import TelemetryEncoder, CONTENT_TYPE, flatten
+    from network_transfer.framing import FrameBuffer, json_decode, encode_request
+except ImportError:
+    from telemetry_codec import TelemetryEncoder, CONTENT_TYPE, flatten
+    from framing import FrameBuffer, json_decode, encode_request
 
 
 class BaseClient:
@@ -68,16 +77,181 @@ class BaseClient:
         self.sel.register(sock, events, data=message)
 
 
+class StreamingClient(threading.Thread, BaseClient):
+    '''
+    Keeps one TCP connection open to the server and streams messages over it
+    without waiting for a reply.  Each message uses the same framing as
+    Message (2 byte big endian header length, JSON header, content), with
+    "stream": true in the header so the server keeps the connection open.
+
+    send_message() only puts the message on a bounded queue and never blocks;
+    encoding, sending and reconnecting (with exponential backoff) happen on
+    this thread.  When the queue is full the oldest message is dropped, since
+    only the newest telemetry is useful.
+
+    send_telemetry() sends numeric telemetry as binary/telemetry-v1 (see
+    telemetry_codec.py).  The schema is sent after every (re)connect and
+    whenever the set of fields changes.
+
+    Inputs:
+        host (str):             server hostname or IP address
+        port (int):             server port
+        maxsize (int):          messages queued before the oldest is dropped
+        backoff_min (float):    [s] first reconnect delay
+        backoff_max (float):    [s] longest reconnect delay
+        verbose (bool):         print connection events
+    '''
+    def __init__(self, host, port, maxsize=8, backoff_min=0.1, backoff_max=5.0, verbose=False):
+        threading.Thread.__init__(self, name='telemetry_client')
+        BaseClient.__init__(self)
+        self.daemon = True
+        self.host = host
+        self.port = port
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.verbose = verbose
+        self.q = queue.Queue(maxsize)
+        self.sock = None
+        self.encoder = None
+        self._schema_sent = False
+        self._stop_event = threading.Event()
+
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.connects = 0
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def send_message(self, action, value):
+        '''
+        Queues a message for the server.  Returns False if an older message had
+        to be dropped to make room.
+        '''
+        return self._queue(self._create_request(action, value))
+
+    def send_telemetry(self, values, stamp=None, block=False, timeout=None):
+        '''
+        Queues a telemetry dict to be sent as binary/telemetry-v1.  Same queue
+        and drop behaviour as send_message(), unless block is True: then it
+        waits up to timeout [s] (None for no limit) for room in the queue
+        before dropping (for replay / load testing).
+        '''
+        return self._queue(dict(type=CONTENT_TYPE, content=values,
+                                stamp=stamp if stamp is not None else time.time()), block, timeout)
+
+    def _queue(self, request, block=False, timeout=None):
+        try:
+            self.q.put(request, block, timeout)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self.q.get_nowait()
+        except queue.Empty:
+            pass
+        self.dropped += 1
+        try:
+            self.q.put_nowait(request)
+        except queue.Full:
+            self.dropped += 1
+        return False
+
+    def run(self):
+        backoff = self.backoff_min
+        while not self._stop_event.is_set():
+            if self.sock is None:
+                try:
+                    self._connect()
+                    backoff = self.backoff_min
+                except OSError as e:
+                    if self.verbose:
+                        print("connection to", (self.host, self.port), "failed:", repr(e))
+                    self._stop_event.wait(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            try:
+                request = self.q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if request["type"] == CONTENT_TYPE:
+                    data = self._encode_telemetry(request)
+                else:
+                    data = self._encode(request)
+            except (TypeError, ValueError) as e:
+                self.errors += 1
+                self.dropped += 1
+                print("telemetry encode error:", repr(e))
+                continue
+            try:
+                self.sock.sendall(data)
+                self.sent += 1
+            except OSError as e:
+                self.errors += 1
+                self.dropped += 1
+                if self.verbose:
+                    print("lost connection to", (self.host, self.port), ":", repr(e))
+                self._disconnect()
+        self._disconnect()
+
+    def close(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self):
+        return {'connected': self.connected,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'connects': self.connects,
+                'queued': self.q.qsize()}
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.backoff_max)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.connects += 1
+        if self.verbose:
+            print("connected to", (self.host, self.port))
+
+    def _disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        self._schema_sent = False
+
+    def _encode_telemetry(self, request):
+        flat = flatten(request["content"])
+        data = b""
+        if self.encoder is None or not self.encoder.matches(flat):
+            self.encoder = TelemetryEncoder(flat)
+            self._schema_sent = False
+        if not self._schema_sent:
+            data = self._encode(self.encoder.schema_request())
+            self._schema_sent = True
+        return data + self.encoder.encode(flat, request["stamp"])
+
+    def _encode(self, request):
+        return encode_request(request, stream=True)
+
+
 class Message:
     def __init__(self, selector, sock, addr, request):
         self.selector = selector
         self.sock = sock
         self.addr = addr
         self.request = request
-        self._recv_buffer = b""
+        self._recv_buffer = FrameBuffer(size=4096, chunk=4096)
         self._send_buffer = b""
         self._request_queued = False
-        self._jsonheader_len = None
         self.jsonheader = None
         self.response = None
 
@@ -97,14 +271,12 @@ class Message:
     def _read(self):
         try:
             # Should be ready to read
-            data = self.sock.recv(4096)
+            received = self._recv_buffer.recv_into(self.sock)
         except BlockingIOError:
             # Resource temporarily unavailable (errno EWOULDBLOCK)
             pass
         else:
-            if data:
-                self._recv_buffer += data
-            else:
+            if not received:
                 raise RuntimeError("Peer closed.")
 
     def _write(self):
@@ -123,14 +295,6 @@ class Message:
     def _json_encode(self, obj, encoding):
         return json.dumps(obj, ensure_ascii=False).encode(encoding)
 
-    def _json_decode(self, json_bytes, encoding):
-        tiow = io.TextIOWrapper(
-            io.BytesIO(json_bytes), encoding=encoding, newline=""
-        )
-        obj = json.load(tiow)
-        tiow.close()
-        return obj
-
     def _create_message(
         self, *, content_bytes, content_type, content_encoding
     ):
@@ -163,16 +327,11 @@ class Message:
     def read(self):
         self._read()
 
-        if self._jsonheader_len is None:
-            self.process_protoheader()
-
-        if self._jsonheader_len is not None:
-            if self.jsonheader is None:
-                self.process_jsonheader()
-
-        if self.jsonheader:
-            if self.response is None:
-                self.process_response()
+        if self.response is None:
+            frame = self._recv_buffer.next_frame()
+            if frame is not None:
+                self.jsonheader, content = frame
+                self.process_response(content)
 
     def write(self):
         if not self._request_queued:
@@ -226,44 +385,15 @@ class Message:
         self._send_buffer += message
         self._request_queued = True
 
-    def process_protoheader(self):
-        hdrlen = 2
-        if len(self._recv_buffer) >= hdrlen:
-            self._jsonheader_len = struct.unpack(
-                ">H", self._recv_buffer[:hdrlen]
-            )[0]
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-
-    def process_jsonheader(self):
-        hdrlen = self._jsonheader_len
-        if len(self._recv_buffer) >= hdrlen:
-            self.jsonheader = self._json_decode(
-                self._recv_buffer[:hdrlen], "utf-8"
-            )
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-            for reqhdr in (
-                "byteorder",
-                "content-length",
-                "content-type",
-                "content-encoding",
-            ):
-                if reqhdr not in self.jsonheader:
-                    raise ValueError('Missing required header "{}".'.format(reqhdr))
-
-    def process_response(self):
-        content_len = self.jsonheader["content-length"]
-        if not len(self._recv_buffer) >= content_len:
-            return
-        data = self._recv_buffer[:content_len]
-        self._recv_buffer = self._recv_buffer[content_len:]
+    def process_response(self, data):
         if self.jsonheader["content-type"] == "text/json":
             encoding = self.jsonheader["content-encoding"]
-            self.response = self._json_decode(data, encoding)
+            self.response = json_decode(data, encoding)
             print("received response", repr(self.response), "from", self.addr)
             self._process_response_json_content()
         else:
             # Binary or unknown content-type
-            self.response = data
+            self.response = bytes(data)
             print(
                 'received {} response from'.format(self.jsonheader["content-type"]),
                 self.addr,
@@ -3,11 +3,18 @@ import socket
 import selectors
 import traceback
 import json
-import io
 import struct
 import threading
+import time
 from queue import Queue
 
+try:
+    from network_transfer.telemetry_codec import TelemetryDecoder, CONTENT_TYPE, SCHEMA_ACTION
+    from network_transfer.framing import FrameBuffer, json_decode
+except ImportError:
+    from telemetry_codec import TelemetryDecoder, CONTENT_TYPE, SCHEMA_ACTION
+    from framing import FrameBuffer, json_decode
+
 
 
 class BaseServer:
@@ -17,6 +24,11 @@ class BaseServer:
     automatically start the server, otherwise, start_server will need to be
     called on the instance.
 
+    Clients that set "stream": true in the JSON header (libclient.StreamingClient)
+    keep their connection open and send many frames without waiting for a reply.
+    Every other request gets a response and the connection is closed, as before.
+    Each complete request is fanned out to all subscribers (see subscribe()).
+
     Inputs:
         host (str):     hostname or IP address
         port (int):     port for the socket, should be above 1024
@@ -31,6 +43,28 @@ class BaseServer:
         self.host = host
         self.port = port
 
+        self.subscribers = []
+        self.connections = {}       # {addr: Message}, open connections only
+        self.frames = 0
+
+    def subscribe(self, sink):
+        '''
+        Adds a receiver for the value of every complete request.  sink is either
+        a Queue (value is put on it) or a callable taking (value, message).
+        '''
+        self.subscribers.append(sink)
+
+    def unsubscribe(self, sink):
+        self.subscribers.remove(sink)
+
+    def stats(self):
+        '''
+        Returns throughput and backlog of every open connection.
+        '''
+        return {'frames': self.frames,
+                'connections': {str(addr): message.stats()
+                                for addr, message in list(self.connections.items())}}
+
     def start_server(self):
         self.sel = selectors.DefaultSelector()
 
@@ -53,10 +87,6 @@ class BaseServer:
                         message = key.data
                         try:
                             message.process_events(mask)
-                            if self.print_data:
-                                self._print_data(message.request.get('value'))
-                            ### add code to send data to local stack ###
-                            ## write data to file
                         except Exception:
                             print(
                                 "main: error: exception for",
@@ -74,9 +104,28 @@ class BaseServer:
         if self.verbose:
             print("accepted connection from", addr)
         conn.setblocking(False)
-        message = Message(self.sel, conn, addr)
+        message = Message(self.sel, conn, addr, verbose=self.verbose,
+                          on_request=self._dispatch, on_close=self._closed)
+        self.connections[addr] = message
         self.sel.register(conn, selectors.EVENT_READ, data=message)
 
+    def _dispatch(self, request, message):
+        '''
+        Called by Message for every complete request.
+        '''
+        self.frames += 1
+        value = request.get('value') if isinstance(request, dict) else request
+        if self.print_data:
+            self._print_data(value)
+        for sink in self.subscribers:
+            if callable(sink):
+                sink(value, message)
+            else:
+                sink.put(value)
+
+    def _closed(self, message):
+        self.connections.pop(message.addr, None)
+
     def _write_file(self):
         pass
 
@@ -86,20 +135,34 @@ class BaseServer:
 
 class Message:
     '''
+    One client connection.  Frames are parsed in place from _recv_buffer (a
+    framing.FrameBuffer) as they arrive; if a frame's header has "stream": true the connection stays open
+    and the next frame is parsed straight away, otherwise the request is
+    answered and the connection closed.
 
+    Inputs:
+        on_request (func):  called with (request, message) for each complete request
+        on_close (func):    called with (message) when the connection is closed
     '''
-    def __init__(self, selector, sock, addr, verbose=False):
+    def __init__(self, selector, sock, addr, verbose=False, on_request=None, on_close=None):
         self.selector = selector
         self.sock = sock
         self.addr = addr
-        self._recv_buffer = b""
+        self._recv_buffer = FrameBuffer()
         self._send_buffer = b""
-        self._jsonheader_len = None
         self.jsonheader = None
         self.request = None
         self.response_created = False
+        self.streaming = False
+        self.decoder = None         # TelemetryDecoder once a schema has been received
 
         self.verbose = verbose
+        self.on_request = on_request
+        self.on_close = on_close
+
+        self.opened = time.perf_counter()
+        self.frames = 0
+        self.bytes_in = 0
 
     def _set_selector_events_mask(self, mode):
         """Set selector to listen for events: mode is 'r', 'w', or 'rw'."""
@@ -116,13 +179,13 @@ class Message:
     def _read(self):
         try:
             # Should be ready to read
-            data = self.sock.recv(4096)
+            received = self._recv_buffer.recv_into(self.sock)
         except BlockingIOError:
             # Resource temporarily unavailable (errno EWOULDBLOCK)
             pass
         else:
-            if data:
-                self._recv_buffer += data
+            if received:
+                self.bytes_in += received
             else:
                 raise RuntimeError("Peer closed.")
 
@@ -145,14 +208,6 @@ class Message:
     def _json_encode(self, obj, encoding):
         return json.dumps(obj, ensure_ascii=False).encode(encoding)
 
-    def _json_decode(self, json_bytes, encoding):
-        tiow = io.TextIOWrapper(
-            io.BytesIO(json_bytes), encoding=encoding, newline=""
-        )
-        obj = json.load(tiow)
-        tiow.close()
-        return obj
-
     def _create_message(
         self, *, content_bytes, content_type, content_encoding
     ):
@@ -201,18 +256,39 @@ class Message:
             self.write()
 
     def read(self):
-        self._read()
-
-        if self._jsonheader_len is None:
-            self.process_protoheader()
-
-        if self._jsonheader_len is not None:
-            if self.jsonheader is None:
-                self.process_jsonheader()
+        try:
+            self._read()
+        except RuntimeError:
+            if not self.streaming:
+                raise
+            # A streaming client hanging up is a normal disconnect
+            if self.verbose:
+                print("stream closed by", self.addr)
+            self.close()
+            return
 
-        if self.jsonheader:
-            if self.request is None:
-                self.process_request()
+        # Parse every complete frame in the buffer (back-to-back when streaming)
+        while self.request is None:
+            frame = self._recv_buffer.next_frame()
+            if frame is None:
+                break
+            self.jsonheader, content = frame
+            self.streaming = bool(self.jsonheader.get("stream", False))
+            self.process_request(content)
+            if not self.streaming:
+                break
+            self.request = None
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.opened, 1e-9)
+        return {'streaming': self.streaming,
+                'frames': self.frames,
+                'bytes_in': self.bytes_in,
+                'frames_per_s': round(self.frames / elapsed, 2),
+                'bytes_per_s': round(self.bytes_in / elapsed, 1),
+                'backlog': len(self._recv_buffer),
+                'send_backlog': len(self._send_buffer),
+                'lost': self.decoder.lost if self.decoder is not None else 0}
 
     def write(self):
         if self.request:
@@ -242,54 +318,46 @@ class Message:
         finally:
             # Delete reference to socket object for garbage collection
             self.sock = None
+            if self.on_close is not None:
+                self.on_close(self)
 
-    def process_protoheader(self):
-        hdrlen = 2
-        if len(self._recv_buffer) >= hdrlen:
-            self._jsonheader_len = struct.unpack(
-                ">H", self._recv_buffer[:hdrlen]
-            )[0]
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-
-    def process_jsonheader(self):
-        hdrlen = self._jsonheader_len
-        if len(self._recv_buffer) >= hdrlen:
-            self.jsonheader = self._json_decode(
-                self._recv_buffer[:hdrlen], "utf-8"
-            )
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-            for reqhdr in (
-                "byteorder",
-                "content-length",
-                "content-type",
-                "content-encoding",
-            ):
-                if reqhdr not in self.jsonheader:
-                    raise ValueError('Missing required header "{}".'.format(reqhdr))
-
-    def process_request(self):
-        content_len = self.jsonheader["content-length"]
-        if not len(self._recv_buffer) >= content_len:
-            return
-        data = self._recv_buffer[:content_len]
-        self._recv_buffer = self._recv_buffer[content_len:]
+    def process_request(self, data):
+        '''
+        Handles one complete frame; data is a memoryview into _recv_buffer.
+        '''
         if self.jsonheader["content-type"] == "text/json":
             encoding = self.jsonheader["content-encoding"]
-            self.request = self._json_decode(data, encoding)
+            self.request = json_decode(data, encoding)
             # print("received request", repr(self.request), "from", self.addr)
             if self.verbose:
                 print("received request, action:", self.request.get('action'),
                     "from", self.addr)
+            if self.request.get('action') == SCHEMA_ACTION:
+                # Schema for the binary telemetry frames that follow
+                self.decoder = TelemetryDecoder(self.request.get('value'))
+                self.frames += 1
+                if not self.streaming:
+                    self._set_selector_events_mask("w")
+                return
+        elif self.jsonheader["content-type"] == CONTENT_TYPE:
+            if self.decoder is None:
+                raise ValueError('{} frame received before a schema.'.format(CONTENT_TYPE))
+            seq, stamp, value = self.decoder.decode(data)
+            self.request = {'action': 'send_data', 'seq': seq, 'stamp': stamp, 'value': value}
         else:
             # Binary or unknown content-type
-            self.request = data
+            self.request = bytes(data)
             if self.verbose:
                 print(
                 'received {} request from'.format(self.jsonheader["content-type"]),
                 self.addr,
                 )
-        # Set selector to listen for write events, we're done reading.
-        self._set_selector_events_mask("w")
+        self.frames += 1
+        if self.on_request is not None:
+            self.on_request(self.request, self)
+        if not self.streaming:
+            # Set selector to listen for write events, we're done reading.
+            self._set_selector_events_mask("w")
 
     def create_response(self):
         if self.jsonheader["content-type"] == "text/json":
@@ -302,50 +370,20 @@ class Message:
         self._send_buffer += message
 
 class ThreadedServer(threading.Thread, BaseServer):
+    '''
+    BaseServer on its own thread.  Requests are put on q, plus any other
+    subscribers added with subscribe().
+    '''
     def __init__(self, q, **kwargs):
         threading.Thread.__init__(self)
         BaseServer.__init__(self, **kwargs)
 
         self.q = q
+        self.subscribe(q)
     
     def run(self):
         # run the server and add received data to queue
-        self.sel = selectors.DefaultSelector()
-
-        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Avoid bind() exception: OSError: [Errno 48] Address already in use
-        lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        lsock.bind((self.host, self.port))
-        lsock.listen()
-        print("listening on", (self.host, self.port))
-        lsock.setblocking(False)
-        self.sel.register(lsock, selectors.EVENT_READ, data=None)
-
-        try:
-            while True:
-                events = self.sel.select(timeout=None)
-                for key, mask in events:
-                    if key.data is None:
-                        self._accept_wrapper(key.fileobj)
-                    else:
-                        message = key.data
-                        try:
-                            message.process_events(mask)
-                            if self.print_data:
-                                self._print_data(message.request.get('value'))
-                            self.q.put(message.request.get('value'))
-                            ## write data to file (not implemented)
-                        except Exception:
-                            print(
-                                "main: error: exception for",
-                                "{addr}:\n{traceback}"\
-                                .format(addr=message.addr, traceback=traceback.format_exc()),
-                            )
-                            message.close()
-        except KeyboardInterrupt:
-            print("caught keyboard interrupt, exiting")
-        finally:
-            self.sel.close()
+        self.start_server()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+'''
+   HyperLynx: qt_bridge.py
+
+   Purpose:
+   Connects async_transport.TelemetryHub to a PyQt5 GUI.
+
+   Details:
+   Received telemetry is delivered through the 'received' Qt signal, so the
+   GUI updates as frames arrive instead of polling a queue on a QTimer.  If
+   the application runs an asyncio loop on the Qt thread (e.g. qasync), the
+   hub runs directly on it; otherwise it runs on a LoopThread and Qt queues
+   the signal across to the GUI thread.
+'''
+
+import asyncio
+from PyQt5.QtCore import QObject, pyqtSignal
+
+try:
+    from network_transfer.async_transport import TelemetryHub, LoopThread
+except ImportError:
+    from async_transport import TelemetryHub, LoopThread
+
+
+class QtTelemetryBridge(QObject):
+    '''
+    Inputs:
+        host (str):     hostname or IP address to listen on
+        port (int):     port
+    '''
+    received = pyqtSignal(object)       # value of every telemetry frame (dict)
+
+    def __init__(self, host, port, parent=None):
+        super().__init__(parent)
+        self.hub = TelemetryHub(host, port)
+        self.hub.subscribe(self._on_value)
+        self.loop_thread = None
+
+    def start(self):
+        try:
+            loop = asyncio.get_event_loop()
+            direct = loop.is_running()
+        except RuntimeError:
+            direct = False
+        if direct:
+            asyncio.ensure_future(self.hub.start())
+        else:
+            self.loop_thread = LoopThread('telemetry_hub')
+            self.loop_thread.start()
+            self.loop_thread.submit(self.hub.start()).result(timeout=5)
+
+    def stop(self):
+        if self.loop_thread is not None:
+            self.loop_thread.submit(self.hub.stop()).result(timeout=5)
+            self.loop_thread.stop()
+        else:
+            asyncio.ensure_future(self.hub.stop())
+
+    def handle(self, action, handler):
+        '''See TelemetryHub.handle(); handler runs on the hub's thread.'''
+        self.hub.handle(action, handler)
+
+    def send_command(self, action, value):
+        '''Sends a command to every connected pod; safe to call from the GUI thread.'''
+        if self.loop_thread is not None:
+            self.loop_thread.call(self.hub.send_command, action, value)
+        else:
+            self.hub.send_command(action, value)
+
+    def stats(self):
+        return self.hub.stats()
+
+    def _on_value(self, value, protocol):
+        self.received.emit(value)
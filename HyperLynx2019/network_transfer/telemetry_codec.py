@@ -0,0 +1,140 @@
+'''
+   HyperLynx: telemetry_codec.py
+
+   Purpose:
+   Compact binary content type for numeric pod telemetry.
+
+   Details:
+   A StreamingClient sends the field list once per connection as a text/json
+   'telemetry_schema' request; after that every telemetry frame is sent with
+   content-type binary/telemetry-v1:
+
+       uint64      sequence number
+       float64     timestamp [s since epoch]
+       float64     one value per schema field, NaN if missing
+
+   all little endian.  The usual 2 byte header + JSON header framing is kept,
+   but since the content length is fixed by the schema the header bytes are
+   built once and reused.  Nested dicts (e.g. data_dump()['tca']) are
+   flattened to 'outer.inner' keys; non-numeric values are not sent.
+   Commands and other requests keep using text/json.
+'''
+
+import json
+import struct
+import sys
+import time
+import numpy
+
+CONTENT_TYPE = 'binary/telemetry-v1'
+SCHEMA_ACTION = 'telemetry_schema'
+VERSION = 1
+
+_PREFIX = struct.Struct('<Qd')
+
+
+def flatten(values, prefix=''):
+    '''
+    Returns {key: float} for every numeric value in values, with nested dicts
+    flattened to 'outer.inner' keys.
+    '''
+    flat = {}
+    for key, val in values.items():
+        name = prefix + str(key)
+        if isinstance(val, dict):
+            flat.update(flatten(val, name + '.'))
+        elif isinstance(val, (bool, int, float, numpy.number)):
+            flat[name] = val
+    return flat
+
+
+class TelemetryEncoder():
+    '''
+    Inputs:
+        fields (list):  schema field names, in frame order
+    '''
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.field_set = set(self.fields)
+        self.seq = 0
+        self._row = numpy.zeros(len(self.fields), dtype='<f8')
+
+        size = _PREFIX.size + self._row.nbytes
+        jsonheader = {
+            "byteorder": sys.byteorder,
+            "content-type": CONTENT_TYPE,
+            "content-encoding": "binary",
+            "content-length": size,
+            "stream": True,
+        }
+        jsonheader_bytes = json.dumps(jsonheader).encode("utf-8")
+        self._header = struct.pack(">H", len(jsonheader_bytes)) + jsonheader_bytes
+        self._frame = bytearray(len(self._header) + size)
+        self._frame[:len(self._header)] = self._header
+        self._offset = len(self._header)
+
+    @classmethod
+    def from_sample(cls, values):
+        return cls(flatten(values))
+
+    def matches(self, flat):
+        '''True if the flattened values have exactly this schema's fields.'''
+        return flat.keys() == self.field_set
+
+    def schema(self):
+        return {'version': VERSION, 'fields': self.fields, 'dtype': '<f8'}
+
+    def schema_request(self):
+        '''text/json request announcing the schema, send once per connection.'''
+        return dict(type="text/json",
+                    encoding="utf-8",
+                    content=dict(action=SCHEMA_ACTION, value=self.schema()))
+
+    def encode(self, flat, stamp=None):
+        '''
+        Returns one complete framed message for the flattened values.
+        '''
+        if stamp is None:
+            stamp = time.time()
+        nan = numpy.nan
+        self._row[:] = [flat.get(field, nan) for field in self.fields]
+        _PREFIX.pack_into(self._frame, self._offset, self.seq, stamp)
+        start = self._offset + _PREFIX.size
+        self._frame[start:] = self._row.tobytes()
+        self.seq += 1
+        return bytes(self._frame)
+
+
+class TelemetryDecoder():
+    '''
+    Inputs:
+        schema (dict):  as returned by TelemetryEncoder.schema()
+    '''
+    def __init__(self, schema):
+        if schema.get('version') != VERSION:
+            raise ValueError('Unsupported telemetry schema version {}.'.format(schema.get('version')))
+        self.fields = list(schema['fields'])
+        self.dtype = numpy.dtype(schema.get('dtype', '<f8'))
+        self.size = _PREFIX.size + self.dtype.itemsize * len(self.fields)
+        self.last_seq = None
+        self.lost = 0                   # frames missing from the sequence
+
+    def decode_array(self, content):
+        '''
+        Returns (seq, stamp, values) where values is a read-only array view of content.
+        '''
+        if len(content) != self.size:
+            raise ValueError('Telemetry frame is {} bytes, schema needs {}.'.format(len(content), self.size))
+        seq, stamp = _PREFIX.unpack_from(content, 0)
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.lost += seq - self.last_seq - 1
+        self.last_seq = seq
+        values = numpy.frombuffer(content, dtype=self.dtype, offset=_PREFIX.size)
+        return seq, stamp, values
+
+    def decode(self, content):
+        '''
+        Returns (seq, stamp, {field: value}).
+        '''
+        seq, stamp, values = self.decode_array(content)
+        return seq, stamp, dict(zip(self.fields, values.tolist()))
@@ -0,0 +1,103 @@
+'''
+   HyperLynx: rolling_filter.py
+
+   Purpose:
+   Moving average filter with outlier rejection for the SDA priority sensors.
+
+   Details:
+   All filtered keys share one preallocated (keys x length) NumPy ring buffer,
+   so an update is a handful of vectorized operations over every key at once
+   and never reallocates.  The window mean and spread are kept as running
+   values with the sliding-window form of Welford's update, which makes the
+   per-tick cost independent of the filter length.
+
+   Rejection matches the old filter_data() queue: once a key's window is full,
+   a new sample is only accepted if it is within 3 standard deviations of the
+   most recent accepted sample.  Until the window is full every sample is
+   accepted.
+'''
+
+import numpy
+
+
+class RollingFilter():
+    '''
+    Inputs:
+        keys (list):    sensor_data keys to filter, fixes the row order
+        length (int):   moving average window [samples]
+        sigma (float):  rejection threshold in standard deviations
+    '''
+    def __init__(self, keys, length=10, sigma=3):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.length = max(int(length), 1)
+        self.sigma = sigma
+
+        n = len(self.keys)
+        self._rows = numpy.arange(n)
+        self.buf = numpy.zeros((n, self.length))
+        self.pos = numpy.zeros(n, dtype=numpy.intp)     # next slot to write
+        self.count = numpy.zeros(n, dtype=numpy.intp)   # samples in window
+        self.mean = numpy.zeros(n)
+        self.m2 = numpy.zeros(n)                        # sum of squared deviations
+        self.std_dev = numpy.zeros(n)                   # sigma * std of window before last update
+        self.rejected = numpy.zeros(n, dtype=bool)      # last update was rejected
+
+    def update(self, values, fresh=None):
+        '''
+        Pushes one sample per key (array-like, in self.keys order) and returns
+        the filtered values, i.e. the mean of each window.  fresh (bool
+        array-like) selects the keys that have a new sample; the others are
+        left as they are, so a held value is not pushed twice.
+        '''
+        x = numpy.asarray(values, dtype=float)
+        push = numpy.ones(len(self.keys), dtype=bool) if fresh is None else numpy.asarray(fresh, dtype=bool)
+        full = self.count >= self.length
+
+        # Rejection test against the newest sample in the window
+        var = self.m2 / numpy.maximum(self.count, 1)
+        self.std_dev = self.sigma * numpy.sqrt(numpy.maximum(var, 0))
+        last = self.buf[self._rows, (self.pos - 1) % self.length]
+        self.rejected = push & full & (numpy.abs(x - last) > self.std_dev)
+
+        # Filling: standard Welford step
+        grow = push & ~full
+        if grow.any():
+            xg = x[grow]
+            n = self.count[grow] + 1
+            delta = xg - self.mean[grow]
+            self.mean[grow] += delta / n
+            self.m2[grow] += delta * (xg - self.mean[grow])
+            self.count[grow] = n
+
+        # Full window: replace the oldest sample with the new one
+        slide = push & full & ~self.rejected
+        if slide.any():
+            xs = x[slide]
+            old = self.buf[self._rows[slide], self.pos[slide]]
+            old_mean = self.mean[slide]
+            new_mean = old_mean + (xs - old) / self.length
+            self.m2[slide] += (xs - old) * (xs - new_mean + old - old_mean)
+            self.mean[slide] = new_mean
+
+        accept = grow | slide
+        self.buf[self._rows[accept], self.pos[accept]] = x[accept]
+        self.pos[accept] = (self.pos[accept] + 1) % self.length
+        return self.mean
+
+    def reset(self, keys=None):
+        '''
+        Empties the window of the given keys (all keys if None).
+        '''
+        if keys is None:
+            rows = self._rows
+        else:
+            rows = [self.index[key] for key in keys if key in self.index]
+        self.pos[rows] = 0
+        self.count[rows] = 0
+        self.mean[rows] = 0
+        self.m2[rows] = 0
+        self.rejected[rows] = False
+
+    def value(self, key):
+        return self.mean[self.index[key]]
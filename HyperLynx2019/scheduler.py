@@ -0,0 +1,159 @@
+'''
+   HyperLynx: scheduler.py
+
+   Purpose:
+   Fixed-rate cyclic executive for the SDA main loop.
+
+   Details:
+   The loop is divided into minor frames of 1/rate seconds.  Every task is
+   registered with a divider (run once every N frames) and an offset (which
+   frame inside the N-frame major cycle it runs in), so slow tasks can be
+   spread out instead of all landing on the same frame.  Each task may also
+   have a time budget; a task that runs longer than its budget is counted as
+   an overrun.  Tasks flagged as deferrable are only started if the frame has
+   enough time left for their budget, otherwise they are retried next frame.
+   The control path (IMU read -> fusion -> run_state -> throttle) should be
+   registered with divider 1 and deferrable False.
+
+   Task run times are measured with perf_counter_ns().  If a
+   stage_timing.StageTimer is given, every task run and the busy time of
+   every frame ('frame') are also recorded into its histograms.
+'''
+
+from time import perf_counter, perf_counter_ns, sleep
+
+
+class Task():
+    def __init__(self, name, func, divider=1, offset=0, budget=None, deferrable=False):
+        self.name = name
+        self.func = func
+        self.divider = max(int(divider), 1)
+        self.offset = offset % self.divider
+        self.budget = budget            # [s] allowed run time, None for no budget
+        self.deferrable = deferrable    # may be pushed to a later frame if out of time
+        self.pending = False
+        self.histogram = None           # stage_timing.TimingHistogram, set by CyclicExecutive
+
+        self.runs = 0
+        self.overruns = 0
+        self.deferred = 0
+        self.last_time = 0              # [s] run time of last call
+        self.max_time = 0               # [s] worst run time seen
+
+    def stats(self):
+        return {'runs': self.runs,
+                'overruns': self.overruns,
+                'deferred': self.deferred,
+                'last': round(self.last_time, 6),
+                'max': round(self.max_time, 6)}
+
+
+class CyclicExecutive():
+    '''
+    Runs registered tasks at a fixed frame rate.
+
+    Inputs:
+        rate (float):   minor frame rate [Hz], e.g. 200
+        timing (StageTimer):    records task and frame run time histograms, or None
+    '''
+    def __init__(self, rate=200, timing=None):
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.tasks = []
+        self.timing = timing
+
+        self.frame = 0
+        self._last_frame = -1           # index of the previous frame that ran
+        self.frame_overruns = 0         # frames that ran past their deadline
+        self.frames_skipped = 0         # whole frames lost to an overrun
+        self.last_frame_time = 0        # [s] busy time of last frame
+        self.max_frame_time = 0
+        self._deadline = None
+
+    def add_task(self, name, func, divider=1, offset=0, budget=None, deferrable=False):
+        '''
+        Register func to run every 'divider' frames.  Tasks run in the order
+        they are added, so add the control path first.
+        '''
+        task = Task(name, func, divider, offset, budget, deferrable)
+        if self.timing is not None:
+            task.histogram = self.timing.histogram(name)
+        self.tasks.append(task)
+        return task
+
+    def add_rate_task(self, name, func, rate, offset=0, budget=None, deferrable=False):
+        '''
+        Same as add_task(), with the task rate given in Hz instead of a divider.
+        '''
+        divider = max(int(round(self.rate / rate)), 1)
+        return self.add_task(name, func, divider, offset, budget, deferrable)
+
+    def run_frame(self):
+        '''
+        Runs every task due in the current frame, then sleeps until the start
+        of the next frame.
+        '''
+        start = perf_counter()
+        if self._deadline is None:
+            self._deadline = start
+        frame_end = self._deadline + self.period
+
+        last = self._last_frame
+        for task in self.tasks:
+            # Due if its slot is this frame or fell in frames skipped since the last one
+            if (self.frame - task.offset) // task.divider > (last - task.offset) // task.divider:
+                task.pending = True
+            if not task.pending:
+                continue
+
+            if task.deferrable and task.budget is not None and \
+                    perf_counter() + task.budget > frame_end:
+                task.deferred += 1
+                continue
+
+            t0 = perf_counter_ns()
+            task.func()
+            elapsed = perf_counter_ns() - t0
+            if task.histogram is not None:
+                task.histogram.record(elapsed)
+            task.last_time = elapsed * 1e-9
+            task.pending = False
+            task.runs += 1
+            if task.last_time > task.max_time:
+                task.max_time = task.last_time
+            if task.budget is not None and task.last_time > task.budget:
+                task.overruns += 1
+
+        now = perf_counter()
+        self.last_frame_time = now - start
+        if self.timing is not None:
+            self.timing.record('frame', int(self.last_frame_time * 1e9))
+        if self.last_frame_time > self.max_frame_time:
+            self.max_frame_time = self.last_frame_time
+
+        self._last_frame = self.frame
+        self.frame += 1
+        self._deadline = frame_end
+        if now > frame_end:
+            # Missed the deadline; resync to the next frame boundary rather
+            # than running a burst of back-to-back frames to catch up.  The
+            # skipped frames still count, so divided tasks keep wall-clock rate.
+            self.frame_overruns += 1
+            missed = int((now - frame_end) / self.period)
+            self.frames_skipped += missed
+            self.frame += missed
+            self._deadline = frame_end + missed * self.period
+        else:
+            sleep(frame_end - now)
+
+    def stats(self):
+        '''
+        Returns frame and per-task timing counters as a dict.
+        '''
+        return {'rate': self.rate,
+                'frame': self.frame,
+                'frame_overruns': self.frame_overruns,
+                'frames_skipped': self.frames_skipped,
+                'frame_time': round(self.last_frame_time, 6),
+                'frame_time_max': round(self.max_frame_time, 6),
+                'tasks': {task.name: task.stats() for task in self.tasks}}
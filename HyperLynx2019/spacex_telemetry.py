@@ -0,0 +1,127 @@
+'''
+   HyperLynx: spacex_telemetry.py
+
+   Purpose:
+   Sends the competition status packet (see mock-receiver.py) to the SpaceX
+   server over UDP at a fixed rate.
+
+   Details:
+   The emitter owns one UDP socket and one preallocated packet buffer for its
+   whole life; every send packs the latest values into the buffer with
+   struct.Struct.pack_into() and sends it.  It runs on its own daemon thread
+   with absolute deadlines, so the send rate does not depend on how long the
+   SDA main loop frames take.  The main loop only calls update(), which swaps
+   in a new tuple of values (a single atomic assignment, no lock needed).
+
+   The competition server expects 10 - 50 Hz; rates outside that window are
+   rejected.  If the thread falls more than one period behind, it skips ahead
+   instead of sending a burst to catch up.
+'''
+
+import socket
+import struct
+import threading
+from time import perf_counter, sleep
+import numpy
+
+PACKET = struct.Struct('>BB7iI')
+MIN_RATE = 10           # [Hz] limits checked by the competition server
+MAX_RATE = 50
+
+
+class SpaceXEmitter(threading.Thread):
+    '''
+    Inputs:
+        host (str):     SpaceX server IP address
+        port (int):     SpaceX server UDP port
+        team_id (int):  team id sent in every packet
+        rate (float):   send rate [Hz], MIN_RATE to MAX_RATE
+        history (int):  number of recent send intervals kept for rate and jitter stats
+    '''
+    def __init__(self, host, port, team_id, rate=40, history=400):
+        if not MIN_RATE <= rate <= MAX_RATE:
+            raise ValueError('SpaceX packet rate must be {} - {} Hz, got {}'.format(MIN_RATE, MAX_RATE, rate))
+        threading.Thread.__init__(self, name='spacex_emitter')
+        self.daemon = True
+        self.server = (host, port)
+        self.team_id = team_id
+        self.rate = rate
+        self.period = 1.0 / rate
+        self._stop_event = threading.Event()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._packet = bytearray(PACKET.size)
+        # status, accel [cm/s2], position [cm], velocity [cm/s], battery voltage [mV],
+        # battery current [mA], battery temp [0.1 C], pod temp [0.1 C], stripe count
+        self._values = (0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+        self.sent = 0
+        self.errors = 0
+        self.skipped = 0                # periods skipped after falling behind
+        self._last_send = None
+        self._intervals = numpy.zeros(history)  # [s] recent send intervals, ring buffer
+        self._interval_pos = 0
+
+    def update(self, status, accel, position, velocity, stripe_count,
+               battery_voltage=0, battery_current=0, battery_temp=0, pod_temp=0):
+        '''
+        Sets the values sent in the next packets, already in SpaceX units.
+        '''
+        self._values = (int(status), int(accel), int(position), int(velocity), int(battery_voltage),
+                        int(battery_current), int(battery_temp), int(pod_temp), int(stripe_count))
+
+    def send(self):
+        '''Packs the latest values into the packet buffer and sends it.'''
+        try:
+            PACKET.pack_into(self._packet, 0, self.team_id, *self._values)
+            self.sock.sendto(self._packet, self.server)
+        except (struct.error, OSError) as e:
+            self.errors += 1
+            if self.errors == 1:
+                print("SpaceX packet error: " + repr(e))
+            return False
+        now = perf_counter()
+        if self._last_send is not None:
+            self._intervals[self._interval_pos % len(self._intervals)] = now - self._last_send
+            self._interval_pos += 1
+        self._last_send = now
+        self.sent += 1
+        return True
+
+    def run(self):
+        deadline = perf_counter()
+        while not self._stop_event.is_set():
+            self.send()
+            deadline += self.period
+            now = perf_counter()
+            if now > deadline + self.period:
+                missed = int((now - deadline) / self.period)
+                self.skipped += missed
+                deadline += missed * self.period
+            if deadline > now:
+                sleep(deadline - now)
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.sock.close()
+
+    def stats(self):
+        n = min(self._interval_pos, len(self._intervals))
+        if n:
+            intervals = self._intervals[:n]
+            achieved = 1.0 / intervals.mean()
+            jitter = numpy.abs(intervals - self.period)
+            p50, p99 = numpy.percentile(jitter, [50, 99])
+            worst = jitter.max()
+        else:
+            achieved = p50 = p99 = worst = 0
+        return {'sent': self.sent,
+                'errors': self.errors,
+                'skipped': self.skipped,
+                'rate': round(float(achieved), 2),
+                'in_window': int(MIN_RATE <= achieved <= MAX_RATE),
+                'jitter_p50': round(float(p50), 6),
+                'jitter_p99': round(float(p99), 6),
+                'jitter_max': round(float(worst), 6)}
@@ -0,0 +1,168 @@
+'''
+   HyperLynx: stage_timing.py
+
+   Purpose:
+   Run time histograms for the SDA loop stages.
+
+   Details:
+   TimingHistogram is a fixed-bucket, HDR-style log-linear histogram of
+   nanosecond durations: values below 2 * SUB_BUCKETS ns get one bucket each,
+   above that every power of two is split into SUB_BUCKETS linear buckets,
+   so any recorded value is known to within 1 / SUB_BUCKETS (6 %).  Recording
+   is a bit_length(), a shift and an array increment, with no allocation; the
+   bucket array has a fixed size, so memory does not grow with run time.
+   Durations above the top bucket (2**MAX_BITS ns, about 18 min) are clamped.
+
+   StageTimer holds one histogram per stage.  CyclicExecutive records every
+   task (and the frame busy time) into it when one is passed in; without one
+   the scheduler does no extra work.  summary() gives per stage percentiles
+   in microseconds for telemetry; it refreshes at most one stage per call,
+   and only stages older than summary_interval, so its cost on the control
+   thread stays at one histogram no matter how many stages there are.
+   dump() writes the full histograms to a JSON file.  SDA takes
+   a snapshot() at every log rotation and dumps it on the log sink thread.
+'''
+
+import json
+from time import perf_counter
+import numpy
+
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_BITS = 40
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(ns):
+    '''Returns the histogram bucket for a duration in ns.'''
+    shift = ns.bit_length() - SUB_BITS - 1
+    if shift <= 0:
+        return ns
+    return (shift << SUB_BITS) + (ns >> shift)
+
+
+def bucket_value(index):
+    '''Returns the midpoint [ns] of a bucket.'''
+    if index < 2 * SUB_BUCKETS:
+        return float(index)
+    shift = (index >> SUB_BITS) - 1
+    top = index - (shift << SUB_BITS)
+    return float((top << shift) + (1 << shift) / 2)
+
+
+N_BUCKETS = bucket_index((1 << MAX_BITS) - 1) + 1
+_VALUES = numpy.array([bucket_value(i) for i in range(N_BUCKETS)])
+
+
+class TimingHistogram():
+    def __init__(self):
+        self.counts = numpy.zeros(N_BUCKETS, dtype=numpy.int64)
+        self.count = 0
+        self.total = 0                  # [ns]
+        self.max = 0                    # [ns]
+
+    def record(self, ns):
+        index = bucket_index(ns)
+        if index >= N_BUCKETS:
+            index = N_BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def reset(self):
+        self.__init__()
+
+    def copy(self):
+        histogram = TimingHistogram()
+        histogram.counts[:] = self.counts
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+
+    def percentiles(self, percentiles=PERCENTILES):
+        '''Returns the value [ns] at each percentile, 0 if nothing was recorded.'''
+        if not self.count:
+            return [0.0] * len(percentiles)
+        ranks = numpy.maximum(numpy.asarray(percentiles, dtype=float) * (self.count / 100.0), 1)
+        index = numpy.searchsorted(self.counts.cumsum(), ranks)
+        return numpy.minimum(_VALUES[index], self.max).tolist()
+
+    def summary(self):
+        '''Count, mean, percentiles and max, in microseconds.'''
+        result = {'count': self.count,
+                  'mean': round(self.total / self.count / 1000.0, 3) if self.count else 0}
+        for p, value in zip(PERCENTILES, self.percentiles()):
+            result['p' + str(p).replace('.', '_')] = round(value / 1000.0, 3)
+        result['max'] = round(self.max / 1000.0, 3)
+        return result
+
+    def buckets(self):
+        '''{bucket midpoint [ns]: count} for every non-empty bucket.'''
+        return {int(_VALUES[i]): int(self.counts[i]) for i in numpy.flatnonzero(self.counts)}
+
+
+class StageTimer():
+    '''
+    One TimingHistogram per stage name, created on first use.
+
+    Inputs:
+        summary_interval (float):   [s] how long summary() reuses a stage's last result
+    '''
+    def __init__(self, summary_interval=1.0):
+        self.histograms = {}
+        self.summary_interval = summary_interval
+        self._summary = {}
+        self._summary_time = {}             # {name: perf_counter() of its last summary}
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = TimingHistogram()
+        return histogram
+
+    def record(self, name, ns):
+        self.histogram(name).record(ns)
+
+    def summary(self):
+        '''
+        Returns {stage: summary}, refreshing the stalest stage if it is older
+        than summary_interval.  Stages appear after their first refresh.
+        '''
+        if self.histograms:
+            name = min(self.histograms, key=lambda name: self._summary_time.get(name, -1e9))
+            now = perf_counter()
+            if now - self._summary_time.get(name, -1e9) >= self.summary_interval:
+                self._summary[name] = self.histograms[name].summary()
+                self._summary_time[name] = now
+        return dict(self._summary)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self._summary = {}
+        self._summary_time = {}
+
+    def snapshot(self, reset=True):
+        '''
+        Returns a StageTimer holding a copy of every histogram, e.g. to dump()
+        from another thread, and resets this one if reset is True.
+        '''
+        snapshot = StageTimer(self.summary_interval)
+        snapshot.histograms = {name: histogram.copy() for name, histogram in self.histograms.items()}
+        if reset:
+            self.reset()
+        return snapshot
+
+    def dump(self, path, reset=True):
+        '''
+        Writes summary and non-empty buckets of every stage to a JSON file.
+        '''
+        data = {name: dict(histogram.summary(), buckets=histogram.buckets())
+                for name, histogram in self.histograms.items()}
+        with open(path, 'w') as file:
+            json.dump({'unit': 'us', 'bucket_unit': 'ns', 'stages': data}, file, indent=1)
+        if reset:
+            self.reset()